@@ -1,5 +1,33 @@
+import copy
+import csv
+import glob
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sem trava entre processos (um processo por cache)
+    fcntl = None
+
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.feather as feather
+
+from distributions import (
+    build_distributions, merge_distributions, distributions_to_dict, distributions_from_dict
+)
+from joins import join
+from rollups import build_rollups, merge_rollups
+from profiling import profiled, stage
 '''
 Usa TODAS as 5 bases:
 - Agrega FACT_Orders corretamente
@@ -14,23 +42,665 @@ Gera df_abt com:
 - sazonalidade (Order_Date)
 '''
 
+DATA_DIR = "ecommerce_data"
+CACHE_DIR = ".abt_cache"
+
+# incrementar sempre que a construção da ABT mudar (invalida o cache)
+CACHE_VERSION = 6
+
+SOURCES = {
+    "fact": "FACT_Orders.csv",
+    "cust": "DIM_Customer.csv",
+    "prod": "DIM_Products.csv",
+    "shop": "DIM_Shopping.csv",
+    "deli": "DIM_Delivery.csv",
+}
+
+# ----------------------------------------------------------
+# SCHEMA DOS CSVs
+# ----------------------------------------------------------
+# Colunas de baixa cardinalidade viram category, ids e quantidades são
+# inteiros reduzidos e as datas são convertidas na leitura com formato fixo.
+# Valores monetários continuam float64 (somas de receita precisam da precisão).
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMAS = {
+    "fact": {
+        "Id": "int32",
+        "Order_Date": "datetime",
+        "Discount": "float64",
+        "Subtotal": "float64",
+        "Total": "float64",
+        "payment": "category",
+        "Purchase_Status": "category",
+    },
+    "cust": {
+        "Id": "int32",
+        "Customer_Id": "string",
+        "Customer_Name": "string",
+        "City": "category",
+        "State": "category",
+        "Region": "category",
+    },
+    "prod": {
+        "Id": "int32",
+        "Product_Id": "string",
+        "Product_Name": "string",
+        "Category": "category",
+        "Subcategory": "category",
+        "Price": "float64",
+    },
+    "shop": {
+        "Id": "int32",
+        "Item_ID": "string",
+        "Product": "category",
+        "Quantity": "int16",
+        "Price": "float64",
+    },
+    "deli": {
+        "Id": "int32",
+        "Delivery_Id": "string",
+        "Services": "category",
+        "P_Sevice": "float64",
+        "D_Forecast": "datetime",
+        "D_Date": "datetime",
+        "Status": "category",
+    },
+}
+
+_ARROW_TYPES = {
+    "int16": pa.int16(),
+    "int32": pa.int32(),
+    "float64": pa.float64(),
+    "string": pa.string(),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "datetime": pa.timestamp("ns"),
+}
+
+_PANDAS_TYPES = {
+    "int16": "int16",
+    "int32": "int32",
+    "float64": "float64",
+    "string": "object",
+    "category": "category",
+    "datetime": "datetime64[ns]",
+}
+
+# exportações append-only, chaveadas por Id (= order_id)
+APPEND_ONLY = ("fact", "deli", "cust", "shop")
+
+# quantos bytes antes do offset são conferidos para garantir que o arquivo
+# só recebeu linhas novas no final (e não foi reescrito)
+TAIL_CHECK_BYTES = 1 << 16
+
+# acima disso as partições são compactadas numa só
+MAX_PARTS = 32
+
+
+# ==========================================================
+#               CACHE COLUNAR DA ABT
+# ==========================================================
+# A ABT é gravada em Feather sem compressão, para poder ser lida via
+# memory-map. A chave do cache é a "impressão digital" dos cinco CSVs:
+# tamanho, mtime e hash do conteúdo. O hash só é recalculado quando
+# tamanho ou mtime mudam.
+#
+# Os pedidos ficam em partições (orders-NNNNN.feather) ANTES do filtro de
+# datas impossíveis, para que atualizações tardias de entrega possam trazer
+# um pedido de volta. O filtro é aplicado na leitura.
+
+def _hash_file(path, block_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(block_size), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _hash_range(path, inicio, fim):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        f.seek(inicio)
+        h.update(f.read(fim - inicio))
+    return h.hexdigest()
+
+
+def _fingerprint(path, anterior=None):
+    stat = os.stat(path)
+    if (
+        anterior is not None
+        and anterior.get("size") == stat.st_size
+        and anterior.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        sha = anterior["sha"]
+    else:
+        sha = _hash_file(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha": sha}
+
+
+def _read_manifest(cache_dir):
+    path = os.path.join(cache_dir, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _atomic_write(path, gravar):
+    # gravar(tmp) num temporário único do mesmo diretório e troca: dois
+    # processos nunca escrevem no mesmo temporário, leitores nunca veem um
+    # arquivo pela metade
+    fd, tmp = tempfile.mkstemp(
+        prefix=f".{os.path.basename(path)}-", suffix=".tmp", dir=os.path.dirname(path) or "."
+    )
+    os.close(fd)
+    try:
+        gravar(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _write_json(obj, path, **kwargs):
+    def gravar(tmp):
+        with open(tmp, "w") as f:
+            json.dump(obj, f, **kwargs)
+    _atomic_write(path, gravar)
+
+
+def _write_manifest(cache_dir, manifest):
+    _write_json(manifest, os.path.join(cache_dir, "manifest.json"), indent=2)
+
+
+@contextmanager
+def _cache_lock(cache_dir):
+    # trava exclusiva entre processos (<cache>/.lock): construção, refresh e
+    # gravação do cache acontecem um processo por vez; quem chega depois
+    # espera e lê o cache pronto
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, ".lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+@profiled("cache: fingerprint dos CSVs")
+def _source_fingerprints(data_dir, manifest=None):
+    anteriores = (manifest or {}).get("inputs", {})
+    return {
+        nome: _fingerprint(os.path.join(data_dir, arquivo), anteriores.get(nome))
+        for nome, arquivo in SOURCES.items()
+    }
+
+
+def _same_content(manifest, inputs):
+    if manifest is None or manifest.get("version") != CACHE_VERSION:
+        return False
+    antigos = manifest.get("inputs", {})
+    return all(
+        nome in antigos and antigos[nome]["sha"] == fp["sha"]
+        for nome, fp in inputs.items()
+    )
+
+
+def data_version(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    # identificador curto do conteúdo atual dos CSVs (útil como chave de cache)
+    inputs = _source_fingerprints(data_dir, _read_manifest(cache_dir))
+    h = hashlib.blake2b(digest_size=8)
+    h.update(str(CACHE_VERSION).encode())
+    for nome in sorted(inputs):
+        h.update(inputs[nome]["sha"].encode())
+    return h.hexdigest()
+
+
+def _write_frame(frame, path):
+    _atomic_write(path, lambda tmp: feather.write_feather(frame, tmp, compression="uncompressed"))
+
+
+def _read_frame(path, columns=None):
+    frame = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    # texto nulo volta do Arrow como None; a construção da ABT usa NaN
+    for col in frame.columns[frame.dtypes == object]:
+        valores = frame[col].to_numpy()
+        nulos = pd.isna(valores)
+        if nulos.any():
+            valores = valores.copy()
+            valores[nulos] = np.nan
+            frame[col] = valores
+    return frame
+
+
+def _align_categories(frames):
+    # pd.concat transforma category em object quando as categorias diferem
+    frames = list(frames)
+    for col in frames[0].columns:
+        if not all(
+            col in f.columns and isinstance(f[col].dtype, pd.CategoricalDtype) for f in frames
+        ):
+            continue
+        categorias = pd.api.types.union_categoricals(
+            [pd.Categorical([], categories=f[col].cat.categories) for f in frames]
+        ).categories
+        for i, f in enumerate(frames):
+            if not f[col].cat.categories.equals(categorias):
+                frames[i] = f.assign(**{col: f[col].cat.set_categories(categorias)})
+    return frames
+
+
+def _concat(frames, **kwargs):
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(_align_categories(frames), **kwargs)
+
+
+@profiled("cache: leitura")
+def _read_cache(cache_dir, manifest):
+    parts = manifest["parts"]
+    orders = _concat([_read_frame(os.path.join(cache_dir, p["orders"])) for p in parts])
+    items = _concat([_read_frame(os.path.join(cache_dir, p["items"])) for p in parts])
+    return _drop_impossible_dates(orders), items
+
+
+def _part_entry(seq, orders, items):
+    ids = orders["order_id"]
+    return {
+        "orders": f"orders-{seq:05d}.feather",
+        "items": f"items-{seq:05d}.feather",
+        "distributions": f"dist-{seq:05d}.json",
+        "rollups": f"rollup-{seq:05d}.feather",
+        "min_id": int(ids.min()) if len(ids) else None,
+        "max_id": int(ids.max()) if len(ids) else None,
+        "rows": len(orders),
+        "item_rows": len(items),
+        "orphans": bool(items["order_id"].isna().any()),
+    }
+
+
+def _write_summaries(cache_dir, entry, orders):
+    # resumos da partição sobre os pedidos que load_data devolve: sketches
+    # dos gráficos de distribuição (distributions.py) e rollups por período
+    # (rollups.py)
+    orders = _drop_impossible_dates(orders)
+    _write_json(
+        distributions_to_dict(build_distributions(orders)), os.path.join(cache_dir, entry["distributions"])
+    )
+    _write_frame(build_rollups(orders), os.path.join(cache_dir, entry["rollups"]))
+
+
+def _write_part(cache_dir, entry, orders, items):
+    _write_frame(orders, os.path.join(cache_dir, entry["orders"]))
+    _write_frame(items, os.path.join(cache_dir, entry["items"]))
+    _write_summaries(cache_dir, entry, orders)
+
+
+@profiled("cache: distribuições")
+def load_distributions(cache_dir=CACHE_DIR):
+    # sketches de todas as partições do cache combinados; None sem cache
+    # (quem chama recorre a distributions.build_distributions(df))
+    manifest = _read_manifest(cache_dir)
+    if manifest is None or manifest.get("version") != CACHE_VERSION:
+        return None
+    dist = {}
+    try:
+        for p in manifest["parts"]:
+            with open(os.path.join(cache_dir, p["distributions"])) as f:
+                dist = merge_distributions(dist, distributions_from_dict(json.load(f)))
+    except (OSError, ValueError, KeyError):
+        return None
+    return dist
+
+
+@profiled("cache: rollups")
+def load_rollups(cache_dir=CACHE_DIR):
+    # rollups de todas as partições somados; None sem cache (quem chama
+    # recorre a rollups.build_rollups(df))
+    manifest = _read_manifest(cache_dir)
+    if manifest is None or manifest.get("version") != CACHE_VERSION:
+        return None
+    try:
+        frames = [_read_frame(os.path.join(cache_dir, p["rollups"])) for p in manifest["parts"]]
+    except (OSError, ValueError, KeyError):
+        return None
+    if len(frames) == 1:
+        return frames[0]
+    return merge_rollups(frames)
+
+
+def _remove_unused(cache_dir, manifest):
+    usados = {"manifest.json"}
+    for p in manifest["parts"]:
+        usados.update((p["orders"], p["items"], p["distributions"], p["rollups"]))
+    usados.update(f"pending-{nome}.feather" for nome in manifest["state"]["pending"])
+    arquivos = glob.glob(os.path.join(cache_dir, "*.feather"))
+    arquivos += glob.glob(os.path.join(cache_dir, "dist-*.json"))
+    for path in arquivos:
+        if os.path.basename(path) not in usados:
+            os.remove(path)
+
+
+@profiled("cache: gravação")
+def _write_cache(cache_dir, orders, items, inputs, state, seq=0):
+    # seq: número da partição (o next_part do manifesto anterior), para que
+    # uma reconstrução nunca sobrescreva arquivos que outro processo lê
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = _part_entry(seq, orders, items)
+    _write_part(cache_dir, entry, orders.reset_index(drop=True), items.reset_index(drop=True))
+    for nome, frame in state.pop("pending_frames").items():
+        _write_frame(frame.reset_index(drop=True), os.path.join(cache_dir, f"pending-{nome}.feather"))
+    manifest = {
+        "version": CACHE_VERSION,
+        "inputs": inputs,
+        "parts": [entry],
+        "next_part": seq + 1,
+        "state": state,
+    }
+    _write_manifest(cache_dir, manifest)
+    _remove_unused(cache_dir, manifest)
+    return manifest
+
+
 # ==========================================================
 #               FUNÇÃO PRINCIPAL: LOAD_DATA()
 # ==========================================================
 
-def load_data():
-    # --------------------------------------------
-    # 1. CARREGAMENTO DOS DADOS
-    # --------------------------------------------
-    fact = pd.read_csv("ecommerce_data/FACT_Orders.csv")
-    cust = pd.read_csv("ecommerce_data/DIM_Customer.csv")
-    prod = pd.read_csv("ecommerce_data/DIM_Products.csv")
-    shop = pd.read_csv("ecommerce_data/DIM_Shopping.csv")
-    deli = pd.read_csv("ecommerce_data/DIM_Delivery.csv")
+@profiled("load_data")
+def load_data(data_dir=DATA_DIR, cache_dir=CACHE_DIR, use_cache=True, incremental=False,
+              workers=None, validate=True):
+    # workers > 1: CSVs lidos em paralelo num pool de processos (cache frio)
+    # validate: toda construção completa passa por validation.py (relatório e
+    # quarentena em <cache>/validation, regras violadas no logger "validation")
+    # cache: leitura sem trava quando está válido; construção e refresh sob
+    # _cache_lock, e a gravação nunca reusa arquivos do manifesto em uso
+    if not use_cache:
+        return build_abt(data_dir, workers)
 
-    # --------------------------------------------
-    # 2. PREPARAR FACT (PEDIDOS)
-    # --------------------------------------------
+    manifest = _read_manifest(cache_dir)
+    inputs = None
+    if not incremental:
+        inputs = _source_fingerprints(data_dir, manifest)
+        if manifest is not None and manifest.get("inputs") == inputs:
+            resultado = _cached_abt(cache_dir, manifest, inputs)
+            if resultado is not None:
+                return resultado
+
+    with _cache_lock(cache_dir):
+        # outro processo pode ter atualizado o cache enquanto esperávamos
+        atual = _read_manifest(cache_dir)
+        if incremental and atual is not None and atual.get("version") == CACHE_VERSION:
+            resultado = refresh_abt(data_dir, cache_dir, atual)
+            if resultado is not None:
+                return resultado
+
+        if inputs is None or atual != manifest:
+            inputs = _source_fingerprints(data_dir, atual)
+        resultado = _cached_abt(cache_dir, atual, inputs)
+        if resultado is not None:
+            # só o mtime mudou (ex.: arquivo copiado): atualiza o manifesto
+            if atual["inputs"] != inputs:
+                atual["inputs"] = inputs
+                _write_manifest(cache_dir, atual)
+            return resultado
+
+        falhas = {}
+        tables = read_sources(data_dir, workers, falhas)
+        if validate:
+            # import local: validation.py importa este módulo
+            from validation import validate as validar
+            validar(tables, os.path.join(cache_dir, "validation"), falhas=falhas)
+        orders, items = _build_frames(tables)
+        _write_cache(cache_dir, orders, items, inputs, _initial_state(data_dir, tables, inputs),
+                     seq=(atual or {}).get("next_part", 0))
+    return _drop_impossible_dates(orders), items
+
+
+def _cached_abt(cache_dir, manifest, inputs):
+    # (df, items) do cache se ele corresponde ao conteúdo atual dos CSVs
+    if not _same_content(manifest, inputs):
+        return None
+    try:
+        return _read_cache(cache_dir, manifest)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# ==========================================================
+#               CONSTRUÇÃO DA ABT A PARTIR DOS CSVs
+# ==========================================================
+
+def build_abt(data_dir=DATA_DIR, workers=None):
+    orders, items = _build_frames(read_sources(data_dir, workers))
+    return _drop_impossible_dates(orders), items
+
+
+def _build_frames(tables):
+    fact_agg = prepare_fact(tables["fact"])
+    deli = _prepare_delivery(tables["deli"])
+    cust = _prepare_customer(tables["cust"])
+
+    orders = _merge_orders(fact_agg, deli, cust)
+    orders = _feature_engineering(orders)
+
+    items = _prepare_items(tables["shop"], tables["prod"], fact_agg)
+    return orders, items
+
+
+# --------------------------------------------
+# 1. CARREGAMENTO DOS DADOS
+# --------------------------------------------
+@profiled("1. leitura dos CSVs")
+def read_sources(data_dir, workers=None, falhas=None):
+    # falhas: dict opcional, preenchido com tabela -> {coluna: máscara} (read_table)
+    if workers is not None and workers > 1:
+        return _read_sources_parallel(data_dir, workers, falhas=falhas)
+    tables = {}
+    for nome, arquivo in SOURCES.items():
+        with stage(f"1. leitura {arquivo}") as etapa:
+            tables[nome] = read_table(
+                os.path.join(data_dir, arquivo), nome,
+                falhas=None if falhas is None else falhas.setdefault(nome, {}),
+            )
+            etapa["rows_out"] = len(tables[nome])
+    return tables
+
+
+# tipos lidos como texto quando o parser tipado falha (read_table)
+_TEXT_FALLBACK = ("datetime", "int16", "int32", "float64")
+
+
+def _csv_options(nome, column_names=None, como_texto=False, use_threads=True):
+    schema = SCHEMAS[nome]
+    tipos = {
+        col: pa.string() if como_texto and tipo in _TEXT_FALLBACK else _ARROW_TYPES[tipo]
+        for col, tipo in schema.items()
+    }
+    return {
+        "read_options": pacsv.ReadOptions(column_names=column_names, use_threads=use_threads),
+        "convert_options": pacsv.ConvertOptions(
+            column_types=tipos,
+            timestamp_parsers=[DATE_FORMAT],
+            strings_can_be_null=True,
+        ),
+    }
+
+
+def _coerce_numeric(texto, tipo):
+    # texto -> número do schema; o que não converte vira NaN (coluna inteira
+    # com nulos fica float64, como o Arrow faz com células vazias)
+    valores = pd.to_numeric(texto, errors="coerce").astype("float64")
+    if tipo == "float64":
+        return valores
+    # inteiro fora da faixa do tipo (ex.: 40000 em int16) ou com fração
+    # também não é interpretável: vira NaN em vez de estourar no astype
+    limites = np.iinfo(tipo)
+    valores = valores.mask((valores < limites.min) | (valores > limites.max) | (valores % 1 != 0))
+    if valores.isna().any():
+        return valores
+    return valores.astype(tipo)
+
+
+def read_table(source, nome, column_names=None, falhas=None):
+    # leitura pelo parser CSV do Arrow (multithread) já com os tipos do schema
+    # falhas: dict opcional que recebe coluna -> máscara das linhas cujo valor
+    # numérico não pôde ser interpretado (vira NaN; usado por validation.py)
+    def _ler(como_texto):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return pacsv.read_csv(
+            source, **_csv_options(nome, column_names, como_texto)
+        ).to_pandas()
+
+    try:
+        return _ler(False)
+    except pa.ArrowInvalid:
+        # data fora do formato ou valor não numérico (ex.: "x" em Quantity):
+        # lê datas e números como texto e converte coluna a coluna; o que não
+        # converte vira NaT/NaN em vez de derrubar a carga inteira
+        frame = _ler(True)
+        for col, tipo in SCHEMAS[nome].items():
+            if col not in frame.columns or tipo not in _TEXT_FALLBACK:
+                continue
+            if tipo == "datetime":
+                frame[col] = pd.to_datetime(frame[col], errors="coerce")
+                continue
+            texto = frame[col]
+            frame[col] = _coerce_numeric(texto, tipo)
+            ruins = (texto.notna() & frame[col].isna()).to_numpy()
+            if falhas is not None and ruins.any():
+                falhas[col] = ruins
+        return frame
+
+
+# ----------------------------------------------------------
+# LEITURA PARALELA (opcional: load_data(workers=N))
+# ----------------------------------------------------------
+# As cinco tabelas são independentes e os arquivos grandes são divididos em
+# faixas de bytes terminadas em fim de linha (os CSVs não têm quebra de
+# linha dentro de campos). Cada faixa é lida por um processo do pool, com o
+# mesmo schema, e volta como arquivo Arrow IPC em memória compartilhada
+# (/dev/shm), aberto por memory-map: nada de DataFrame serializado por pickle.
+# Uma faixa com data ou número fora do formato faz o arquivo inteiro ser
+# relido pelo caminho normal (read_table), que trata esse caso.
+
+# bytes por tarefa (arquivos menores que isso = uma tarefa)
+PARALLEL_CHUNK_BYTES = 32 << 20
+
+SHM_DIR = "/dev/shm"
+
+
+def _byte_ranges(path, chunk_bytes=PARALLEL_CHUNK_BYTES):
+    # faixas [inicio, fim) depois do cabeçalho, cada uma terminando em "\n"
+    size = os.path.getsize(path)
+    faixas = []
+    with open(path, "rb") as f:
+        f.readline()
+        inicio = f.tell()
+        while inicio < size:
+            fim = inicio + chunk_bytes
+            if fim < size:
+                f.seek(fim)
+                f.readline()
+                fim = f.tell()
+            fim = min(fim, size)
+            faixas.append((inicio, fim))
+            inicio = fim
+    return faixas
+
+
+def _parse_range(path, nome, header, inicio, fim, out_path):
+    # roda num processo do pool; um processo por faixa, sem threads do Arrow
+    with open(path, "rb") as f:
+        f.seek(inicio)
+        dados = f.read(fim - inicio)
+    try:
+        tabela = pacsv.read_csv(
+            pa.BufferReader(dados), **_csv_options(nome, header, use_threads=False)
+        )
+    except pa.ArrowInvalid:
+        return None
+    # o formato de arquivo IPC só aceita um dicionário por coluna category
+    tabela = tabela.unify_dictionaries()
+    with pa.OSFile(out_path, "wb") as sink, pa.ipc.new_file(sink, tabela.schema) as writer:
+        writer.write_table(tabela)
+    return out_path
+
+
+def _read_sources_parallel(data_dir, workers, chunk_bytes=PARALLEL_CHUNK_BYTES, falhas=None):
+    tarefas = []
+    for nome, arquivo in SOURCES.items():
+        path = os.path.join(data_dir, arquivo)
+        header = _read_header(path)
+        tarefas += [(nome, path, header, inicio, fim) for inicio, fim in _byte_ranges(path, chunk_bytes)]
+
+    tmp_dir = tempfile.mkdtemp(prefix="abt-ingest-", dir=SHM_DIR if os.path.isdir(SHM_DIR) else None)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, max(len(tarefas), 1))) as pool:
+            futuros = [
+                pool.submit(
+                    _parse_range, path, nome, header, inicio, fim,
+                    os.path.join(tmp_dir, f"{i:05d}.arrow"),
+                )
+                for i, (nome, path, header, inicio, fim) in enumerate(tarefas)
+            ]
+            resultados = [futuro.result() for futuro in futuros]
+
+        tables = {}
+        for nome, arquivo in SOURCES.items():
+            with stage(f"1. leitura {arquivo}") as etapa:
+                caminhos = [r for t, r in zip(tarefas, resultados) if t[0] == nome]
+                if not caminhos or None in caminhos:
+                    # só cabeçalho ou data/número fora do formato
+                    tables[nome] = read_table(
+                        os.path.join(data_dir, arquivo), nome,
+                        falhas=None if falhas is None else falhas.setdefault(nome, {}),
+                    )
+                else:
+                    partes = [pa.ipc.open_file(pa.memory_map(c)).read_all() for c in caminhos]
+                    tables[nome] = pa.concat_tables(partes).to_pandas()
+                etapa["rows_out"] = len(tables[nome])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return tables
+
+
+def read_csv_chunks(path, nome, chunksize, **kwargs):
+    # leitor em blocos (engine C) com o mesmo schema de read_table
+    schema = SCHEMAS[nome]
+    datas = [col for col, tipo in schema.items() if tipo == "datetime"]
+    dtypes = {col: _PANDAS_TYPES[tipo] for col, tipo in schema.items() if tipo != "datetime"}
+    return pd.read_csv(
+        path,
+        chunksize=chunksize,
+        dtype=dtypes,
+        parse_dates=datas,
+        date_format=DATE_FORMAT,
+        **kwargs
+    )
+
+
+def empty_table(nome, columns=None):
+    schema = SCHEMAS[nome]
+    columns = columns or list(schema)
+    return pd.DataFrame({
+        col: pd.Series(dtype=_PANDAS_TYPES.get(schema.get(col), "object"))
+        for col in columns
+    })
+
+
+# --------------------------------------------
+# 2. PREPARAR FACT (PEDIDOS)
+# --------------------------------------------
+FACT_FIRST = ["Order_Date", "Payment_Method", "Purchase_Status"]
+FACT_SUM = ["Subtotal", "Discount", "Total"]
+
+
+@profiled("2. preparar FACT")
+def prepare_fact(fact):
     fact = fact.rename(columns={
         "Id": "order_id",
         "payment": "Payment_Method",
@@ -38,20 +708,49 @@ def load_data():
     })
 
     fact["Order_Date"] = pd.to_datetime(fact["Order_Date"], errors="coerce")
+    fact = fact[["order_id", *FACT_FIRST, *FACT_SUM]]
 
-    # Agregar pedidos (já vêm agregados, mas garantimos)
-    fact_agg = fact.groupby("order_id").agg(
-        Order_Date=("Order_Date", "first"),
-        Payment_Method=("Payment_Method", "first"),
-        Purchase_Status=("Purchase_Status", "first"),
-        Subtotal=("Subtotal", "sum"),
-        Discount=("Discount", "sum"),
-        Total=("Total", "sum")
-    ).reset_index()
+    # Os pedidos já vêm agregados (um por Id): ids estritamente crescentes
+    # garantem isso numa passada, sem o groupby. Fora desse caso, só os ids
+    # repetidos são agregados.
+    ids = fact["order_id"].to_numpy()
+    if len(ids) < 2 or (ids[1:] > ids[:-1]).all():
+        unicos, repetidos, ordenado = fact, fact.iloc[:0], True
+    else:
+        dup = fact["order_id"].duplicated(keep=False).to_numpy()
+        unicos, repetidos, ordenado = fact[~dup], fact[dup], False
+        unicos = unicos[unicos["order_id"].notna()]
 
-    # --------------------------------------------
-    # 3. PREPARAR DIM DELIVERY
-    # --------------------------------------------
+    # soma de um valor só: igual a ele, exceto NaN (o groupby soma NaN como 0)
+    if unicos[FACT_SUM].isna().any().any():
+        unicos = unicos.assign(**{col: unicos[col].fillna(0) for col in FACT_SUM})
+
+    partes = [unicos]
+    if len(repetidos):
+        partes.append(repetidos.groupby("order_id").agg(
+            Order_Date=("Order_Date", "first"),
+            Payment_Method=("Payment_Method", "first"),
+            Purchase_Status=("Purchase_Status", "first"),
+            Subtotal=("Subtotal", "sum"),
+            Discount=("Discount", "sum"),
+            Total=("Total", "sum")
+        ).reset_index())
+
+    fact_agg = _concat(partes)
+    if not ordenado:
+        fact_agg = fact_agg.sort_values("order_id", kind="stable").reset_index(drop=True)
+
+    return fact_agg
+
+
+# --------------------------------------------
+# 3. PREPARAR DIM DELIVERY
+# --------------------------------------------
+DELIVERY_COLUMNS = ["Delivery_Id", "Service", "P_Service", "D_Forecast", "D_Date", "Delivery_Status"]
+
+
+@profiled("3. preparar DIM_Delivery")
+def _prepare_delivery(deli):
     deli = deli.rename(columns={
         "Id": "order_id",
         "Services": "Service",
@@ -64,81 +763,678 @@ def load_data():
     deli["D_Forecast"] = pd.to_datetime(deli["D_Forecast"], errors="coerce")
     deli["D_Date"] = pd.to_datetime(deli["D_Date"], errors="coerce")
 
-    # --------------------------------------------
-    # 4. PREPARAR DIM CUSTOMER
-    # --------------------------------------------
+    # atualizações tardias chegam como nova linha do mesmo Id: vale a última
+    if deli["order_id"].duplicated().any():
+        deli = deli.drop_duplicates("order_id", keep="last")
+
+    return deli
+
+
+# --------------------------------------------
+# 4. PREPARAR DIM CUSTOMER
+# --------------------------------------------
+CUSTOMER_COLUMNS = ["UF", "Region"]
+
+
+@profiled("4. preparar DIM_Customer")
+def _prepare_customer(cust):
     cust = cust.rename(columns={
         "Id": "order_id",
         "State": "UF",
         "Region": "Region"
     })
 
-    # --------------------------------------------
-    # 5. MERGE PRINCIPAL (MODELO ESTRELA)
-    # --------------------------------------------
-    df = (
-        fact_agg
-        .merge(deli, on="order_id", how="left")
-        .merge(cust[["order_id", "UF", "Region"]], on="order_id", how="left")
-    )
+    if cust["order_id"].duplicated().any():
+        cust = cust.drop_duplicates("order_id", keep="last")
 
-    # --------------------------------------------
-    # 6. FEATURE ENGINEERING
-    # --------------------------------------------
+    return cust
+
+
+# --------------------------------------------
+# 5. MERGE PRINCIPAL (MODELO ESTRELA)
+# --------------------------------------------
+# order_id é inteiro e denso nas três tabelas: join por posição (joins.py)
+@profiled("5. merge principal")
+def _merge_orders(fact_agg, deli, cust):
+    orders = join(fact_agg, deli, "order_id")
+    return join(orders, cust[["order_id", "UF", "Region"]], "order_id")
+
+
+# --------------------------------------------
+# 6. FEATURE ENGINEERING
+# --------------------------------------------
+@profiled("6. feature engineering")
+def _feature_engineering(df):
     # prazo do pedido até entrega
     df["delivery_lead_time"] = (df["D_Date"] - df["Order_Date"]).dt.days
 
     # atraso vs previsão
     df["delivery_delay_days"] = (df["D_Date"] - df["D_Forecast"]).dt.days
 
-    df["is_late"] = (df["delivery_delay_days"] > 0).astype(int)
+    df["is_late"] = (df["delivery_delay_days"] > 0).astype("int8")
 
-    df["is_confirmed"] = (df["Purchase_Status"].str.lower() == "confirmado").astype(int)
-    df["is_canceled"] = (df["Purchase_Status"].str.lower() == "cancelado").astype(int)
+    df["is_confirmed"] = _lower_equals(df["Purchase_Status"], "confirmado").astype("int8")
+    df["is_canceled"] = _lower_equals(df["Purchase_Status"], "cancelado").astype("int8")
 
     df["freight_share"] = np.where(df["Total"] > 0, df["P_Service"] / df["Total"], 0)
 
-    # --------------------------------------------
-    # 7. REMOVER DATAS IMPOSSÍVEIS
-    # --------------------------------------------
+    return df
+
+
+def _lower_equals(serie, valor):
+    # em colunas category compara só as categorias e expande pelos códigos
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        alvo = np.append(serie.cat.categories.str.lower() == valor, False)
+        return alvo[serie.cat.codes.to_numpy()]
+    return (serie.str.lower() == valor).to_numpy()
+
+
+# --------------------------------------------
+# 7. REMOVER DATAS IMPOSSÍVEIS
+# --------------------------------------------
+@profiled("7. remover datas impossíveis")
+def _drop_impossible_dates(df):
     idx_ruins = df[df["D_Date"] < df["Order_Date"]].index
-    df = df.drop(idx_ruins)
+    return df.drop(idx_ruins)
 
-    # --------------------------------------------
-    # 8. PREPARAÇÃO DOS ITENS DO PEDIDO
-    # --------------------------------------------
 
+# --------------------------------------------
+# 8. PREPARAÇÃO DOS ITENS DO PEDIDO
+# --------------------------------------------
+def product_key(ids):
+    # trecho depois da vírgula do id (ids sem vírgula, como "I00001", dão NaN:
+    # validation.py reporta); o split só roda nos ids que têm vírgula
+    chave = pd.Series(np.nan, index=ids.index, dtype=object)
+    tem_virgula = ids.str.contains(",", regex=False).to_numpy(dtype=bool, na_value=False)
+    if tem_virgula.any():
+        chave[tem_virgula] = ids[tem_virgula].str.split(",").str[1]
+    return chave
+
+
+@profiled("8. itens do pedido")
+def _prepare_items(shop, prod, fact_agg):
     # SHOPPING
     items = shop.copy()
 
     # extrair Product_Key
-    items["Product_Key"] = items["Item_ID"].str.split(",").str[1]
+    items["Product_Key"] = product_key(items["Item_ID"])
 
     # PRODUCTS
-    prod["Product_Key"] = prod["Product_Id"].str.split(",").str[1]
+    prod = prod.copy()
+    prod["Product_Key"] = product_key(prod["Product_Id"])
 
-    items = items.merge(
+    # Product_Key repetido (ou vazio) em DIM_Products cai no merge normal
+    items = join(
+        items,
         prod[["Product_Key", "Product_Name", "Category", "Subcategory"]],
-        on="Product_Key",
-        how="left"
+        "Product_Key"
     )
 
-    # merge das datas dos pedidos
-    items = items.merge(
+    # datas dos pedidos (join por posição no order_id)
+    items = join(
+        items,
         fact_agg[["order_id", "Order_Date"]],
-        left_on="Id",
-        right_on="order_id",
-        how="left"
+        "Id",
+        "order_id"
     )
 
     items["Order_Date"] = pd.to_datetime(items["Order_Date"], errors="coerce")
 
+    # receita do item já na ABT (a ABT compartilhada é só leitura)
+    items["Total_Item"] = items["Quantity"] * items["Price"]
+
     # segurança extra
     if "Id" not in items.columns:
         raise Exception("Erro: coluna 'Id' desapareceu em items!")
 
-    return df, items
+    return items
+
+
+# ==========================================================
+#               ATUALIZAÇÃO INCREMENTAL
+# ==========================================================
+# FACT_Orders, DIM_Delivery, DIM_Customer e DIM_Shopping são exportações
+# append-only. O manifesto guarda, para cada uma, o offset em bytes já
+# consolidado e o hash dos bytes logo antes dele; além do maior order_id
+# já carregado (high-water). No refresh só o final novo de cada arquivo é
+# lido e passa pelas mesmas etapas 2-8 da construção completa.
+#
+# Linhas de DIM_Delivery/DIM_Customer com Id <= high-water são atualizações
+# tardias (ex.: Status e D_Date): as partições afetadas são regravadas com
+# as features recalculadas. Linhas com Id acima do novo high-water esperam
+# em "pending-*.feather" até o pedido chegar.
+#
+# Se algo foge do contrato (arquivo reescrito, DIM_Products alterado, pedido
+# antigo reaparecendo na FACT) o refresh devolve None e a ABT é reconstruída.
+
+def _read_header(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f))
+
+
+def _file_state(path, offset):
+    return {
+        "offset": offset,
+        "tail_sha": _hash_range(path, max(0, offset - TAIL_CHECK_BYTES), offset),
+        "header": _read_header(path),
+    }
+
+
+def _initial_state(data_dir, tables, inputs):
+    fact = tables["fact"]
+    high_water = int(fact["Id"].max()) if len(fact) else 0
+    files = {
+        nome: _file_state(os.path.join(data_dir, SOURCES[nome]), inputs[nome]["size"])
+        for nome in APPEND_ONLY
+    }
+    pending = {
+        nome: tables[nome][tables[nome]["Id"] > high_water]
+        for nome in ("deli", "cust")
+    }
+    return {
+        "high_water": high_water,
+        "files": files,
+        "pending": sorted(nome for nome, frame in pending.items() if len(frame)),
+        "pending_frames": {nome: frame for nome, frame in pending.items() if len(frame)},
+    }
+
+
+def _read_tail(path, nome, file_state):
+    # devolve (linhas novas, novo offset, bytes lidos) ou None se o arquivo
+    # não é o anterior acrescido de linhas
+    size = os.path.getsize(path)
+    offset = file_state["offset"]
+    if size < offset:
+        return None
+    inicio = max(0, offset - TAIL_CHECK_BYTES)
+    if _hash_range(path, inicio, offset) != file_state["tail_sha"]:
+        return None
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        dados = f.read(size - offset)
+
+    # só linhas completas; uma linha sendo escrita fica para o próximo refresh
+    fim = dados.rfind(b"\n") + 1
+    dados = dados[:fim]
+
+    if not dados.strip():
+        return empty_table(nome, file_state["header"]), offset + fim, dados
+    frame = read_table(io.BytesIO(dados), nome, column_names=file_state["header"])
+    return frame, offset + fim, dados
+
+
+def _chain_sha(sha, dados):
+    # hash encadeado: evita reler o histórico inteiro a cada refresh
+    h = hashlib.blake2b(digest_size=16)
+    h.update(sha.encode())
+    h.update(hashlib.blake2b(dados, digest_size=16).digest())
+    return h.hexdigest()
+
+
+def _empty_source(state, nome):
+    return empty_table(nome, state["files"][nome]["header"])
+
+
+def _apply_updates(part, updates, columns):
+    pos = pd.Index(part["order_id"]).get_indexer(updates["order_id"])
+    achou = pos >= 0
+    if not achou.any():
+        return part, False
+    for col in columns:
+        if isinstance(part[col].dtype, pd.CategoricalDtype):
+            novas = pd.Index(updates[col].dropna().unique()).difference(part[col].cat.categories)
+            if len(novas):
+                part[col] = part[col].cat.add_categories(novas)
+        elif part[col].dtype != updates[col].dtype:
+            part[col] = part[col].astype(object)
+        part.iloc[pos[achou], part.columns.get_loc(col)] = updates[col].to_numpy()[achou]
+    return part, True
+
+
+def refresh_abt(data_dir=DATA_DIR, cache_dir=CACHE_DIR, manifest=None):
+    if manifest is None:
+        manifest = _read_manifest(cache_dir)
+    if manifest is None or manifest.get("version") != CACHE_VERSION:
+        return None
+    manifest = copy.deepcopy(manifest)
+    state = manifest["state"]
+    inputs = dict(manifest["inputs"])
+
+    # DIM_Products é pequena e não é append-only: se mudou, reconstrói tudo
+    prod_path = os.path.join(data_dir, SOURCES["prod"])
+    prod_fp = _fingerprint(prod_path, inputs["prod"])
+    if prod_fp["sha"] != inputs["prod"]["sha"]:
+        return None
+    inputs["prod"] = prod_fp
+
+    tails = {}
+    for nome in APPEND_ONLY:
+        path = os.path.join(data_dir, SOURCES[nome])
+        stat = os.stat(path)
+        anterior = inputs[nome]
+        if stat.st_size == anterior["size"] and stat.st_mtime_ns == anterior["mtime_ns"]:
+            continue
+        tail = _read_tail(path, nome, state["files"][nome])
+        if tail is None:
+            return None
+        frame, offset, dados = tail
+        tails[nome] = frame
+        state["files"][nome] = _file_state(path, offset)
+        inputs[nome] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha": _chain_sha(anterior["sha"], dados),
+        }
+
+    if not tails:
+        return _read_cache(cache_dir, manifest)
+
+    high_water = state["high_water"]
+    fact_new = tails.get("fact")
+    if fact_new is not None and (fact_new["Id"] <= high_water).any():
+        return None
+
+    # pendentes + final novo de cada dimensão
+    dims = {}
+    for nome in ("deli", "cust"):
+        frames = []
+        if nome in state["pending"]:
+            frames.append(_read_frame(os.path.join(cache_dir, f"pending-{nome}.feather")))
+        if nome in tails:
+            frames.append(tails[nome])
+        dims[nome] = _concat(frames, ignore_index=True) if frames else None
+
+    if fact_new is not None and len(fact_new):
+        fact_agg = prepare_fact(fact_new)
+        novo_high_water = int(fact_agg["order_id"].max())
+    else:
+        fact_agg = None
+        novo_high_water = high_water
+
+    parts = manifest["parts"]
+    prepared = {}
+    pending = {}
+    for nome, frame in dims.items():
+        if frame is None:
+            continue
+        ids = frame["Id"]
+        pending[nome] = frame[ids > novo_high_water]
+        prepared[nome] = frame[ids <= novo_high_water]
+    prepared["deli"] = _prepare_delivery(prepared["deli"]) if "deli" in prepared else None
+    prepared["cust"] = _prepare_customer(prepared["cust"]) if "cust" in prepared else None
+
+    # --------------------------------------------
+    # atualizações tardias em pedidos já carregados
+    # --------------------------------------------
+    updates = []
+    if prepared["deli"] is not None:
+        updates.append((prepared["deli"][prepared["deli"]["order_id"] <= high_water], DELIVERY_COLUMNS))
+    if prepared["cust"] is not None:
+        updates.append((prepared["cust"][prepared["cust"]["order_id"] <= high_water], CUSTOMER_COLUMNS))
+    updates = [(upd, cols) for upd, cols in updates if len(upd)]
+
+    inicio = 0
+    for p in parts:
+        fim = inicio + p["rows"]
+        afetado = [
+            (upd, cols) for upd, cols in updates
+            if p["min_id"] is not None
+            and ((upd["order_id"] >= p["min_id"]) & (upd["order_id"] <= p["max_id"])).any()
+        ]
+        if afetado:
+            path = os.path.join(cache_dir, p["orders"])
+            part = _read_frame(path).copy()
+            mudou = False
+            for upd, cols in afetado:
+                part, alterou = _apply_updates(part, upd, cols)
+                mudou = mudou or alterou
+            if mudou:
+                part = _feature_engineering(part)
+                _write_frame(part, path)
+                _write_summaries(cache_dir, p, part)
+        inicio = fim
+    total_rows = inicio
+    total_items = sum(p["item_rows"] for p in parts)
+
+    # --------------------------------------------
+    # pedidos novos: etapas 5, 6 e 8 só no final novo
+    # --------------------------------------------
+    if fact_agg is not None:
+        deli_new = prepared["deli"]
+        cust_new = prepared["cust"]
+        if deli_new is None:
+            deli_new = _prepare_delivery(_empty_source(state, "deli"))
+        if cust_new is None:
+            cust_new = _prepare_customer(_empty_source(state, "cust"))
+        orders = _merge_orders(fact_agg, deli_new[deli_new["order_id"] > high_water], cust_new)
+        orders = _feature_engineering(orders)
+        orders.index = pd.RangeIndex(total_rows, total_rows + len(orders))
+
+        # itens antigos cujo pedido só chegou agora
+        for p in parts:
+            if not p["orphans"]:
+                continue
+            path = os.path.join(cache_dir, p["items"])
+            part = _read_frame(path).copy()
+            pos = pd.Index(fact_agg["order_id"]).get_indexer(part["Id"])
+            preencher = part["order_id"].isna().to_numpy() & (pos >= 0)
+            if preencher.any():
+                part.loc[preencher, "order_id"] = part.loc[preencher, "Id"]
+                part.loc[preencher, "Order_Date"] = fact_agg["Order_Date"].to_numpy()[pos[preencher]]
+                _write_frame(part, path)
+            p["orphans"] = bool(part["order_id"].isna().any())
+    else:
+        orders = None
+
+    if "shop" in tails:
+        shop_new = tails["shop"]
+        # datas dos pedidos: pedidos novos + (se preciso) pedidos já carregados
+        lookup = [fact_agg[["order_id", "Order_Date"]]] if fact_agg is not None else []
+        if (shop_new["Id"] <= high_water).any():
+            lookup += [
+                _read_frame(os.path.join(cache_dir, p["orders"]), columns=["order_id", "Order_Date"])
+                for p in parts
+            ]
+        if lookup:
+            lookup = pd.concat(lookup, ignore_index=True)
+        else:
+            lookup = prepare_fact(empty_table("fact"))[["order_id", "Order_Date"]]
+        prod = read_table(prod_path, "prod")
+        items = _prepare_items(shop_new, prod, lookup)
+        items.index = pd.RangeIndex(total_items, total_items + len(items))
+    else:
+        items = None
+
+    if orders is not None or items is not None:
+        if orders is None:
+            orders = _read_frame(os.path.join(cache_dir, parts[-1]["orders"])).iloc[:0]
+        if items is None:
+            items = _read_frame(os.path.join(cache_dir, parts[-1]["items"])).iloc[:0]
+        seq = manifest["next_part"]
+        entry = _part_entry(seq, orders, items)
+        _write_part(cache_dir, entry, orders, items)
+        parts.append(entry)
+        manifest["next_part"] = seq + 1
+
+    for nome, frame in pending.items():
+        if len(frame):
+            _write_frame(frame.reset_index(drop=True), os.path.join(cache_dir, f"pending-{nome}.feather"))
+    state["pending"] = sorted(
+        (set(state["pending"]) - set(pending)) | {nome for nome, frame in pending.items() if len(frame)}
+    )
+    state["high_water"] = novo_high_water
+    manifest["inputs"] = inputs
+
+    if len(parts) > MAX_PARTS:
+        _compact(cache_dir, manifest)
+
+    _write_manifest(cache_dir, manifest)
+    _remove_unused(cache_dir, manifest)
+    return _read_cache(cache_dir, manifest)
+
+
+def _compact(cache_dir, manifest):
+    parts = manifest["parts"]
+    orders = _concat([_read_frame(os.path.join(cache_dir, p["orders"])) for p in parts])
+    items = _concat([_read_frame(os.path.join(cache_dir, p["items"])) for p in parts])
+    seq = manifest["next_part"]
+    entry = _part_entry(seq, orders, items)
+    _write_part(cache_dir, entry, orders, items)
+    manifest["parts"] = [entry]
+    manifest["next_part"] = seq + 1
+
+
+# ==========================================================
+#               CONSTRUÇÃO EM STREAMING (MEMÓRIA LIMITADA)
+# ==========================================================
+# Para exportações maiores que a RAM: FACT_Orders é lida em blocos e, para
+# cada faixa de order_id, só as linhas correspondentes de DIM_Delivery,
+# DIM_Customer e DIM_Shopping são lidas (os arquivos estão ordenados por Id).
+# DIM_Products é pequena e fica inteira em memória. Cada bloco passa pelas
+# etapas 2-8 e é gravado como uma partição Parquet em out_dir/df e
+# out_dir/items; partições de mesmo número cobrem a mesma faixa de pedidos.
+
+STREAM_MIN_ROWS = 1_000
+
+# fator para cópias intermediárias (merges, colunas derivadas) por bloco
+STREAM_OVERHEAD = 4
+
+
+class _IdRangeReader:
+    # lê um CSV ordenado por Id devolvendo todas as linhas até um Id máximo
+
+    def __init__(self, path, nome, chunksize):
+        self._chunks = read_csv_chunks(path, nome, chunksize)
+        self._buffer = None
+        self._ultimo_id = None
+
+    def next_chunk(self):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return None
+        ids = chunk["Id"]
+        if not ids.is_monotonic_increasing or (
+            self._ultimo_id is not None and len(ids) and ids.iloc[0] < self._ultimo_id
+        ):
+            raise ValueError("Erro: arquivo precisa estar ordenado por Id para o modo streaming!")
+        if len(ids):
+            self._ultimo_id = ids.iloc[-1]
+        return chunk
+
+    def take_until(self, max_id):
+        partes = []
+        while True:
+            if self._buffer is None:
+                self._buffer = self.next_chunk()
+                if self._buffer is None:
+                    break
+            corte = int(self._buffer["Id"].searchsorted(max_id, side="right"))
+            partes.append(self._buffer.iloc[:corte])
+            if corte < len(self._buffer):
+                self._buffer = self._buffer.iloc[corte:]
+                break
+            self._buffer = None
+        return _concat(partes, ignore_index=True) if partes else None
+
+
+def _estimate_chunk_rows(data_dir, memory_budget_mb, amostra=STREAM_MIN_ROWS):
+    # mede quanto ocupa uma ABT construída a partir de uma amostra e
+    # extrapola quantos pedidos cabem no orçamento de memória
+    tables = {
+        nome: next(iter(read_csv_chunks(os.path.join(data_dir, arquivo), nome, amostra)))
+        for nome, arquivo in SOURCES.items()
+    }
+    orders, items = _build_frames(tables)
+    n = max(len(tables["fact"]), 1)
+    bytes_total = sum(
+        frame.memory_usage(deep=True).sum()
+        for frame in (orders, items, tables["fact"], tables["deli"], tables["cust"], tables["shop"])
+    )
+    bytes_por_pedido = STREAM_OVERHEAD * bytes_total / n
+    return max(STREAM_MIN_ROWS, int(memory_budget_mb * 2**20 / bytes_por_pedido))
+
+
+def build_abt_streaming(out_dir, data_dir=DATA_DIR, memory_budget_mb=512, chunk_rows=None):
+    if chunk_rows is None:
+        chunk_rows = _estimate_chunk_rows(data_dir, memory_budget_mb)
+
+    for sub in ("df", "items"):
+        os.makedirs(os.path.join(out_dir, sub), exist_ok=True)
+        for antigo in glob.glob(os.path.join(out_dir, sub, "part-*.parquet")):
+            os.remove(antigo)
+
+    prod = read_table(os.path.join(data_dir, SOURCES["prod"]), "prod")
+    leitores = {
+        nome: _IdRangeReader(os.path.join(data_dir, SOURCES[nome]), nome, chunk_rows)
+        for nome in ("deli", "cust", "shop")
+    }
+    fact_chunks = _IdRangeReader(os.path.join(data_dir, SOURCES["fact"]), "fact", chunk_rows)
+
+    seq = 0
+    chunk = fact_chunks.next_chunk()
+    while chunk is not None and len(chunk):
+        proximo = fact_chunks.next_chunk()
+        if proximo is not None and len(proximo):
+            # linhas do último Id podem continuar no próximo bloco
+            completo = (chunk["Id"] < chunk["Id"].iloc[-1]).to_numpy()
+            proximo = _concat([chunk[~completo], proximo], ignore_index=True)
+            chunk = chunk[completo]
+        if not len(chunk):
+            chunk = proximo
+            continue
+        max_id = chunk["Id"].iloc[-1]
+
+        dims = {}
+        for nome, leitor in leitores.items():
+            frame = leitor.take_until(max_id)
+            if frame is None:
+                frame = empty_table(nome)
+            dims[nome] = frame
+
+        orders, items = _build_frames({
+            "fact": chunk,
+            "deli": dims["deli"],
+            "cust": dims["cust"],
+            "shop": dims["shop"],
+            "prod": prod,
+        })
+        orders = _drop_impossible_dates(orders)
+
+        nome = f"part-{seq:05d}.parquet"
+        orders.to_parquet(os.path.join(out_dir, "df", nome), index=False)
+        items.to_parquet(os.path.join(out_dir, "items", nome), index=False)
+        seq += 1
+        del orders, items, dims
+
+        chunk = proximo
+
+    return seq
+
+
+def iter_abt_partitions(out_dir, columns=None, item_columns=None):
+    # devolve (df, items) por partição, na ordem de order_id
+    for path in sorted(glob.glob(os.path.join(out_dir, "df", "part-*.parquet"))):
+        nome = os.path.basename(path)
+        df = pd.read_parquet(path, columns=columns)
+        items = pd.read_parquet(os.path.join(out_dir, "items", nome), columns=item_columns)
+        yield df, items
+
+
+# ==========================================================
+#               ABT COMPARTILHADA (SÓ LEITURA)
+# ==========================================================
+# Uma cópia da ABT por versão dos dados, publicada em arquivos Arrow IPC
+# sem compressão num diretório de memória compartilhada (/dev/shm). Cada
+# processo (workers do Streamlit, server.py) mapeia os arquivos com mmap e
+# monta df/items sobre os buffers mapeados, sem cópia: as páginas ficam
+# uma vez só no page cache, qualquer que seja o número de sessões.
+#
+# As colunas são só leitura (escrever nelas levanta ValueError). Colunas
+# derivadas vão para a própria ABT (ex.: Total_Item) ou para um
+# frame.copy(deep=False) local, que não copia as colunas existentes.
+#
+# NaN e NaT ficam como valores (sem bitmap de nulos) para que numéricos e
+# datas sejam lidos direto do buffer; category vira dicionário Arrow com os
+# códigos do pandas e texto vira string[pyarrow] sobre o buffer mapeado.
+
+SHARED_DIR = SHM_DIR if os.path.isdir(SHM_DIR) else tempfile.gettempdir()
+SHARED_PREFIX = "ecommerce-abt-"
+_SHARED_INDEX = "__index__"
+
+
+def _shared_array(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = serie.cat.codes.to_numpy()
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codigos, mask=codigos < 0), pa.array(serie.cat.categories.to_numpy())
+        )
+    if serie.dtype.kind == "M":
+        valores = np.ascontiguousarray(serie.to_numpy(dtype="datetime64[ns]").view("int64"))
+        return pa.Array.from_buffers(pa.timestamp("ns"), len(valores), [None, pa.py_buffer(valores)])
+    if serie.dtype.kind in "iuf":
+        return pa.array(np.ascontiguousarray(serie.to_numpy()))
+    return pa.array(serie.to_numpy(dtype=object), type=pa.large_string(), from_pandas=True)
+
+
+def _write_shared(frame, path):
+    colunas = {_SHARED_INDEX: pa.array(frame.index.to_numpy(dtype="int64"))}
+    colunas.update({col: _shared_array(frame[col]) for col in frame.columns})
+    tabela = pa.table(colunas)
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, tabela.schema) as writer:
+        writer.write_table(tabela)
+
+
+def _buffer_view(array, dtype):
+    # numpy sobre o buffer de valores do Arrow (mapeado: só leitura)
+    buffer = array.buffers()[1]
+    if buffer is None:
+        return np.empty(0, dtype=dtype)
+    dtype = np.dtype(dtype)
+    return np.frombuffer(buffer, dtype=dtype, count=len(array), offset=array.offset * dtype.itemsize)
+
+
+def _shared_column(array):
+    tipo = array.type
+    if pa.types.is_dictionary(tipo):
+        codigos = _buffer_view(array.indices, tipo.index_type.to_pandas_dtype())
+        if array.null_count:
+            codigos = np.where(array.is_valid().to_numpy(zero_copy_only=False), codigos, -1)
+        categorias = array.dictionary.to_numpy(zero_copy_only=False)
+        return pd.Categorical.from_codes(codigos, categories=categorias, validate=False)
+    if pa.types.is_timestamp(tipo):
+        return _buffer_view(array, "int64").view("datetime64[ns]")
+    if pa.types.is_large_string(tipo):
+        return pd.arrays.ArrowStringArray(pa.chunked_array([array]))
+    return _buffer_view(array, tipo.to_pandas_dtype())
+
+
+def _read_shared(path):
+    tabela = pa.ipc.open_file(pa.memory_map(path)).read_all().combine_chunks()
+    colunas = {nome: _shared_column(tabela.column(nome).chunk(0)) for nome in tabela.column_names}
+    indice = pd.Index(colunas.pop(_SHARED_INDEX))
+    return pd.DataFrame(colunas, index=indice, copy=False)
+
+
+def _open_shared(destino):
+    return (
+        _read_shared(os.path.join(destino, "orders.arrow")),
+        _read_shared(os.path.join(destino, "items.arrow")),
+    )
+
+
+def _publish_shared(destino, df, items):
+    # grava num diretório temporário e renomeia: leitores nunca veem uma
+    # versão pela metade; se outro processo publicou antes, fica a dele
+    tmp = tempfile.mkdtemp(prefix=f".{os.path.basename(destino)}-", dir=os.path.dirname(destino))
+    try:
+        _write_shared(df, os.path.join(tmp, "orders.arrow"))
+        _write_shared(items, os.path.join(tmp, "items.arrow"))
+        os.rename(tmp, destino)
+    except OSError:
+        if not os.path.isdir(destino):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    # versões antigas saem do diretório; quem ainda as mapeia continua lendo
+    for antigo in glob.glob(os.path.join(os.path.dirname(destino), f"{SHARED_PREFIX}*")):
+        if antigo != destino:
+            shutil.rmtree(antigo, ignore_errors=True)
+
 
+@profiled("ABT compartilhada")
+def shared_abt(data_dir=DATA_DIR, cache_dir=CACHE_DIR, shared_dir=SHARED_DIR):
+    # (df, items) só leitura sobre a cópia publicada da versão atual; o
+    # primeiro processo a pedir uma versão nova chama load_data e publica
+    destino = os.path.join(shared_dir, SHARED_PREFIX + data_version(data_dir, cache_dir))
+    try:
+        return _open_shared(destino)
+    except (OSError, pa.ArrowInvalid):
+        pass
+    os.makedirs(shared_dir, exist_ok=True)
+    _publish_shared(destino, *load_data(data_dir, cache_dir))
+    return _open_shared(destino)
 
 
 # ==========================================================
@@ -1,11 +1,14 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import numpy as np
+import json
 import os
 
-from abt import load_data
-from metrics import compute_kpis, ic_media, ic_proporcao, elasticidade
+from report import (
+    RECORTES, FILTROS_ROLLUP, load_report, write_report, build_report, signature, kpi_table,
+    group_intervals, chart_tables
+)
+from figures import MAX_PAYLOAD_BYTES, figure_specs
 
 
 # ===============================================================
@@ -20,11 +23,171 @@ st.set_page_config(
 st.title("E-commerce Data Insights")
 
 
+# ===============================================================
+# CACHE
+# ===============================================================
+# Tudo que é caro (ABT, KPIs, ICs, agregações e figuras) fica em cache do
+# Streamlit com a versão dos dados (hash dos CSVs) como chave: interações
+# como marcar um checkbox não recalculam nada, e quando os CSVs mudam a
+# versão muda e o cache antigo deixa de ser usado. TTL e max_entries
+# limitam a memória ocupada por versões antigas.
+#
+# A ABT é publicada uma vez por versão em memória compartilhada
+# (abt.shared_abt): sessões e processos do Streamlit leem as mesmas páginas
+# mapeadas, sem cópia. As colunas são só leitura, por isso o app NUNCA
+# altera df/items: colunas derivadas são calculadas dentro das funções em
+# cache (ou já vêm na ABT, como Total_Item).
+#
+# Partida rápida: sem filtros, a página sai do bundle do relatório
+# (report.py, gravado pelo pipeline) sem importar abt, metrics, query nem
+# scipy: eles são importados onde são usados, e a ABT só é carregada com
+# filtros ativos, nas tabelas de dados brutos ou no perfil de desempenho.
+# figures.py só importa plotly ao montar as figuras (em cache abaixo).
+
+CACHE_TTL = 60 * 60
+CACHE_MAX_ENTRIES = 4
+
+with st.sidebar:
+    if st.button("Recarregar dados"):
+        st.cache_data.clear()
+        st.cache_resource.clear()
+    mostrar_perfil = st.checkbox("Perfil de desempenho")
+
+
+@st.cache_resource(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner="Carregando dados...")
+def carregar_abt(versao):
+    from abt import shared_abt
+    return shared_abt()
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner="Carregando relatório...")
+def carregar_bundle(assinatura):
+    bundle = load_report()
+    if bundle is None:
+        # sem bundle válido (pipeline não rodou ou CSVs novos): calcula a
+        # partir da ABT e grava para as próximas partidas
+        from abt import data_version, load_distributions, load_rollups
+
+        versao = data_version()
+        df_abt, items_abt = carregar_abt(versao)
+        bundle = build_report(df_abt, items_abt, versao, load_distributions(), load_rollups())
+        try:
+            write_report(bundle)
+        except OSError:
+            pass
+    return bundle
+
+
+@st.cache_resource(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def carregar_rollups(versao, _df):
+    from abt import load_rollups
+    from rollups import build_rollups
+
+    rollups = load_rollups()
+    return build_rollups(_df) if rollups is None else rollups
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def calcular_kpis(chave, _df):
+    return kpi_table(_df)
+
+
+@st.cache_resource(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def calcular_cubo(chave, _df):
+    from metrics import build_cube
+    return build_cube(_df)
+
+
+@st.cache_resource(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def indices_filtros(versao, _df, _items):
+    from query import build_filter_indexes
+    return build_filter_indexes(_df, _items)
+
+
+# só as posições ficam em cache (poucos bytes por pedido filtrado): a ABT
+# filtrada é recortada a cada execução e descartada no fim, sem cópias
+# parciais da ABT residentes por combinação de filtros
+@st.cache_resource(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES * 8)
+def posicoes_abt(chave, _indices):
+    from query import apply_filters
+
+    versao, periodo, filtros = chave
+    return apply_filters(_indices, periodo, **dict(filtros))
+
+
+def opcoes(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return list(serie.cat.categories)
+    return sorted(serie.dropna().unique())
+
+
+def periodo_selecionado(container, rotulo, inicio, fim, key=None):
+    periodo = container.date_input(
+        rotulo, value=(inicio, fim), min_value=inicio, max_value=fim, key=key
+    )
+    if len(periodo) != 2 or (periodo[0] == inicio and periodo[1] == fim):
+        return None
+    return (pd.Timestamp(periodo[0]), pd.Timestamp(periodo[1]) + pd.Timedelta(days=1) - pd.Timedelta(1))
+
+
 # ===============================================================
 # CARREGAR DADOS
 # ===============================================================
-df, items = load_data()
-df_confirmed = df[df["is_confirmed"] == 1]
+bundle = carregar_bundle(signature())
+versao = bundle["data_version"]
+
+
+# ===============================================================
+# FILTROS
+# ===============================================================
+# Cada filtro vira uma lista de posições (índices pré-calculados por valor);
+# a combinação é a interseção dessas listas. Todas as seções abaixo usam a
+# ABT filtrada, e os caches são chaveados por (versão, filtros). As opções
+# dos filtros vêm do bundle.
+
+opcoes_filtros = bundle["filtros"]
+
+with st.sidebar:
+    st.header("Filtros")
+    periodo = periodo_selecionado(
+        st, "Período",
+        pd.Timestamp(opcoes_filtros["inicio"]).date(), pd.Timestamp(opcoes_filtros["fim"]).date()
+    )
+    filtros = (
+        ("Region", tuple(st.multiselect("Região", opcoes_filtros["Region"]))),
+        ("UF", tuple(st.multiselect("UF", opcoes_filtros["UF"]))),
+        ("Service", tuple(st.multiselect("Serviço", opcoes_filtros["Service"]))),
+        ("Payment_Method", tuple(st.multiselect("Pagamento", opcoes_filtros["Payment_Method"]))),
+        ("Category", tuple(st.multiselect("Categoria", opcoes_filtros["Category"]))),
+    )
+
+chave = (versao, periodo, filtros)
+
+# sem filtros KPIs, ICs e gráficos já estão no bundle
+usa_bundle = periodo is None and not any(valores for _, valores in filtros)
+
+
+def abt_da_pagina():
+    # ABT (filtrada, se houver filtros), carregada só quando alguma seção precisa
+    df_total, items_total = carregar_abt(versao)
+    if usa_bundle:
+        return df_total, items_total
+    pos_pedidos, pos_itens = posicoes_abt(chave, indices_filtros(versao, df_total, items_total))
+    df_f = df_total if pos_pedidos is None else df_total.iloc[pos_pedidos]
+    items_f = items_total if pos_itens is None else items_total.iloc[pos_itens]
+    return df_f, items_f
+
+
+if usa_bundle:
+    kpis, ic_df = bundle["kpis"], bundle["ics"]
+else:
+    df, items = abt_da_pagina()
+
+    if df.empty:
+        st.warning("Nenhum pedido com os filtros selecionados.")
+        st.stop()
+
+    kpis, ic_df = calcular_kpis(chave, df)
 
 
 # ===============================================================
@@ -32,8 +195,6 @@ df_confirmed = df[df["is_confirmed"] == 1]
 # ===============================================================
 st.header("Indicadores Principais")
 
-kpis = compute_kpis(df)
-
 col1, col2, col3 = st.columns(3)
 col1.metric("Ticket Médio", f"R$ {kpis['ticket_medio']:.2f}")
 col2.metric("Receita Total", f"R$ {kpis['receita_total']:.2f}")
@@ -97,171 +258,210 @@ with tabs[5]:
 
 st.header("Intervalos de Confiança (95%)")
 
-ic1 = ic_media(df_confirmed["Total"])
-ic2 = ic_media(df[df["delivery_lead_time"].notna()]["delivery_lead_time"])
-ic3 = ic_proporcao(df[df["delivery_lead_time"].notna()]["is_late"])
-ic4 = ic_proporcao(df["is_canceled"])
+st.dataframe(ic_df)
 
-ic_df = pd.DataFrame({
-    "KPI": ["Ticket Médio", "Prazo de Entrega", "Taxa de Atraso", "Taxa de Cancelamento"],
-    "IC Inferior": [ic1[0], ic2[0], ic3[0], ic4[0]],
-    "IC Superior": [ic1[1], ic2[1], ic3[1], ic4[1]]
-})
 
-st.dataframe(ic_df)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES * 4, show_spinner=False)
+def ics_por_recorte(chave, dimensao, _cube, _df):
+    return group_intervals(_df, _cube, dimensao)
+
+
+st.subheader("Intervalos por Recorte")
+recorte = st.selectbox("Recorte", list(RECORTES))
+if usa_bundle:
+    tabela_ics = bundle["ics_recorte"][RECORTES[recorte]]
+else:
+    tabela_ics = ics_por_recorte(chave, RECORTES[recorte], calcular_cubo(chave, df), df)
+st.dataframe(
+    tabela_ics.style.format({
+        "Ticket Médio": "R$ {:.2f}",
+        "Ticket IC t": lambda ic: f"R$ {ic[0]:.2f} – {ic[1]:.2f}",
+        "Ticket IC bootstrap": lambda ic: f"R$ {ic[0]:.2f} – {ic[1]:.2f}",
+        "Taxa de Atraso": "{:.1%}",
+        "Atraso IC Wilson": lambda ic: f"{ic[0]:.1%} – {ic[1]:.1%}",
+    }),
+    use_container_width=True,
+    hide_index=True
+)
 
 
 # ===============================================================
-# TABELAS DE DADOS BRUTOS 
+# TABELAS DE DADOS BRUTOS
 # ===============================================================
+# Filtros, projeção e paginação rodam no servidor: o navegador só recebe
+# a página visível.
+
+@st.cache_resource(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def indice_datas(chave, tabela, _frame):
+    from query import date_index
+    return date_index(_frame["Order_Date"])
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES * 8)
+def posicoes_filtradas(chave, tabela, periodo, filtros, _frame, _pedidos):
+    from query import filter_positions
+
+    filtros = dict(filtros)
+    if tabela == "Itens":
+        # itens herdam os filtros do pedido
+        pedidos = _pedidos["order_id"].to_numpy()[
+            filter_positions(_pedidos, **filtros)
+        ] if any(filtros.values()) else None
+        posicoes = filter_positions(_frame, indice_datas(chave, tabela, _frame), periodo)
+        if pedidos is not None:
+            posicoes = posicoes[np.isin(_frame["order_id"].to_numpy()[posicoes], pedidos)]
+        return posicoes
+    return filter_positions(_frame, indice_datas(chave, tabela, _frame), periodo, **filtros)
+
+
 st.header("Dados Brutos")
 if st.checkbox("Mostrar tabelas completas"):
-    st.subheader("Pedidos")
-    st.dataframe(df)
+    from query import PAGE_SIZES, n_pages, page
+
+    df, items = abt_da_pagina()
+    tabela = st.radio("Tabela", ["Pedidos", "Itens"], horizontal=True)
+    frame = df if tabela == "Pedidos" else items
+
+    colunas = st.multiselect("Colunas", list(frame.columns), default=list(frame.columns))
+
+    periodo_tabela = periodo_selecionado(
+        st, "Período do pedido", df["Order_Date"].min().date(), df["Order_Date"].max().date(),
+        key="periodo_tabela"
+    )
 
-    st.subheader("Itens")
-    st.dataframe(items)
+    f1, f2, f3 = st.columns(3)
+    filtros_tabela = (
+        ("UF", tuple(f1.multiselect("UF", opcoes(df["UF"]), key="uf_tabela"))),
+        ("Service", tuple(f2.multiselect("Service", opcoes(df["Service"]), key="service_tabela"))),
+        ("Purchase_Status", tuple(f3.multiselect("Purchase_Status", opcoes(df["Purchase_Status"])))),
+    )
 
-import plotly.express as px
-import plotly.graph_objects as go
+    posicoes = posicoes_filtradas(chave, tabela, periodo_tabela, filtros_tabela, frame, df)
+
+    p1, p2 = st.columns(2)
+    tamanho = p1.selectbox("Linhas por página", PAGE_SIZES)
+    total_paginas = n_pages(len(posicoes), tamanho)
+    pagina = p2.number_input("Página", min_value=1, max_value=total_paginas, value=1)
+
+    st.dataframe(page(frame, posicoes, pagina, tamanho, colunas))
+    inicio = (pagina - 1) * tamanho
+    st.caption(
+        f"Linhas {min(inicio + 1, len(posicoes))}–{min(inicio + tamanho, len(posicoes))} "
+        f"de {len(posicoes)} (página {pagina} de {total_paginas})"
+    )
 
 # =========================================================
-# ANALISES ADICIONAIS 
+# ANALISES ADICIONAIS
 # =========================================================
 
 st.markdown("---")
 st.header("Análises Avançadas")
 
+
+# Tabelas agregadas dos gráficos (report.chart_tables): do bundle sem
+# filtros; com filtros, calculadas sobre a ABT filtrada. Filtros de
+# período, UF e Região na sazonalidade são respondidos pelo rollup diário
+# pré-calculado; com filtros de serviço, pagamento ou categoria o rollup
+# mensal é refeito sobre a ABT filtrada (chaves inteiras, sem texto por linha).
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def tabelas_graficos(chave, _df, _items, _rollups):
+    _, periodo, filtros = chave
+    return chart_tables(
+        _df, _items, calcular_cubo(chave, _df), rollups=_rollups, periodo=periodo, filtros=filtros
+    )
+
+
+# JSON das figuras (figures.py), no máximo MAX_PAYLOAD_BYTES por execução;
+# em cache por (versão, filtros), interações não refazem nenhuma figura
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES * 8, show_spinner=False)
+def graficos(chave, _tabelas):
+    return figure_specs(_tabelas, MAX_PAYLOAD_BYTES)
+
+
+if usa_bundle:
+    tabelas = bundle["tabelas"]
+else:
+    df_total, _ = carregar_abt(versao)
+    so_rollup = all(dim in FILTROS_ROLLUP for dim, valores in filtros if valores)
+    rollups = carregar_rollups(versao, df_total) if so_rollup else None
+    tabelas = tabelas_graficos(chave, df, items, rollups)
+
+specs = graficos(chave, tabelas)
+
+
+def mostrar_grafico(nome):
+    st.plotly_chart(json.loads(specs[nome]), use_container_width=True)
+
+
 # ---------------------------------------------------------
 # 1. Taxa de confirmação por método de pagamento
 # ---------------------------------------------------------
 st.subheader("Taxa de Confirmação por Método de Pagamento")
-
-conv = df.groupby("Payment_Method")["is_confirmed"].mean().reset_index()
-conv["is_confirmed"] = conv["is_confirmed"] * 100
-
-fig_conv = px.bar(
-    conv,
-    x="Payment_Method",
-    y="is_confirmed",
-    text="is_confirmed",
-    labels={"is_confirmed": "Taxa de Confirmação (%)"},
-    title="Taxa de Confirmação por Método de Pagamento"
-)
-fig_conv.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-st.plotly_chart(fig_conv, use_container_width=True)
+mostrar_grafico("confirmacao")
 
 # ---------------------------------------------------------
 # 2. Performance logística por tipo de serviço
 # ---------------------------------------------------------
 st.subheader("Performance Logística por Serviço de Entrega")
-
-temp = df[df["delivery_lead_time"].notna()]
-lead = temp.groupby("Service")["delivery_lead_time"].mean().reset_index()
-
-fig_lead = px.bar(
-    lead,
-    x="Service",
-    y="delivery_lead_time",
-    title="Tempo Médio de Entrega por Serviço",
-    labels={"delivery_lead_time": "Dias"}
-)
-st.plotly_chart(fig_lead, use_container_width=True)
+mostrar_grafico("prazo_servico")
 
 # ---------------------------------------------------------
 # 3. Boxplot do prazo por tipo de entrega
 # ---------------------------------------------------------
 st.subheader("Distribuição do Prazo por Serviço")
-
-fig_box = px.box(
-    temp,
-    x="Service",
-    y="delivery_lead_time",
-    title="Boxplot do Prazo de Entrega por Serviço",
-    labels={"delivery_lead_time": "Dias"}
-)
-st.plotly_chart(fig_box, use_container_width=True)
+mostrar_grafico("caixas_prazo")
 
 # ---------------------------------------------------------
 # 4. Receita por Categoria e Subcategoria
 # ---------------------------------------------------------
 st.subheader("Receita por Categoria e Subcategoria")
-
-items["Total_Item"] = items["Quantity"] * items["Price"]
-
-cat = items.groupby("Category")["Total_Item"].sum().reset_index()
-subcat = items.groupby("Subcategory")["Total_Item"].sum().reset_index()
-
-fig_cat = px.bar(
-    cat,
-    x="Category",
-    y="Total_Item",
-    title="Receita por Categoria",
-    labels={"Total_Item": "Receita (R$)"}
-)
-st.plotly_chart(fig_cat, use_container_width=True)
-
-fig_subcat = px.bar(
-    subcat,
-    x="Subcategory",
-    y="Total_Item",
-    title="Receita por Subcategoria",
-    labels={"Total_Item": "Receita (R$)"}
-)
-st.plotly_chart(fig_subcat, use_container_width=True)
+mostrar_grafico("receita_categoria")
+mostrar_grafico("receita_subcategoria")
 
 # ---------------------------------------------------------
 # 5. Receita por UF e Região
 # ---------------------------------------------------------
 st.subheader("Receita por Estado e Região")
-
-merge_geo = df.merge(items[["order_id", "Total_Item"]], on="order_id", how="left")
-
-geo_uf = merge_geo.groupby("UF")["Total_Item"].sum().reset_index()
-geo_reg = merge_geo.groupby("Region")["Total_Item"].sum().reset_index()
-
-fig_uf = px.bar(
-    geo_uf,
-    x="UF",
-    y="Total_Item",
-    title="Receita por Estado",
-)
-st.plotly_chart(fig_uf, use_container_width=True)
-
-fig_reg = px.bar(
-    geo_reg,
-    x="Region",
-    y="Total_Item",
-    title="Receita por Região",
-)
-st.plotly_chart(fig_reg, use_container_width=True)
+mostrar_grafico("receita_uf")
+mostrar_grafico("receita_regiao")
 
 # ---------------------------------------------------------
 # 6. Sazonalidade avançada (UF e Região)
 # ---------------------------------------------------------
 st.subheader("Sazonalidade Geográfica")
+mostrar_grafico("sazonalidade_uf")
+mostrar_grafico("sazonalidade_regiao")
 
-df["month"] = df["Order_Date"].dt.to_period("M").astype(str)
-
-sas_uf = df.groupby(["UF", "month"])["Total"].sum().reset_index()
-
-fig_sas_uf = px.line(
-    sas_uf,
-    x="month",
-    y="Total",
-    color="UF",
-    title="Sazonalidade de Receita por UF"
-)
-st.plotly_chart(fig_sas_uf, use_container_width=True)
-
-sas_reg = df.groupby(["Region", "month"])["Total"].sum().reset_index()
-
-fig_sas_reg = px.line(
-    sas_reg,
-    x="month",
-    y="Total",
-    color="Region",
-    title="Sazonalidade de Receita por Região"
-)
-st.plotly_chart(fig_sas_reg, use_container_width=True)
 
+# ===============================================================
+# PERFIL DE DESEMPENHO
+# ===============================================================
+# Reconstrói a ABT a partir dos CSVs (sem o cache) com a instrumentação
+# ligada e mede também as métricas: tempo, pico de memória e linhas por etapa.
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner="Medindo etapas...")
+def perfil_desempenho(versao):
+    from abt import load_data
+    from metrics import build_cube, compute_kpis, cube_kpis, elasticidade
+    from profiling import profiling, report_frame, total_seconds
+
+    with profiling(log=False) as perfil:
+        df_p, items_p = load_data(use_cache=False)
+        compute_kpis(df_p)
+        cube_kpis(build_cube(df_p), by=["UF"], confidence=0.95)
+        elasticidade(items_p, df_p[df_p["is_confirmed"] == 1])
+    relatorio = report_frame(perfil)
+    relatorio["stage"] = relatorio["level"].map(lambda n: "\u2003" * n) + relatorio["stage"]
+    return relatorio.drop(columns="level"), total_seconds(perfil)
+
+
+if mostrar_perfil:
+    st.header("Perfil de Desempenho")
+    relatorio, total = perfil_desempenho(versao)
+    st.caption(f"Construção completa da ABT e métricas: {total:.2f}s. "
+               "Pico = memória Python acima do início da etapa (tracemalloc).")
+    st.dataframe(
+        relatorio.style.format({"seconds": "{:.4f}", "peak_mb": "{:.1f}"}),
+        use_container_width=True,
+        hide_index=True
+    )
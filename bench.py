@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from abt import SOURCES, load_data, prepare_fact, read_table
+from metrics import compute_kpis, ic_media, ic_proporcao, elasticidade, elasticity, ELASTICITY_DIMS
+from synthetic import SEED, ensure_dataset
+
+'''
+Benchmarks de escala sobre dados sintéticos (synthetic.py):
+- load_data (cache frio = construção da ABT + gravação do cache; cache quente);
+  com --workers N, também o cache frio com leitura paralela dos CSVs
+- etapa 2 da ABT (prepare_fact) com ids únicos e com 1% de ids repetidos
+- compute_kpis, ic_media, ic_proporcao e elasticidade (curva global e
+  coeficientes por Category × Subcategory × Region × mês)
+- Tempo (mínimo e mediana de várias repetições) e pico de memória Python
+  (tracemalloc, numa execução separada para não distorcer o tempo)
+- Resultado em JSON (bench_results/), comparável entre execuções:
+  --baseline arquivo.json falha (código de saída 1) se algum tempo ou pico
+  de memória piorar mais que --threshold
+
+Obs.: a memória alocada pelo Arrow na leitura dos CSVs não passa pelo
+tracemalloc; o pico de load_data mede só o lado pandas/numpy.
+'''
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+DATA_DIR = "bench_data"
+RESULTS_DIR = "bench_results"
+
+REPEAT = 3
+THRESHOLD = 0.25
+
+# tempos abaixo disso são ruído de medição e não entram na comparação
+MIN_SECONDS = 0.005
+
+
+# ================================
+# MEDIÇÃO
+# ================================
+
+def _medir(func, repeat=REPEAT, setup=None):
+    tempos = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        inicio = time.perf_counter()
+        func()
+        tempos.append(time.perf_counter() - inicio)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": min(tempos),
+        "seconds_median": float(np.median(tempos)),
+        "peak_mb": pico / 2**20,
+        "repeat": repeat,
+    }
+
+
+def _memoria_total_mb():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ================================
+# SUÍTE
+# ================================
+
+def bench_size(n_orders, data_root=DATA_DIR, repeat=REPEAT, seed=SEED, workers=None):
+    data_dir = os.path.join(data_root, f"orders_{n_orders}")
+    cache_dir = os.path.join(data_dir, ".abt_cache")
+    ensure_dataset(data_dir, n_orders, seed=seed)
+
+    def limpar_cache():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    resultados = {
+        "load_data_cold": _medir(
+            lambda: load_data(data_dir, cache_dir), repeat, setup=limpar_cache
+        ),
+        "load_data_warm": _medir(lambda: load_data(data_dir, cache_dir), repeat),
+    }
+    if workers:
+        resultados["load_data_cold_parallel"] = _medir(
+            lambda: load_data(data_dir, cache_dir, workers=workers), repeat, setup=limpar_cache
+        )
+
+    fact = read_table(os.path.join(data_dir, SOURCES["fact"]), "fact")
+    repetidos = fact.sample(frac=0.01, random_state=seed)
+    fact_dups = pd.concat([fact, repetidos]).sort_values("Id", kind="stable")
+    resultados["prepare_fact"] = _medir(lambda: prepare_fact(fact.copy()), repeat)
+    resultados["prepare_fact_dups"] = _medir(lambda: prepare_fact(fact_dups.copy()), repeat)
+
+    df, items = load_data(data_dir, cache_dir)
+    df_confirmed = df[df["is_confirmed"] == 1]
+    entregues = df.loc[df["delivery_lead_time"].notna(), "is_late"]
+
+    resultados["compute_kpis"] = _medir(lambda: compute_kpis(df), repeat)
+    resultados["ic_media"] = _medir(lambda: ic_media(df_confirmed["Total"]), repeat)
+    resultados["ic_proporcao"] = _medir(lambda: ic_proporcao(entregues), repeat)
+    resultados["elasticidade"] = _medir(lambda: elasticidade(items, df_confirmed), repeat)
+    resultados["elasticity_by"] = _medir(
+        lambda: elasticity(items, df_confirmed, by=ELASTICITY_DIMS), repeat
+    )
+
+    linhas = {"orders": len(df), "items": len(items)}
+    return [
+        {"size": n_orders, "bench": nome, **linhas, **medida}
+        for nome, medida in resultados.items()
+    ]
+
+
+def _estimativa_mb(resultados, n_orders):
+    # extrapola linearmente o maior pico já medido (load_data frio)
+    picos = [r for r in resultados if r["bench"] == "load_data_cold"]
+    if not picos:
+        return None
+    maior = max(picos, key=lambda r: r["size"])
+    return maior["peak_mb"] * n_orders / maior["size"]
+
+
+def run(sizes=SIZES, data_root=DATA_DIR, repeat=REPEAT, seed=SEED, memory_budget_mb=None,
+        workers=None):
+    memory_budget_mb = memory_budget_mb or _memoria_total_mb()
+    resultados = []
+    pulados = []
+    for n_orders in sorted(sizes):
+        estimativa = _estimativa_mb(resultados, n_orders)
+        if memory_budget_mb and estimativa and estimativa > memory_budget_mb:
+            pulados.append({
+                "size": n_orders,
+                "motivo": f"pico estimado de {estimativa:.0f} MB acima de {memory_budget_mb:.0f} MB",
+            })
+            print(f"[bench] {n_orders}: pulado ({pulados[-1]['motivo']})")
+            continue
+
+        for r in bench_size(n_orders, data_root, repeat, seed, workers):
+            resultados.append(r)
+            print(f"[bench] {n_orders:>10} {r['bench']:<23} "
+                  f"{r['seconds']:9.4f}s {r['peak_mb']:9.1f} MB")
+
+    return {
+        "meta": {
+            "timestamp": pd.Timestamp.now().isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "memory_mb": _memoria_total_mb(),
+            "seed": seed,
+            "repeat": repeat,
+            "workers": workers,
+        },
+        "results": resultados,
+        "skipped": pulados,
+    }
+
+
+# ================================
+# COMPARAÇÃO ENTRE EXECUÇÕES
+# ================================
+
+def compare(atual, baseline, threshold=THRESHOLD):
+    base = {(r["size"], r["bench"]): r for r in baseline["results"]}
+    regressoes = []
+    for r in atual["results"]:
+        anterior = base.get((r["size"], r["bench"]))
+        if anterior is None:
+            continue
+        if anterior["seconds"] >= MIN_SECONDS:
+            razao = r["seconds"] / anterior["seconds"]
+            if razao > 1 + threshold:
+                regressoes.append({**_chave(r), "medida": "seconds", "antes": anterior["seconds"],
+                                   "depois": r["seconds"], "razao": razao})
+        if anterior["peak_mb"] > 0:
+            razao = r["peak_mb"] / anterior["peak_mb"]
+            if razao > 1 + threshold:
+                regressoes.append({**_chave(r), "medida": "peak_mb", "antes": anterior["peak_mb"],
+                                   "depois": r["peak_mb"], "razao": razao})
+    return regressoes
+
+
+def _chave(r):
+    return {"size": r["size"], "bench": r["bench"]}
+
+
+def _tamanho(valor):
+    return int(float(valor))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de escala da ABT e das métricas")
+    parser.add_argument("--sizes", nargs="+", type=_tamanho, default=SIZES)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--memory-budget-mb", type=float, default=None)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    resultado = run(
+        args.sizes, args.data_dir, args.repeat, args.seed, args.memory_budget_mb, args.workers
+    )
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"bench_{pd.Timestamp.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(resultado, f, indent=2)
+    print(f"[bench] resultados salvos em {out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressoes = compare(resultado, json.load(f), args.threshold)
+        for r in regressoes:
+            print(f"[bench] REGRESSÃO {r['size']} {r['bench']} {r['medida']}: "
+                  f"{r['antes']:.4f} -> {r['depois']:.4f} ({r['razao']:.2f}x)")
+        if regressoes:
+            sys.exit(1)
+        print(f"[bench] sem regressões acima de {args.threshold:.0%}")
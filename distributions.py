@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+from metrics import masks
+from sketches import (
+    SKETCH_ALPHA, ddsketch, sketch_update, sketch_merge, sketch_box, sketch_histogram,
+    sketch_to_dict, sketch_from_dict
+)
+
+'''
+Distribuições pré-calculadas para os gráficos de boxplot e histograma:
+- Um sketch de quantis (sketches.py) por coluna e por grupo, construído uma
+  vez junto com a ABT (abt.py grava um arquivo por partição do cache)
+- Partições e atualizações incrementais se combinam com merge, sem voltar
+  às linhas
+- Os gráficos usam quartis, bigodes, amostra de outliers e histograma de
+  bins fixos: o tamanho do que é desenhado (e enviado ao navegador) não
+  depende do número de pedidos
+'''
+
+TOTAL = "__total__"
+
+# nome: (coluna, máscara de metrics.masks, definição de entregue, grupo)
+DISTRIBUTIONS = {
+    "ticket": ("Total", "confirmed", "lead_time", None),
+    "desconto": ("Discount", "confirmed", "lead_time", None),
+    "prazo": ("delivery_lead_time", "delivered", "status", None),
+    "prazo_por_servico": ("delivery_lead_time", "delivered", "lead_time", "Service"),
+}
+
+
+# ================================
+# CONSTRUÇÃO
+# ================================
+
+def _grupos(serie):
+    # (rótulo, máscara) na ordem das categorias
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = serie.cat.codes.to_numpy()
+        return [(str(c), codigos == i) for i, c in enumerate(serie.cat.categories)]
+    valores = serie.to_numpy()
+    return [(str(v), valores == v) for v in serie.dropna().unique()]
+
+
+def build_distributions(df, specs=DISTRIBUTIONS, alpha=SKETCH_ALPHA):
+    mascaras = {d: masks(df, d) for d in {spec[2] for spec in specs.values()}}
+    saida = {}
+    for nome, (coluna, mask, delivered, grupo) in specs.items():
+        valores = df[coluna].to_numpy(dtype="float64", na_value=np.nan)
+        ok = mascaras[delivered][mask]
+        grupos = [(TOTAL, np.ones(len(df), dtype=bool))] if grupo is None else _grupos(df[grupo])
+        saida[nome] = {
+            rotulo: sketch_update(ddsketch(alpha), valores[ok & dentro])
+            for rotulo, dentro in grupos
+        }
+    return saida
+
+
+def merge_distributions(a, b):
+    saida = {}
+    for nome in dict.fromkeys([*a, *b]):
+        grupos_a, grupos_b = a.get(nome, {}), b.get(nome, {})
+        saida[nome] = {
+            rotulo: (
+                sketch_merge(grupos_a[rotulo], grupos_b[rotulo])
+                if rotulo in grupos_a and rotulo in grupos_b
+                else grupos_a.get(rotulo) or grupos_b[rotulo]
+            )
+            for rotulo in dict.fromkeys([*grupos_a, *grupos_b])
+        }
+    return saida
+
+
+# ================================
+# RESUMOS PARA OS GRÁFICOS
+# ================================
+
+def box_stats(dist, nome):
+    # lista de estatísticas (uma por grupo, com "label"); grupos vazios saem
+    saida = []
+    for rotulo, sketch in dist[nome].items():
+        box = sketch_box(sketch)
+        if box is not None:
+            saida.append({**box, "label": "" if rotulo == TOTAL else rotulo})
+    return saida
+
+
+def histogram(dist, nome, bins=50, grupo=TOTAL):
+    # DataFrame com início, fim e contagem de cada bin
+    bordas, contagem = sketch_histogram(dist[nome][grupo], bins)
+    return pd.DataFrame({"inicio": bordas[:-1], "fim": bordas[1:], "contagem": contagem})
+
+
+def count(dist, nome, grupo=TOTAL):
+    return dist[nome][grupo]["count"] if grupo in dist[nome] else 0
+
+
+# ================================
+# SERIALIZAÇÃO
+# ================================
+
+def distributions_to_dict(dist):
+    return {
+        nome: {rotulo: sketch_to_dict(s) for rotulo, s in grupos.items()}
+        for nome, grupos in dist.items()
+    }
+
+
+def distributions_from_dict(dados):
+    return {
+        nome: {rotulo: sketch_from_dict(s) for rotulo, s in grupos.items()}
+        for nome, grupos in dados.items()
+    }
@@ -1,13 +1,18 @@
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
-from matplotlib.ticker import PercentFormatter
-import scipy.stats as st
-from statsmodels.stats.proportion import proportion_confint
+import hashlib
+import json
 import os
-
-from abt import load_data
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from abt import load_data, load_distributions, load_rollups, data_version
+from distributions import build_distributions, box_stats, histogram, count
+from rollups import build_rollups, series
+from report import REPORT_PATH, build_report, write_report
+from metrics import (
+    kpi_stats, kpis_from_stats, kpi_intervals, build_cube, cube_kpis, elasticidade, elasticity
+)
 
 '''
 Estatísticas descritivas:
@@ -20,205 +25,369 @@ Estatísticas descritivas:
 - Outliers (ticket e entrega)
 - Intervalos de confiança (IC 95%)
 - Exportação opcional para CSV
-'''
-
-# ===============================================================
-# Preparação
-# ===============================================================
-
-# Carregar ABT
-df, items = load_data()
-
-# Criar pastas de saída
-os.makedirs("images", exist_ok=True)
-os.makedirs("output", exist_ok=True)
-
-# Filtros úteis
-df_confirmed = df[df["is_confirmed"] == 1].copy()
-df_delivered = df[(df["Delivery_Status"].str.lower().isin(["entregue", "atrasado"]))
-                  & df["D_Date"].notna()].copy()
-
-
-# ===============================================================
-# KPIs numéricos principais
-# ===============================================================
 
-kpis = {
-    "ticket_medio": df_confirmed["Total"].mean(),
-    "receita_total": df_confirmed["Total"].sum(),
-    "subtotal_total": df_confirmed["Subtotal"].sum(),
-    "desconto_medio_perc": df_confirmed["Discount"].sum() / df_confirmed["Subtotal"].sum(),
-    "take_rate_frete": df_confirmed["freight_share"].mean(),
-    "prazo_medio_entrega": df_delivered["delivery_lead_time"].mean(),
-    "taxa_atraso": df_delivered["is_late"].mean(),
-    "taxa_cancelamento": df["is_canceled"].mean()
-}
+Os gráficos são "jobs" (tipo, dados, parâmetros) desenhados num pool de
+processos (matplotlib não é thread-safe). Cada job tem um hash dos dados e
+parâmetros; se o hash é igual ao da última execução e a imagem existe, o
+gráfico não é refeito. O manifesto em output/charts_manifest.json registra
+o que foi regerado em cada execução.
 
-pd.DataFrame([kpis]).to_csv("output/kpis_gerais.csv", index=False)
+Histogramas e boxplots são desenhados a partir das distribuições
+pré-calculadas com a ABT (distributions.py): bins fixos, quartis, bigodes e
+uma amostra de outliers, com o mesmo tamanho para qualquer volume de pedidos.
+'''
 
+IMG_DIR = "images"
+OUT_DIR = "output"
+MANIFEST = os.path.join(OUT_DIR, "charts_manifest.json")
 
-# ===============================================================
-# Funções de Inferência Estatística
-# ===============================================================
-
-def ic_media(data, confidence=0.95):
-    if len(data) < 2:
-        return (np.nan, np.nan)
-    mean = data.mean()
-    sem = st.sem(data)
-    n = len(data)
-    ic = st.t.interval(confidence=confidence, df=n-1, loc=mean, scale=sem)
-    return ic
-
-
-def ic_proporcao(data, confidence=0.95):
-    total = len(data)
-    if total == 0:
-        return (np.nan, np.nan)
-    sucessos = data.sum()
-    ic = proportion_confint(sucessos, total, alpha=(1 - confidence), method="wilson")
-    return ic
-
-
-inferencias = {
-    "ticket_medio": {
-        "media": df_confirmed["Total"].mean(),
-        "IC95": ic_media(df_confirmed["Total"])
-    },
-    "prazo_medio_entrega": {
-        "media": df_delivered["delivery_lead_time"].mean(),
-        "IC95": ic_media(df_delivered["delivery_lead_time"])
-    },
-    "taxa_atraso": {
-        "proporcao": df_delivered["is_late"].mean(),
-        "IC95": ic_proporcao(df_delivered["is_late"])
-    },
-    "taxa_cancelamento": {
-        "proporcao": df["is_canceled"].mean(),
-        "IC95": ic_proporcao(df["is_canceled"])
-    }
-}
-
-pd.DataFrame(inferencias).to_csv("output/inferencias.csv")
+# incrementar quando o código de desenho mudar (força regerar tudo)
+CHART_VERSION = 2
 
 
 # ===============================================================
-# EDA: Histogramas e Boxplots
+# Funções de desenho (rodam nos processos do pool)
 # ===============================================================
 
-sns.set_style("whitegrid")
-
-def salvar_fig(nome):
-    plt.savefig(f"images/{nome}.png", dpi=150, bbox_inches="tight")
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    sns.set_style("whitegrid")
+    return plt, sns
+
+
+def _finalizar(plt, params, path):
+    plt.title(params["titulo"])
+    if "xlabel" in params:
+        plt.xlabel(params["xlabel"])
+    if "ylabel" in params:
+        plt.ylabel(params["ylabel"])
+    if params.get("rotacao"):
+        plt.xticks(rotation=params["rotacao"])
+    plt.savefig(path, dpi=params.get("dpi", 150), bbox_inches="tight")
     plt.close()
 
 
-# Histograma Ticket
-plt.figure(figsize=(10, 5))
-sns.histplot(df_confirmed["Total"], bins=50, kde=True)
-plt.title("Distribuição do Ticket (Pedidos Confirmados)")
-plt.xlabel("Valor Total (R$)")
-plt.ylabel("Contagem")
-salvar_fig("hist_ticket")
-
-
-# Boxplot Ticket
-plt.figure(figsize=(8, 4))
-sns.boxplot(x=df_confirmed["Total"])
-plt.title("Boxplot do Ticket (Pedidos Confirmados)")
-salvar_fig("box_ticket")
-
-
-# Histograma Desconto
-plt.figure(figsize=(10, 5))
-sns.histplot(df_confirmed["Discount"], bins=40, kde=True)
-plt.title("Distribuição do Desconto")
-salvar_fig("hist_discount")
-
-
-# Histograma Lead Time
-if not df_delivered.empty:
-    plt.figure(figsize=(10, 5))
-    sns.histplot(df_delivered["delivery_lead_time"], bins=40, kde=True)
-    plt.title("Distribuição do Prazo de Entrega")
-    plt.xlabel("Dias")
-    plt.ylabel("Contagem")
-    salvar_fig("hist_prazo_entrega")
-
-
-# ===============================================================
-# Sazonalidade
-# ===============================================================
-
-df_confirmed["mes"] = df_confirmed["Order_Date"].dt.to_period("M").astype(str)
+def plot_hist(data, params, path):
+    # data: bins já contados (distributions.histogram)
+    plt, sns = _pyplot()
+    plt.figure(figsize=params["figsize"])
+    bordas = np.append(data["inicio"], data["fim"].iloc[-1:])
+    sns.histplot(
+        data.assign(centro=(data["inicio"] + data["fim"]) / 2),
+        x="centro", weights="contagem", bins=bordas.tolist(), kde=params.get("kde", True),
+    )
+    _finalizar(plt, params, path)
+
+
+def plot_box(data, params, path):
+    # data: estatísticas do boxplot (distributions.box_stats)
+    plt, sns = _pyplot()
+    plt.figure(figsize=params["figsize"])
+    cor = sns.color_palette()[0]
+    plt.gca().bxp(
+        data, vert=False, showfliers=True, patch_artist=True,
+        boxprops={"facecolor": cor}, medianprops={"color": "black"},
+        flierprops={"marker": "d", "markerfacecolor": "black", "markersize": 4},
+    )
+    _finalizar(plt, params, path)
+
+
+def plot_linha(data, params, path):
+    plt, sns = _pyplot()
+    plt.figure(figsize=params["figsize"])
+    sns.lineplot(data=data, x=params["x"], y=params["y"], marker="o")
+    _finalizar(plt, params, path)
+
+
+def plot_barras(data, params, path):
+    plt, sns = _pyplot()
+    from matplotlib.ticker import PercentFormatter
+    plt.figure(figsize=params["figsize"])
+    ax = sns.barplot(data=data, x=params["x"], y=params["y"])
+    if params.get("percentual"):
+        ax.yaxis.set_major_formatter(PercentFormatter(1))
+    _finalizar(plt, params, path)
+
+
+PLOTTERS = {
+    "hist": plot_hist,
+    "box": plot_box,
+    "linha": plot_linha,
+    "barras": plot_barras,
+}
 
-receita_mensal = df_confirmed.groupby("mes")["Total"].sum().reset_index()
 
-plt.figure(figsize=(12, 5))
-sns.lineplot(data=receita_mensal, x="mes", y="Total", marker="o")
-plt.title("Receita Mensal")
-plt.xticks(rotation=45)
-salvar_fig("receita_mensal")
+def _render(job):
+    inicio = time.perf_counter()
+    PLOTTERS[job["tipo"]](job["data"], job["params"], job["path"])
+    return job["nome"], time.perf_counter() - inicio
 
 
 # ===============================================================
-# Performance Logística
+# Jobs, hash e execução
 # ===============================================================
 
-# Atraso por Serviço
-if not df_delivered.empty:
-    atraso_serv = df_delivered.groupby("Service")["is_late"].mean().reset_index()
-
-    plt.figure(figsize=(8, 4))
-    ax = sns.barplot(data=atraso_serv, x="Service", y="is_late")
-    ax.yaxis.set_major_formatter(PercentFormatter(1))
-    plt.title("Taxa de Atraso por Serviço")
-    salvar_fig("atraso_por_service")
-
+def chart_job(nome, tipo, data, **params):
+    return {
+        "nome": nome,
+        "tipo": tipo,
+        "data": data,
+        "params": params,
+        "path": os.path.join(IMG_DIR, f"{nome}.png"),
+    }
 
-# Atraso por Região
-if not df_delivered.empty:
-    atraso_reg = df_delivered.groupby("Region")["is_late"].mean().reset_index()
 
-    plt.figure(figsize=(8, 4))
-    ax = sns.barplot(data=atraso_reg, x="Region", y="is_late")
-    ax.yaxis.set_major_formatter(PercentFormatter(1))
-    plt.title("Taxa de Atraso por Região")
-    salvar_fig("atraso_por_regiao")
+def chart_hash(job):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps(
+        {"versao": CHART_VERSION, "tipo": job["tipo"], "params": job["params"]},
+        sort_keys=True, default=str
+    ).encode())
+    data = job["data"]
+    if not isinstance(data, (pd.Series, pd.DataFrame)):
+        # resumos (ex.: estatísticas do boxplot) entram no hash como JSON
+        h.update(json.dumps(data, sort_keys=True, default=float).encode())
+        return h.hexdigest()
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    h.update(json.dumps([[str(c), str(t)] for c, t in data.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _ler_manifesto():
+    if not os.path.exists(MANIFEST):
+        return {}
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f).get("graficos", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def run_charts(jobs, workers=None, force=False):
+    anterior = _ler_manifesto()
+    graficos = {}
+    pendentes = []
+    for job in jobs:
+        job_hash = chart_hash(job)
+        graficos[job["nome"]] = {"arquivo": job["path"], "hash": job_hash}
+        antigo = anterior.get(job["nome"], {})
+        if not force and antigo.get("hash") == job_hash and os.path.exists(job["path"]):
+            graficos[job["nome"]]["status"] = "inalterado"
+        else:
+            pendentes.append(job)
+
+    workers = min(workers or os.cpu_count() or 1, len(pendentes))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = list(pool.map(_render, pendentes))
+    else:
+        resultados = [_render(job) for job in pendentes]
+
+    for nome, segundos in resultados:
+        graficos[nome]["status"] = "regerado"
+        graficos[nome]["segundos"] = round(segundos, 3)
+
+    manifesto = {
+        "executado_em": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "regerados": [nome for nome, _ in resultados],
+        "graficos": graficos,
+    }
+    with open(MANIFEST, "w") as f:
+        json.dump(manifesto, f, indent=2, ensure_ascii=False)
+    return manifesto
 
 
 # ===============================================================
-# Elasticidade (Desconto vs Quantidade)
+# Preparação
 # ===============================================================
 
-items_confirmed = items.merge(
-    df_confirmed[["order_id", "Discount", "Subtotal"]],
-    left_on="Id",
-    right_on="order_id",
-    how="inner"
-)
-
-items_confirmed["discount_perc"] = items_confirmed["Discount"] / items_confirmed["Subtotal"]
-
-# bins usados pelo notebook original
-bins = [-0.01, 0, 0.05, 0.10, 0.15, 0.20, 1]
-labels = ["0%", "0-5%", "5-10%", "10-15%", "15-20%", ">20%"]
-
-items_confirmed["faixa"] = pd.cut(items_confirmed["discount_perc"], bins=bins, labels=labels)
-
-elastic = items_confirmed.groupby("faixa")["Quantity"].mean().reset_index()
-
-plt.figure(figsize=(10, 4))
-sns.barplot(data=elastic, x="faixa", y="Quantity")
-plt.title("Elasticidade: Quantidade Média por Faixa de Desconto")
-salvar_fig("elasticidade")
-
+def main(force=False):
+    # Carregar ABT e distribuições pré-calculadas (sem cache: calcula aqui)
+    df, items = load_data()
+    dist = load_distributions()
+    if dist is None:
+        dist = build_distributions(df)
+    rollups = load_rollups()
+    if rollups is None:
+        rollups = build_rollups(df, niveis=("mes",))
+
+    # Criar pastas de saída
+    os.makedirs(IMG_DIR, exist_ok=True)
+    os.makedirs(OUT_DIR, exist_ok=True)
+
+    # Filtros úteis
+    df_confirmed = df[df["is_confirmed"] == 1].copy()
+
+
+    # ===============================================================
+    # KPIs numéricos principais
+    # ===============================================================
+    # uma passada pela ABT (entregues = status entregue/atrasado)
+    stats = kpi_stats(df, delivered="status")
+    k = kpis_from_stats(stats)
+
+    kpis = {
+        "ticket_medio": k["ticket_medio"],
+        "receita_total": k["receita_total"],
+        "subtotal_total": k["subtotal_total"],
+        "desconto_medio_perc": k["desconto_medio"],
+        "take_rate_frete": k["take_rate_frete"],
+        "prazo_medio_entrega": k["prazo_medio_entrega"],
+        "taxa_atraso": k["taxa_atraso"],
+        "taxa_cancelamento": k["taxa_cancelamento"]
+    }
 
-# ===============================================================
-# Final
-# ===============================================================
+    pd.DataFrame([kpis]).to_csv(os.path.join(OUT_DIR, "kpis_gerais.csv"), index=False)
+
+
+    # ===============================================================
+    # Inferência Estatística
+    # ===============================================================
+
+    ics = kpi_intervals(stats)
+
+    inferencias = {
+        "ticket_medio": {
+            "media": k["ticket_medio"],
+            "IC95": ics["ticket_medio"]
+        },
+        "prazo_medio_entrega": {
+            "media": k["prazo_medio_entrega"],
+            "IC95": ics["prazo_medio_entrega"]
+        },
+        "taxa_atraso": {
+            "proporcao": k["taxa_atraso"],
+            "IC95": ics["taxa_atraso"]
+        },
+        "taxa_cancelamento": {
+            "proporcao": k["taxa_cancelamento"],
+            "IC95": ics["taxa_cancelamento"]
+        }
+    }
 
-print("EDA concluído com sucesso.")
-print("Gráficos salvos na pasta /images")
-print("KPIs salvos em output/kpis_gerais.csv")
-print("Inferências salvas em output/inferencias.csv")
+    pd.DataFrame(inferencias).to_csv(os.path.join(OUT_DIR, "inferencias.csv"))
+
+
+    # ===============================================================
+    # EDA: Histogramas e Boxplots
+    # ===============================================================
+
+    jobs = [
+        chart_job(
+            "hist_ticket", "hist", histogram(dist, "ticket", bins=50),
+            figsize=(10, 5), kde=True,
+            titulo="Distribuição do Ticket (Pedidos Confirmados)",
+            xlabel="Valor Total (R$)", ylabel="Contagem",
+        ),
+        chart_job(
+            "box_ticket", "box", box_stats(dist, "ticket"),
+            figsize=(8, 4), titulo="Boxplot do Ticket (Pedidos Confirmados)",
+        ),
+        chart_job(
+            "hist_discount", "hist", histogram(dist, "desconto", bins=40),
+            figsize=(10, 5), kde=True, titulo="Distribuição do Desconto",
+        ),
+    ]
+
+    entregues = count(dist, "prazo") > 0
+    if entregues:
+        jobs.append(chart_job(
+            "hist_prazo_entrega", "hist", histogram(dist, "prazo", bins=40),
+            figsize=(10, 5), kde=True,
+            titulo="Distribuição do Prazo de Entrega", xlabel="Dias", ylabel="Contagem",
+        ))
+
+
+    # ===============================================================
+    # Sazonalidade
+    # ===============================================================
+
+    # rollup mensal pré-calculado (receita dos pedidos confirmados)
+    receita_mensal = series(rollups, "mes", "receita_confirmada").rename(
+        columns={"rotulo": "mes", "receita_confirmada": "Total"}
+    )[["mes", "Total"]]
+
+    jobs.append(chart_job(
+        "receita_mensal", "linha", receita_mensal,
+        figsize=(12, 5), x="mes", y="Total", titulo="Receita Mensal", rotacao=45,
+    ))
+
+
+    # ===============================================================
+    # Performance Logística
+    # ===============================================================
+
+    cube = build_cube(df, dims=("Service", "Region"), delivered="status")
+
+    if entregues:
+        # Atraso por Serviço
+        atraso_serv = cube_kpis(cube, by=["Service"])["taxa_atraso"].rename("is_late").reset_index()
+        jobs.append(chart_job(
+            "atraso_por_service", "barras", atraso_serv,
+            figsize=(8, 4), x="Service", y="is_late", percentual=True,
+            titulo="Taxa de Atraso por Serviço",
+        ))
+
+        # Atraso por Região
+        atraso_reg = cube_kpis(cube, by=["Region"])["taxa_atraso"].rename("is_late").reset_index()
+        jobs.append(chart_job(
+            "atraso_por_regiao", "barras", atraso_reg,
+            figsize=(8, 4), x="Region", y="is_late", percentual=True,
+            titulo="Taxa de Atraso por Região",
+        ))
+
+
+    # ===============================================================
+    # Elasticidade (Desconto vs Quantidade)
+    # ===============================================================
+
+    elastic = elasticidade(items, df_confirmed)
+
+    # coeficientes log-log (quantidade × preço efetivo) por categoria
+    elasticity(items, df_confirmed, by=["Category"])["coeficientes"].to_csv(
+        os.path.join(OUT_DIR, "elasticidade_categoria.csv"), index=False
+    )
+
+    jobs.append(chart_job(
+        "elasticidade", "barras", elastic,
+        figsize=(10, 4), x="faixa", y="Quantity",
+        titulo="Elasticidade: Quantidade Média por Faixa de Desconto",
+    ))
+
+
+    # ===============================================================
+    # Bundle do relatório (primeira renderização do dashboard)
+    # ===============================================================
+    # definições do app (entregues = pedidos com prazo), não as do EDA
+    write_report(build_report(df, items, data_version(), dist, rollups))
+
+
+    # ===============================================================
+    # Gráficos (em paralelo, só o que mudou)
+    # ===============================================================
+
+    manifesto = run_charts(jobs, force=force)
+
+
+    # ===============================================================
+    # Final
+    # ===============================================================
+
+    print("EDA concluído com sucesso.")
+    print(f"Gráficos salvos na pasta /{IMG_DIR} "
+          f"({len(manifesto['regerados'])} regerados de {len(jobs)})")
+    print(f"Manifesto dos gráficos em {MANIFEST}")
+    print(f"KPIs salvos em {OUT_DIR}/kpis_gerais.csv")
+    print(f"Inferências salvas em {OUT_DIR}/inferencias.csv")
+    print(f"Elasticidade por categoria salva em {OUT_DIR}/elasticidade_categoria.csv")
+    print(f"Bundle do dashboard salvo em {REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    import sys
+    main(force="--force" in sys.argv)
@@ -0,0 +1,227 @@
+from functools import partial
+
+'''
+Figuras Plotly das Análises Avançadas do dashboard:
+- Cada figura recebe só dados agregados ou resumidos (tabelas de
+  report.chart_tables: cubo de KPIs, somas por grupo, quartis e outliers do
+  sketch, rollups): nenhuma linha de pedido chega ao Plotly
+- Traços de pontos (outliers do boxplot, séries longas) usam WebGL a partir
+  de WEBGL_POINTS pontos
+- figure_specs() devolve o JSON de cada figura, com o total limitado a
+  max_bytes (o que vai ao navegador a cada execução, qualquer que seja o
+  número de pedidos): figuras acima da sua parte do orçamento perdem
+  pontos (barras ficam com os maiores valores, séries com períodos em
+  intervalos regulares, outliers com uma amostra regular)
+- app.py guarda o JSON em cache por (versão dos dados, filtros)
+- plotly é importado dentro de cada figura: importar este módulo não
+  carrega plotly, só montar as figuras
+'''
+
+# limite do JSON de todas as figuras de uma execução
+MAX_PAYLOAD_BYTES = 512 * 1024
+
+# a partir daqui os pontos viram traço WebGL
+WEBGL_POINTS = 1000
+
+
+# ================================
+# FIGURAS
+# ================================
+
+def fig_confirmacao(conv):
+    import plotly.express as px
+
+    fig_conv = px.bar(
+        conv,
+        x="Payment_Method",
+        y="is_confirmed",
+        text="is_confirmed",
+        labels={"is_confirmed": "Taxa de Confirmação (%)"},
+        title="Taxa de Confirmação por Método de Pagamento"
+    )
+    fig_conv.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
+    return fig_conv
+
+
+def fig_prazo_servico(lead):
+    import plotly.express as px
+
+    return px.bar(
+        lead,
+        x="Service",
+        y="delivery_lead_time",
+        title="Tempo Médio de Entrega por Serviço",
+        labels={"delivery_lead_time": "Dias"}
+    )
+
+
+def fig_box_prazo(caixas):
+    # quartis, bigodes e outliers pré-calculados: a figura não carrega os
+    # prazos de todos os pedidos
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    cor = px.colors.qualitative.Plotly[0]
+    n_outliers = sum(len(c["fliers"]) for c in caixas)
+    pontos = go.Scattergl if n_outliers > WEBGL_POINTS else go.Scatter
+
+    fig_box = go.Figure()
+    fig_box.add_trace(go.Box(
+        x=[c["label"] for c in caixas],
+        q1=[c["q1"] for c in caixas],
+        median=[c["med"] for c in caixas],
+        q3=[c["q3"] for c in caixas],
+        lowerfence=[c["whislo"] for c in caixas],
+        upperfence=[c["whishi"] for c in caixas],
+        marker_color=cor,
+        name="Prazo",
+    ))
+    fig_box.add_trace(pontos(
+        x=[c["label"] for c in caixas for _ in c["fliers"]],
+        y=[v for c in caixas for v in c["fliers"]],
+        mode="markers",
+        marker={"color": cor, "size": 4},
+        name="Outliers",
+    ))
+    fig_box.update_layout(
+        title="Boxplot do Prazo de Entrega por Serviço",
+        xaxis_title="Service",
+        yaxis_title="Dias",
+        showlegend=False,
+    )
+    return fig_box
+
+
+def fig_receita(receita, coluna, titulo, labels=None):
+    import plotly.express as px
+
+    return px.bar(receita, x=coluna, y="Total_Item", title=titulo, labels=labels or {})
+
+
+def fig_sazonalidade(sazonalidade, coluna, titulo):
+    import plotly.express as px
+
+    return px.line(
+        sazonalidade,
+        x="month",
+        y="Total",
+        color=coluna,
+        title=titulo,
+        render_mode="webgl" if len(sazonalidade) > WEBGL_POINTS else "svg",
+    )
+
+
+# ================================
+# REDUÇÃO DE PONTOS
+# ================================
+# Cada redutor recebe a tabela da figura e o número máximo de pontos.
+
+def _maiores(tabela, n, y):
+    # barras com os n maiores valores, na ordem original
+    return tabela.loc[tabela[y].nlargest(n).index.sort_values()]
+
+
+def _periodos(tabela, n, x):
+    # até n pontos no total: mesmos períodos, em intervalos regulares, em todas as séries
+    periodos = tabela[x].drop_duplicates().sort_values().to_numpy()
+    por_serie = max(n * len(periodos) // max(len(tabela), 1), 2)
+    if por_serie >= len(periodos):
+        return tabela
+    manter = periodos[[round(i * (len(periodos) - 1) / (por_serie - 1)) for i in range(por_serie)]]
+    return tabela[tabela[x].isin(manter)]
+
+
+def _outliers(caixas, n):
+    # amostra regular dos outliers, proporcional ao tamanho de cada grupo
+    total = sum(len(c["fliers"]) for c in caixas)
+    if total <= n:
+        return caixas
+    saida = []
+    for c in caixas:
+        k = len(c["fliers"]) * n // total
+        passo = len(c["fliers"]) / k if k else 0
+        saida.append({**c, "fliers": [c["fliers"][int(i * passo)] for i in range(k)]})
+    return saida
+
+
+def _pontos(tabela):
+    if isinstance(tabela, list):
+        return sum(len(c["fliers"]) for c in tabela)
+    return len(tabela)
+
+
+# nome -> (tabela de report.chart_tables, figura, redutor), na ordem do app
+FIGURES = {
+    "confirmacao": ("confirmacao", fig_confirmacao, partial(_maiores, y="is_confirmed")),
+    "prazo_servico": ("prazo_servico", fig_prazo_servico, partial(_maiores, y="delivery_lead_time")),
+    "caixas_prazo": ("caixas_prazo", fig_box_prazo, _outliers),
+    "receita_categoria": (
+        "receita_categoria",
+        partial(fig_receita, coluna="Category", titulo="Receita por Categoria",
+                labels={"Total_Item": "Receita (R$)"}),
+        partial(_maiores, y="Total_Item"),
+    ),
+    "receita_subcategoria": (
+        "receita_subcategoria",
+        partial(fig_receita, coluna="Subcategory", titulo="Receita por Subcategoria",
+                labels={"Total_Item": "Receita (R$)"}),
+        partial(_maiores, y="Total_Item"),
+    ),
+    "receita_uf": (
+        "receita_uf",
+        partial(fig_receita, coluna="UF", titulo="Receita por Estado"),
+        partial(_maiores, y="Total_Item"),
+    ),
+    "receita_regiao": (
+        "receita_regiao",
+        partial(fig_receita, coluna="Region", titulo="Receita por Região"),
+        partial(_maiores, y="Total_Item"),
+    ),
+    "sazonalidade_uf": (
+        "sazonalidade_uf",
+        partial(fig_sazonalidade, coluna="UF", titulo="Sazonalidade de Receita por UF"),
+        partial(_periodos, x="month"),
+    ),
+    "sazonalidade_regiao": (
+        "sazonalidade_regiao",
+        partial(fig_sazonalidade, coluna="Region", titulo="Sazonalidade de Receita por Região"),
+        partial(_periodos, x="month"),
+    ),
+}
+
+
+# ================================
+# JSON COM LIMITE DE TAMANHO
+# ================================
+
+def _reduzir(spec, tabela, figura, redutor, limite):
+    # metade dos pontos por vez até caber; o layout sozinho é o piso
+    n = _pontos(tabela)
+    while len(spec) > limite and n > 1:
+        n //= 2
+        spec = figura(redutor(tabela, n)).to_json()
+    return spec
+
+
+def figure_specs(tabelas, max_bytes=MAX_PAYLOAD_BYTES):
+    # nome -> JSON da figura; soma dos tamanhos <= max_bytes sempre que o
+    # layout das figuras couber. Acima do limite, o que sobra depois dos
+    # pisos (layout e um ponto de cada figura) é dividido por igual, e o
+    # que as figuras pequenas não usam passa para as maiores.
+    specs = {nome: figura(tabelas[chave]).to_json() for nome, (chave, figura, _) in FIGURES.items()}
+    if sum(len(spec) for spec in specs.values()) <= max_bytes:
+        return specs
+
+    pisos = {
+        nome: len(figura(redutor(tabelas[chave], 1)).to_json())
+        for nome, (chave, figura, redutor) in FIGURES.items()
+    }
+    restante = max_bytes - sum(pisos.values())
+    ordem = sorted(specs, key=lambda nome: len(specs[nome]) - pisos[nome])
+    for i, nome in enumerate(ordem):
+        limite = pisos[nome] + max(restante, 0) // (len(ordem) - i)
+        if len(specs[nome]) > limite:
+            chave, figura, redutor = FIGURES[nome]
+            specs[nome] = _reduzir(specs[nome], tabelas[chave], figura, redutor, limite)
+        restante -= len(specs[nome]) - pisos[nome]
+    return specs
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+'''
+Joins por posição para o modelo estrela dos pedidos:
+- Todas as tabelas de pedido (FACT, Delivery, Customer, Shopping) usam o
+  mesmo Id inteiro e denso; em vez de um hash join por merge, a chave vira
+  uma tabela de consulta Id -> posição e as colunas da direita são copiadas
+  com take (uma cópia por coluna, sem tabela hash nem reordenação)
+- Chaves inteiras esparsas mas ordenadas usam busca binária; outras chaves
+  únicas usam o índice hash do pandas
+- Se a chave da direita não é única o join não é 1:1 e cai no merge normal
+- O resultado não copia as colunas de entrada: as colunas da esquerda (e as
+  da direita, quando as chaves já estão alinhadas) são compartilhadas
+- key_index() é reutilizável: elasticidade e o app consultam as posições
+  dos pedidos sem refazer merges
+'''
+
+# tabela densa só se o intervalo de ids não for muito maior que o número
+# de linhas (memória da tabela = intervalo × 8 bytes)
+DENSE_MAX_SPAN = 4
+
+
+# ================================
+# ÍNDICE CHAVE -> POSIÇÃO
+# ================================
+
+def key_index(chaves):
+    # None quando a chave tem repetidos (não existe posição única)
+    valores = pd.Series(chaves).to_numpy()
+    n = len(valores)
+
+    if valores.dtype.kind in "iu":
+        valores = valores.astype("int64")
+        if n == 0:
+            return {"tipo": "denso", "base": 0, "tabela": np.empty(0, dtype=np.int64), "n": 0}
+
+        base, topo = valores.min(), valores.max()
+        if topo - base + 1 <= DENSE_MAX_SPAN * n:
+            tabela = np.full(topo - base + 1, -1, dtype=np.int64)
+            posicoes = np.arange(n, dtype=np.int64)
+            tabela[valores - base] = posicoes
+            # com repetidos a última escrita vence e alguma posição se perde
+            if not (tabela[valores - base] == posicoes).all():
+                return None
+            return {"tipo": "denso", "base": base, "tabela": tabela, "n": n}
+
+        if (valores[1:] > valores[:-1]).all():
+            return {"tipo": "ordenado", "valores": valores, "n": n}
+
+    indice = pd.Index(valores)
+    if not indice.is_unique:
+        return None
+    return {"tipo": "hash", "indice": indice, "n": n}
+
+
+def _inteiros(chaves):
+    # chaves como int64 + máscara das que são inteiros válidos (NaN -> fora)
+    valores = pd.Series(chaves).to_numpy()
+    if valores.dtype.kind in "iu":
+        return valores.astype("int64"), np.ones(len(valores), dtype=bool)
+    if valores.dtype.kind == "f":
+        ok = np.isfinite(valores) & (valores == np.floor(valores))
+        return np.where(ok, valores, 0).astype("int64"), ok
+    return None, None
+
+
+def positions(indice, chaves):
+    # posição de cada chave na tabela indexada (-1 se não existe)
+    if indice["tipo"] == "hash":
+        return indice["indice"].get_indexer(pd.Series(chaves).to_numpy())
+
+    valores, ok = _inteiros(chaves)
+    if valores is None:
+        return np.full(len(chaves), -1, dtype=np.int64)
+    saida = np.full(len(valores), -1, dtype=np.int64)
+
+    if indice["tipo"] == "denso":
+        k = valores - indice["base"]
+        ok &= (k >= 0) & (k < len(indice["tabela"]))
+        saida[ok] = indice["tabela"][k[ok]]
+        return saida
+
+    ordenados = indice["valores"]
+    if len(ordenados) == 0:
+        return saida
+    p = np.minimum(np.searchsorted(ordenados, valores), len(ordenados) - 1)
+    ok &= ordenados[p] == valores
+    saida[ok] = p[ok]
+    return saida
+
+
+# ================================
+# JOIN
+# ================================
+
+def take_column(serie, posicoes):
+    # posição -1 vira NaN/NaT (mesmo resultado do merge com how="left")
+    if (posicoes < 0).any():
+        return serie.array.take(posicoes, allow_fill=True)
+    return serie.array.take(posicoes)
+
+
+def join(left, right, left_on, right_on=None, how="left", indice=None):
+    right_on = right_on or left_on
+    colunas = [c for c in right.columns if not (c == right_on == left_on)]
+
+    if indice is None:
+        indice = key_index(right[right_on])
+    if indice is None or set(colunas) & set(left.columns):
+        # 1:N ou colunas em conflito (sufixos): merge normal
+        return left.merge(right, left_on=left_on, right_on=right_on, how=how)
+
+    posicoes = positions(indice, left[left_on])
+    if how == "inner":
+        manter = posicoes >= 0
+        left, posicoes = left[manter], posicoes[manter]
+    elif how != "left":
+        raise ValueError(f"join posicional não suporta how={how!r}")
+
+    # chaves já alinhadas (mesmos ids na mesma ordem): nem o take é preciso
+    alinhado = len(posicoes) == len(right) and (posicoes == np.arange(len(right))).all()
+    colunas_novas = {
+        col: right[col].array if alinhado else take_column(right[col], posicoes)
+        for col in colunas
+    }
+    # sem cópia das colunas de entrada (o resultado compartilha memória com
+    # left e, se alinhado, com right; na ABT ambas são tabelas temporárias)
+    return pd.DataFrame(
+        {**{col: left[col].array for col in left.columns}, **colunas_novas},
+        copy=False
+    )
@@ -1,7 +1,8 @@
 import numpy as np
 import pandas as pd
-import scipy.stats as st
-from statsmodels.stats.proportion import proportion_confint
+
+from joins import key_index, positions
+from profiling import profiled
 
 '''
 Aqui fazKPI financeiros
@@ -16,70 +17,631 @@ Aqui fazKPI financeiros
 # ================================
 # INTERVALOS DE CONFIANÇA
 # ================================
+# Os intervalos saem de estatísticas suficientes (n, soma, M2 / sucessos),
+# com M2 = soma dos quadrados dos desvios em relação à média (duas
+# passadas; conjuntos se combinam pela fórmula de Chan, como em online.py).
+# Soma dos quadrados crua perde toda a precisão quando os valores são
+# grandes perto da sua dispersão (ex.: 1e7 + centavos). Quem já tem essas
+# estatísticas (kpi_stats, cubo) não precisa varrer a coluna de novo. As
+# versões *_batch recebem arrays (um valor por grupo) e calculam todos os
+# intervalos numa chamada vetorizada.
+
+def _momentos(data):
+    valores = np.asarray(pd.Series(data).dropna(), dtype="float64")
+    if not len(valores):
+        return 0, 0.0, 0.0
+    desvios = valores - valores.mean()
+    return len(valores), valores.sum(), np.dot(desvios, desvios)
+
+
+def ic_media_moments(n, media, variancia, confidence=0.95):
+    # intervalo t por grupo a partir de média e variância amostral;
+    # n < 2 ou variância zero -> NaN (como o scipy)
+    import scipy.stats as st  # só aqui: importar scipy custa ~0,5s na partida
+
+    n = np.asarray(n, dtype="float64")
+    media = np.asarray(media, dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sem = np.sqrt(np.asarray(variancia, dtype="float64") / n)
+        t = st.t.ppf((1 + confidence) / 2, n - 1)
+    valido = (n >= 2) & (sem > 0)
+    return (
+        np.where(valido, media - t * sem, np.nan),
+        np.where(valido, media + t * sem, np.nan),
+    )
+
+
+def ic_media_batch(n, soma, m2, confidence=0.95):
+    n = np.asarray(n, dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.asarray(soma, dtype="float64") / n
+        var = np.asarray(m2, dtype="float64") / (n - 1)
+    return ic_media_moments(n, mean, var, confidence)
+
+
+def ic_proporcao_batch(sucessos, total, confidence=0.95):
+    # intervalo de Wilson por grupo (mesma fórmula do statsmodels); total 0 -> NaN
+    import scipy.stats as st
+
+    sucessos = np.asarray(sucessos, dtype="float64")
+    total = np.asarray(total, dtype="float64")
+    z = st.norm.isf((1 - confidence) / 2)
+    z2 = z ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = sucessos / total
+        denom = 1 + z2 / total
+        centro = (p + z2 / (2 * total)) / denom
+        raio = z * np.sqrt(p * (1 - p) / total + z2 / (4 * total ** 2)) / denom
+    valido = total > 0
+    return (
+        np.where(valido, centro - raio, np.nan),
+        np.where(valido, centro + raio, np.nan),
+    )
+
+
+def escalar(ic):
+    # IC em array numpy (um grupo) -> tupla de floats
+    return tuple(float(v) for v in ic)
+
+
+def ic_media_stats(n, soma, m2, confidence=0.95):
+    return escalar(ic_media_batch(n, soma, m2, confidence))
 
+
+def ic_proporcao_stats(sucessos, total, confidence=0.95):
+    return escalar(ic_proporcao_batch(sucessos, total, confidence))
+
+
+@profiled("metrics.ic_media")
 def ic_media(data, confidence=0.95):
-    data = pd.Series(data).dropna()
-    if len(data) < 2:
-        return (np.nan, np.nan)
-    n = len(data)
-    mean = data.mean()
-    sem = st.sem(data)
-    ic = st.t.interval(confidence, n - 1, loc=mean, scale=sem)
-    return ic
+    return ic_media_stats(*_momentos(data), confidence=confidence)
 
 
+@profiled("metrics.ic_proporcao")
 def ic_proporcao(data, confidence=0.95):
-    data = pd.Series(data).dropna()
-    total = len(data)
-    if total == 0:
-        return (np.nan, np.nan)
-    sucessos = data.sum()
-    ic = proportion_confint(
-        count=sucessos,
-        nobs=total,
-        alpha=(1 - confidence),
-        method="wilson"
-    )
-    return ic
+    n, sucessos, _ = _momentos(data)
+    return ic_proporcao_stats(sucessos, n, confidence=confidence)
+
+
+# ================================
+# ICs POR GRUPO E BOOTSTRAP
+# ================================
+# Grupos chegam como códigos inteiros 0..n_grupos-1 (ex.: cat.codes,
+# month_key deslocado); -1 e valores NaN ficam de fora.
+
+# memória máxima de um bloco de reamostragens (índices + valores sorteados)
+BOOTSTRAP_BLOCK_BYTES = 64 * 2**20
+
+# reamostragens de no máximo tantas linhas por grupo (bootstrap m de n)
+BOOTSTRAP_MAX_ROWS = 10_000
+
+
+def _validos(codigos, valores):
+    codigos = np.asarray(codigos, dtype="int64")
+    valores = np.asarray(valores, dtype="float64")
+    ok = (codigos >= 0) & ~np.isnan(valores)
+    return codigos[ok], valores[ok]
+
+
+def group_moments(codigos, valores, n_grupos):
+    # (n, soma, M2) por grupo, via bincount (duas passadas: média, depois desvios)
+    codigos, valores = _validos(codigos, valores)
+    n = np.bincount(codigos, minlength=n_grupos)
+    soma = np.bincount(codigos, weights=valores, minlength=n_grupos)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media = soma / n
+    desvios = valores - media[codigos]
+    return n, soma, np.bincount(codigos, weights=desvios * desvios, minlength=n_grupos)
+
+
+def ic_media_grupos(codigos, valores, n_grupos, confidence=0.95):
+    return ic_media_batch(*group_moments(codigos, valores, n_grupos), confidence)
+
+
+def ic_proporcao_grupos(codigos, valores, n_grupos, confidence=0.95):
+    n, sucessos, _ = group_moments(codigos, valores, n_grupos)
+    return ic_proporcao_batch(sucessos, n, confidence)
+
+
+def bootstrap_ic(valores, codigos=None, n_grupos=None, n_boot=1000, confidence=0.95,
+                 seed=None, block_bytes=BOOTSTRAP_BLOCK_BYTES, max_rows=BOOTSTRAP_MAX_ROWS):
+    # IC percentil da média por bootstrap, para todos os grupos de uma vez.
+    # As reamostragens são matrizes de índices (réplicas × linhas), sorteadas
+    # dentro de cada grupo e geradas em blocos de no máximo block_bytes.
+    # Grupos com mais de max_rows linhas sorteiam só max_rows (m de n) e os
+    # desvios em torno da média do grupo são reescalados por sqrt(m/n): o
+    # custo fica em O(n_boot · Σ min(n_grupo, max_rows)), qualquer que seja n.
+    um_grupo = codigos is None
+    if um_grupo:
+        codigos, n_grupos = np.zeros(len(valores), dtype="int64"), 1
+    codigos, valores = _validos(codigos, valores)
+
+    ordem = np.argsort(codigos, kind="stable")
+    valores = valores[ordem]
+    tamanhos = np.bincount(codigos, minlength=n_grupos)
+    inicios = np.concatenate([[0], np.cumsum(tamanhos)[:-1]])
+    sorteados = np.minimum(tamanhos, max_rows)
+    inicios_sorteio = np.concatenate([[0], np.cumsum(sorteados)[:-1]])
+
+    com_dados = np.flatnonzero(tamanhos)
+    medias = np.full((n_boot, n_grupos), np.nan)
+    if len(valores):
+        rng = np.random.default_rng(seed)
+        # início e tamanho do grupo de cada posição sorteada (grupos em ordem)
+        grupo_linha = np.repeat(np.arange(n_grupos), sorteados)
+        inicio_linha = inicios[grupo_linha]
+        tamanho_linha = tamanhos[grupo_linha]
+
+        # float (sorteio) + int64 (índice) + float (valor) por célula
+        por_bloco = max(1, int(block_bytes // (24 * len(grupo_linha))))
+        for b in range(0, n_boot, por_bloco):
+            k = min(por_bloco, n_boot - b)
+            sorteio = rng.random((k, len(grupo_linha)))
+            indices = inicio_linha + (sorteio * tamanho_linha).astype("int64")
+            somas = np.add.reduceat(valores[indices], inicios_sorteio[com_dados], axis=1)
+            medias[b:b + k, com_dados] = somas / sorteados[com_dados]
+
+        grandes = np.flatnonzero(tamanhos > max_rows)
+        if len(grandes):
+            media = np.add.reduceat(valores, inicios[com_dados])[np.searchsorted(com_dados, grandes)]
+            media = media / tamanhos[grandes]
+            escala = np.sqrt(sorteados[grandes] / tamanhos[grandes])
+            medias[:, grandes] = media + (medias[:, grandes] - media) * escala
+
+    alpha = 1 - confidence
+    inf, sup = np.full(n_grupos, np.nan), np.full(n_grupos, np.nan)
+    if len(com_dados):
+        inf[com_dados], sup[com_dados] = np.quantile(
+            medias[:, com_dados], [alpha / 2, 1 - alpha / 2], axis=0
+        )
+    if um_grupo:
+        return float(inf[0]), float(sup[0])
+    return inf, sup
 
 
 # ================================
 # KPIs NUMÉRICOS
 # ================================
+# kpi_stats() percorre a ABT uma vez e guarda, para cada medida, contagem,
+# soma e M2 dentro da sua máscara (confirmados, entregues ou todos). Os
+# KPIs e os ICs são derivados dessas estatísticas, que se combinam entre
+# blocos/partições (merge_stats: somas para n e soma, Chan para M2).
+
+# medida -> (coluna, máscara)
+KPI_MEASURES = {
+    "ticket": ("Total", "confirmed"),
+    "subtotal": ("Subtotal", "confirmed"),
+    "desconto": ("Discount", "confirmed"),
+    "frete": ("freight_share", "confirmed"),
+    "prazo": ("delivery_lead_time", "delivered"),
+    "atraso": ("is_late", "delivered"),
+    "cancelamento": ("is_canceled", "all"),
+    "confirmacao": ("is_confirmed", "all"),
+    "receita_bruta": ("Total", "all"),
+}
+
+STATUS_ENTREGUE = ("entregue", "atrasado")
+
+
+def _lower_isin(serie, valores):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        alvo = np.append(serie.cat.categories.str.lower().isin(valores), False)
+        return alvo[serie.cat.codes.to_numpy()]
+    return serie.str.lower().isin(valores).to_numpy()
+
 
-def compute_kpis(df):
-    df_confirmed = df[df["is_confirmed"] == 1]
-    df_delivered = df[(df["D_Date"].notna()) & df["delivery_lead_time"].notna()]
+def masks(df, delivered="lead_time"):
+    # delivered="lead_time": tem D_Date e prazo calculado (dashboard)
+    # delivered="status": Delivery_Status entregue/atrasado e D_Date (EDA)
+    tem_data = df["D_Date"].notna().to_numpy()
+    if delivered == "status":
+        entregue = tem_data & _lower_isin(df["Delivery_Status"], STATUS_ENTREGUE)
+    else:
+        entregue = tem_data & df["delivery_lead_time"].notna().to_numpy()
+    return {
+        "all": np.ones(len(df), dtype=bool),
+        "confirmed": df["is_confirmed"].to_numpy() == 1,
+        "delivered": entregue,
+    }
+
+
+@profiled("metrics.kpi_stats")
+def kpi_stats(df, delivered="lead_time"):
+    mascaras = masks(df, delivered)
+    stats = {"n": len(df)}
+    for nome, (coluna, mask) in KPI_MEASURES.items():
+        valores = df[coluna].to_numpy(dtype="float64", na_value=np.nan)
+        ok = mascaras[mask] & ~np.isnan(valores)
+        stats[f"{nome}_n"], stats[f"{nome}_sum"], stats[f"{nome}_m2"] = _momentos(valores[ok])
+    return stats
+
+
+def merge_stats(a, b):
+    saida = {"n": a["n"] + b["n"]}
+    for nome in KPI_MEASURES:
+        na, nb = a[f"{nome}_n"], b[f"{nome}_n"]
+        n = na + nb
+        saida[f"{nome}_n"] = n
+        saida[f"{nome}_sum"] = a[f"{nome}_sum"] + b[f"{nome}_sum"]
+        saida[f"{nome}_m2"] = a[f"{nome}_m2"] + b[f"{nome}_m2"]
+        if na and nb:
+            delta = b[f"{nome}_sum"] / nb - a[f"{nome}_sum"] / na
+            saida[f"{nome}_m2"] += delta * delta * na * nb / n
+    return saida
+
+
+def _razao(num, den):
+    if np.ndim(den) == 0:
+        return num / den if den else np.nan
+    # versão vetorizada (uma razão por célula do cubo)
+    num = np.asarray(num, dtype="float64")
+    den = np.asarray(den, dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den != 0, num / den, np.nan)
 
+
+def kpis_from_stats(stats):
     return {
-        "receita_total": df_confirmed["Total"].sum(),
-        "ticket_medio": df_confirmed["Total"].mean(),
-        "subtotal_total": df_confirmed["Subtotal"].sum(),
-        "desconto_medio": df_confirmed["Discount"].sum() / df_confirmed["Subtotal"].sum(),
-        "take_rate_frete": df_confirmed["freight_share"].mean(),
-        "prazo_medio_entrega": df_delivered["delivery_lead_time"].mean(),
-        "taxa_atraso": df_delivered["is_late"].mean(),
-        "taxa_cancelamento": df["is_canceled"].mean(),
-        "qtd_pedidos": len(df)
+        "receita_total": stats["ticket_sum"],
+        "ticket_medio": _razao(stats["ticket_sum"], stats["ticket_n"]),
+        "subtotal_total": stats["subtotal_sum"],
+        "desconto_medio": _razao(stats["desconto_sum"], stats["subtotal_sum"]),
+        "take_rate_frete": _razao(stats["frete_sum"], stats["frete_n"]),
+        "prazo_medio_entrega": _razao(stats["prazo_sum"], stats["prazo_n"]),
+        "taxa_atraso": _razao(stats["atraso_sum"], stats["atraso_n"]),
+        "taxa_cancelamento": _razao(stats["cancelamento_sum"], stats["cancelamento_n"]),
+        "qtd_pedidos": stats["n"]
+    }
+
+
+def _ic_medida(stats, nome, confidence=0.95):
+    return ic_media_batch(
+        stats[f"{nome}_n"], stats[f"{nome}_sum"], stats[f"{nome}_m2"], confidence
+    )
+
+
+def kpi_intervals(stats, confidence=0.95):
+    # stats escalares (kpi_stats) -> tuplas; arrays (um grupo por posição) -> arrays
+    ics = {
+        "ticket_medio": _ic_medida(stats, "ticket", confidence),
+        "prazo_medio_entrega": _ic_medida(stats, "prazo", confidence),
+        "taxa_atraso": ic_proporcao_batch(stats["atraso_sum"], stats["atraso_n"], confidence),
+        "taxa_cancelamento": ic_proporcao_batch(
+            stats["cancelamento_sum"], stats["cancelamento_n"], confidence
+        ),
     }
+    if np.ndim(stats["n"]) == 0:
+        return {kpi: escalar(ic) for kpi, ic in ics.items()}
+    return ics
+
+
+@profiled("metrics.compute_kpis")
+def compute_kpis(df, delivered="lead_time"):
+    return kpis_from_stats(kpi_stats(df, delivered))
+
+
+# ================================
+# CUBO DE KPIs
+# ================================
+# Um único groupby gera as estatísticas suficientes de kpi_stats() para
+# cada combinação de Service × Region × UF × Payment_Method × mês. Contagens
+# e somas são aditivas e o M2 de cada célula se combina pela fórmula de
+# Chan, então qualquer recorte (rollup) ou filtro é respondido a partir das
+# células do cubo, sem voltar à ABT.
+
+CUBE_DIMS = ("Service", "Region", "UF", "Payment_Method", "month")
+
+
+def month_key(datas):
+    # meses desde 1970-01 como inteiro (NaT -> -1), sem conversão para texto
+    valores = pd.Series(datas).to_numpy(dtype="datetime64[ns]")
+    chave = valores.astype("datetime64[M]").astype("int64")
+    return np.where(np.isnat(valores), -1, chave).astype("int32")
+
+
+def month_label(chaves):
+    chaves = np.asarray(chaves)
+    rotulos = chaves.astype("datetime64[M]").astype(str)
+    return np.where(chaves < 0, "", rotulos)
+
+
+def _stat_columns(df, delivered="lead_time"):
+    mascaras = masks(df, delivered)
+    cols = {"n": np.ones(len(df), dtype="int64")}
+    for nome, (coluna, mask) in KPI_MEASURES.items():
+        valores = df[coluna].to_numpy(dtype="float64", na_value=np.nan)
+        ok = mascaras[mask] & ~np.isnan(valores)
+        v = np.where(ok, valores, 0.0)
+        cols[f"{nome}_n"] = ok.astype("int64")
+        cols[f"{nome}_sum"] = v
+        # cada linha é um conjunto de 0 ou 1 valor: M2 = 0
+        cols[f"{nome}_m2"] = np.zeros(len(df))
+    return pd.DataFrame(cols, index=df.index)
+
+
+def _agregar(celulas, grupos):
+    # soma as células de cada grupo (`grupos` = celulas.groupby(...)); o M2
+    # sai da fórmula de Chan para vários conjuntos:
+    # M2 = Σ M2_i + Σ n_i·(média_i − média do grupo)²
+    saida = grupos.sum()
+    codigo = grupos.ngroup().to_numpy(dtype="float64")
+    dentro = ~np.isnan(codigo)
+    codigo = codigo[dentro].astype("int64")
+    for nome in KPI_MEASURES:
+        n = celulas[f"{nome}_n"].to_numpy(dtype="float64")[dentro]
+        soma = celulas[f"{nome}_sum"].to_numpy(dtype="float64")[dentro]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            media_grupo = saida[f"{nome}_sum"].to_numpy(dtype="float64") / saida[f"{nome}_n"].to_numpy()
+            desvio = np.where(n > 0, soma / n - media_grupo[codigo], 0.0)
+        saida[f"{nome}_m2"] += np.bincount(codigo, weights=n * desvio * desvio, minlength=len(saida))
+    return saida
+
+
+@profiled("metrics.build_cube")
+def build_cube(df, dims=CUBE_DIMS, delivered="lead_time"):
+    chaves = [
+        pd.Series(month_key(df["Order_Date"]), index=df.index, name="month")
+        if dim == "month" else df[dim]
+        for dim in dims
+    ]
+    linhas = _stat_columns(df, delivered)
+    return _agregar(linhas, linhas.groupby(chaves, observed=True, dropna=False))
+
+
+def rollup(cube, by=(), dropna=False):
+    # combina as células mantendo só as dimensões de `by` (vazio = total geral)
+    by = list(by)
+    if not by:
+        if cube.empty:
+            return cube.sum().to_frame().T
+        total = _agregar(cube, cube.groupby(np.zeros(len(cube), dtype="int64")))
+        return total.reset_index(drop=True)
+    return _agregar(cube, cube.groupby(level=by, observed=True, dropna=dropna))
+
+
+def slice_cube(cube, **filtros):
+    # filtros: dimensão=valor ou dimensão=[valores]
+    mask = np.ones(len(cube), dtype=bool)
+    for dim, valores in filtros.items():
+        if np.ndim(valores) == 0:
+            valores = [valores]
+        mask &= cube.index.get_level_values(dim).isin(valores)
+    return cube[mask]
+
+
+def cube_stats(cube, **filtros):
+    total = rollup(slice_cube(cube, **filtros)).iloc[0]
+    return {k: total[k] for k in cube.columns}
+
+
+@profiled("metrics.cube_kpis")
+def cube_kpis(cube, by=(), confidence=None, dropna=True, **filtros):
+    # KPIs (e, opcionalmente, ICs) por grupo de `by`, direto das células
+    grupos = rollup(slice_cube(cube, **filtros), by, dropna=dropna)
+    stats = {k: grupos[k].to_numpy() for k in grupos.columns}
+    kpis = pd.DataFrame(kpis_from_stats(stats), index=grupos.index)
+    if confidence is not None:
+        # todos os grupos numa chamada vetorizada
+        for kpi, (inf, sup) in kpi_intervals(stats, confidence).items():
+            kpis[f"{kpi}_ic_inf"] = inf
+            kpis[f"{kpi}_ic_sup"] = sup
+    kpis["taxa_confirmacao"] = _razao(stats["confirmacao_sum"], stats["confirmacao_n"])
+    return kpis
 
 
 # ================================
 # ELASTICIDADE
 # ================================
+# Os itens dos pedidos confirmados são localizados uma vez (posição do
+# pedido de cada item, sem merge) e o desconto vira um código inteiro de
+# faixa (busca binária nas bordas, intervalos (a, b] como no pd.cut). Cada
+# recorte (Category, Subcategory, Region, mês ou combinações) também vira
+# um código inteiro: as médias por recorte × faixa saem de um único
+# bincount, e a regressão log-log de quantidade contra preço efetivo de
+# cada recorte sai de somas agrupadas (mínimos quadrados em forma fechada),
+# para todos os recortes de uma vez.
+
+FAIXAS_BINS = [-0.01, 0, 0.05, 0.10, 0.15, 0.20, 1]
+FAIXAS_LABELS = ["0%", "0-5%", "5-10%", "10-15%", "15-20%", ">20%"]
+
+ELASTICITY_DIMS = ("Category", "Subcategory", "Region", "month")
+
 
-def elasticidade(items, df_confirmed):
-    df = items.merge(
-        df_confirmed[["order_id", "Discount", "Subtotal"]],
-        left_on="Id",
-        right_on="order_id",
-        how="inner"
+def faixa_codes(perc):
+    # código da faixa de desconto de cada valor (-1 fora das faixas ou NaN)
+    perc = np.asarray(perc, dtype="float64")
+    codigos = np.searchsorted(FAIXAS_BINS, perc, side="left") - 1
+    fora = np.isnan(perc) | (codigos < 0) | (codigos >= len(FAIXAS_LABELS))
+    return np.where(fora, -1, codigos)
+
+
+def _faixas_categoricas(codigos):
+    return pd.Categorical.from_codes(
+        codigos, categories=FAIXAS_LABELS, ordered=True
     )
-    df["discount_perc"] = df["Discount"] / df["Subtotal"]
 
-    bins = [-0.01, 0, 0.05, 0.10, 0.15, 0.20, 1]
-    labels = ["0%", "0-5%", "5-10%", "10-15%", "15-20%", ">20%"]
 
-    df["faixa"] = pd.cut(df["discount_perc"], bins=bins, labels=labels)
+def _itens_confirmados(items, df_confirmed, indice=None):
+    # posição do pedido de cada item (join interno sem merge); `indice` é
+    # um joins.key_index(df_confirmed["order_id"]) já calculado
+    if indice is None:
+        indice = key_index(df_confirmed["order_id"])
+    if indice is None:
+        pos = pd.Index(df_confirmed["order_id"]).get_indexer(items["Id"])
+    else:
+        pos = positions(indice, items["Id"])
+    ok = pos >= 0
+    pedido = pos[ok]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        perc = (df_confirmed["Discount"].to_numpy(dtype="float64")[pedido]
+                / df_confirmed["Subtotal"].to_numpy(dtype="float64")[pedido])
+    return {
+        "ok": ok,
+        "pedido": pedido,
+        "perc": perc,
+        "faixa": faixa_codes(perc),
+        "quantidade": items["Quantity"].to_numpy(dtype="float64", na_value=np.nan)[ok],
+    }
+
+
+def _codigos_dimensao(items, df_confirmed, base, dim):
+    # (código por item, rótulos) de uma dimensão do item ou do pedido
+    if dim == "month":
+        chaves = month_key(df_confirmed["Order_Date"])
+        grupos, codigos = np.unique(chaves, return_inverse=True)
+        codigos = np.where(chaves < 0, -1, codigos)
+        grupos = month_label(grupos)
+    else:
+        serie = items[dim] if dim in items.columns else df_confirmed[dim]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos, grupos = serie.cat.codes.to_numpy(), serie.cat.categories
+        else:
+            codigos, grupos = pd.factorize(serie, sort=True)
+    if dim == "month" or dim not in items.columns:
+        return codigos[base["pedido"]], grupos
+    return codigos[base["ok"]], grupos
+
+
+def _recortes(items, df_confirmed, base, by):
+    # código do recorte de cada item (-1 = sem valor em alguma dimensão) e
+    # DataFrame com os rótulos de cada recorte presente
+    combinado = np.zeros(len(base["pedido"]), dtype=np.int64)
+    valido = np.ones(len(combinado), dtype=bool)
+    niveis = []
+    for dim in by:
+        codigos, grupos = _codigos_dimensao(items, df_confirmed, base, dim)
+        valido &= codigos >= 0
+        combinado = combinado * len(grupos) + codigos
+        niveis.append((dim, grupos))
+
+    if by:
+        presentes, recorte = np.unique(combinado[valido], return_inverse=True)
+    else:
+        # curva global: um recorte só, mesmo sem itens
+        presentes, recorte = np.zeros(1, dtype=np.int64), combinado
+    codigo = np.full(len(combinado), -1, dtype=np.int64)
+    codigo[valido] = recorte
+
+    tamanhos = [len(grupos) for _, grupos in niveis]
+    posicoes = np.unravel_index(presentes, tamanhos) if by else ()
+    rotulos = pd.DataFrame({
+        dim: np.asarray(grupos)[p] for (dim, grupos), p in zip(niveis, posicoes)
+    }, index=pd.RangeIndex(len(presentes)))
+    return codigo, rotulos
+
+
+def _tabela_faixas(recorte, faixa, quantidade, n_recortes):
+    # soma e contagem de Quantity por recorte × faixa (um bincount)
+    n_faixas = len(FAIXAS_LABELS)
+    ok = (recorte >= 0) & (faixa >= 0) & ~np.isnan(quantidade)
+    chave = recorte[ok] * n_faixas + faixa[ok]
+    soma = np.bincount(chave, weights=quantidade[ok], minlength=n_recortes * n_faixas)
+    contagem = np.bincount(chave, minlength=n_recortes * n_faixas)
+    return soma, contagem
+
+
+def _minimos_quadrados(grupo, x, y, n_grupos):
+    # y = a + b·x por grupo, em forma fechada com somas centradas (duas passadas)
+    n = np.bincount(grupo, minlength=n_grupos).astype("float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media_x = np.bincount(grupo, weights=x, minlength=n_grupos) / n
+        media_y = np.bincount(grupo, weights=y, minlength=n_grupos) / n
+        dx = x - media_x[grupo]
+        dy = y - media_y[grupo]
+        sxx = np.bincount(grupo, weights=dx * dx, minlength=n_grupos)
+        sxy = np.bincount(grupo, weights=dx * dy, minlength=n_grupos)
+        syy = np.bincount(grupo, weights=dy * dy, minlength=n_grupos)
+
+        b = np.where(sxx > 0, sxy / sxx, np.nan)
+        a = media_y - b * media_x
+        rss = np.maximum(syy - b * sxy, 0)
+        erro = np.where(n > 2, np.sqrt(rss / (n - 2) / sxx), np.nan)
+        r2 = np.where(syy > 0, 1 - rss / syy, np.nan)
+    return {"n": n.astype("int64"), "a": a, "b": b, "erro": erro, "r2": r2}
+
+
+@profiled("metrics.elasticity")
+def elasticity(items, df_confirmed, by=(), confidence=0.95, indice=None):
+    # devolve {"coeficientes", "faixas"} para todos os recortes de `by`
+    # (dimensões de ELASTICITY_DIMS; vazio = curva global):
+    # - coeficientes: log(Quantity) = intercepto + elasticidade·log(preço
+    #   efetivo), preço efetivo = Price·(1 − desconto do pedido), com erro
+    #   padrão, IC t e R² de cada recorte
+    # - faixas: quantidade média e itens por recorte × faixa de desconto
+    import scipy.stats as st  # só para o quantil t do IC
+
+    by = list(by)
+    base = _itens_confirmados(items, df_confirmed, indice)
+    recorte, rotulos = _recortes(items, df_confirmed, base, by)
+    n_recortes = len(rotulos)
+
+    soma, contagem = _tabela_faixas(recorte, base["faixa"], base["quantidade"], n_recortes)
+    n_faixas = len(FAIXAS_LABELS)
+    with np.errstate(invalid="ignore"):
+        media = soma / contagem
+    faixas = rotulos.loc[np.repeat(rotulos.index, n_faixas)].reset_index(drop=True)
+    faixas["faixa"] = _faixas_categoricas(np.tile(np.arange(n_faixas), n_recortes))
+    faixas["itens"] = contagem
+    faixas["Quantity"] = media
+
+    q = base["quantidade"]
+    preco = items["Price"].to_numpy(dtype="float64", na_value=np.nan)[base["ok"]] * (1 - base["perc"])
+    ok = (recorte >= 0) & (q > 0) & (preco > 0)
+    fit = _minimos_quadrados(recorte[ok], np.log(preco[ok]), np.log(q[ok]), n_recortes)
+    with np.errstate(invalid="ignore"):
+        t = st.t.ppf((1 + confidence) / 2, fit["n"] - 2)
+    coeficientes = rotulos.assign(
+        itens=fit["n"],
+        elasticidade=fit["b"],
+        erro_padrao=fit["erro"],
+        ic_inf=fit["b"] - t * fit["erro"],
+        ic_sup=fit["b"] + t * fit["erro"],
+        intercepto=fit["a"],
+        r2=fit["r2"],
+    )
+    return {"coeficientes": coeficientes, "faixas": faixas}
+
+
+def _somas_globais(items, df_confirmed, indice=None):
+    base = _itens_confirmados(items, df_confirmed, indice)
+    recorte = np.zeros(len(base["faixa"]), dtype=np.int64)
+    return _tabela_faixas(recorte, base["faixa"], base["quantidade"], 1)
+
+
+def _curva(soma, contagem):
+    with np.errstate(invalid="ignore"):
+        media = soma / contagem
+    return pd.DataFrame({
+        "faixa": _faixas_categoricas(np.arange(len(FAIXAS_LABELS))),
+        "Quantity": media,
+    })
+
+
+@profiled("metrics.elasticidade")
+def elasticidade(items, df_confirmed, indice=None):
+    # curva global: quantidade média por faixa de desconto
+    return _curva(*_somas_globais(items, df_confirmed, indice))
+
+
+# ================================
+# CONSUMO DA ABT PARTICIONADA
+# ================================
+# Versões que recebem as partições de abt.iter_abt_partitions() uma a uma:
+# cada bloco vira estatísticas suficientes, combinadas no final.
+
+def compute_kpis_chunked(chunks, delivered="lead_time"):
+    stats = None
+    for df in chunks:
+        parcial = kpi_stats(df, delivered)
+        stats = parcial if stats is None else merge_stats(stats, parcial)
+    return kpis_from_stats(stats)
+
 
-    return df.groupby("faixa")["Quantity"].mean().reset_index()
+def elasticidade_chunked(partitions):
+    soma = np.zeros(len(FAIXAS_LABELS))
+    contagem = np.zeros(len(FAIXAS_LABELS))
+    for df, items in partitions:
+        s, c = _somas_globais(items, df[df["is_confirmed"] == 1])
+        soma += s
+        contagem += c
+    return _curva(soma, contagem)
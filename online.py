@@ -0,0 +1,207 @@
+import json
+import os
+
+import numpy as np
+
+from metrics import (
+    KPI_MEASURES, escalar, kpis_from_stats, ic_media_moments, ic_proporcao_stats, masks
+)
+from sketches import (
+    SKETCH_ALPHA, ddsketch, sketch_update, sketch_merge, sketch_quantiles,
+    sketch_to_dict, sketch_from_dict
+)
+
+'''
+Acumuladores online dos KPIs (para feeds de pedidos quase em tempo real):
+- Recebem micro-lotes de linhas da ABT (mesmas colunas de load_data) e
+  mantêm, por medida de metrics.KPI_MEASURES, contagem, soma, média e M2
+  (Welford; lotes combinados pela fórmula de Chan, estável numericamente)
+- Proporções (atraso, cancelamento, confirmação) são contagens n/sucessos
+- Sketches de quantis (sketches.py) para ticket e prazo de entrega
+- merge(a, b) combina acumuladores de workers diferentes
+- save()/load() gravam um checkpoint JSON (troca atômica do arquivo)
+
+Os KPIs e ICs saem no mesmo formato de compute_kpis e kpi_intervals, sem
+reconstruir a ABT.
+
+Uso:
+    acc = accumulator()
+    for lote in feed:
+        update(acc, lote)
+    kpis(acc), intervals(acc), quantiles(acc, "ticket", [0.5, 0.9])
+'''
+
+ACCUMULATOR_VERSION = 1
+
+# sketches: medida de KPI_MEASURES (mesma coluna e máscara)
+SKETCH_MEASURES = ("ticket", "prazo")
+
+
+# ================================
+# ESTADO
+# ================================
+
+def _momentos_vazios():
+    return {"n": 0, "sum": 0.0, "mean": 0.0, "m2": 0.0}
+
+
+def accumulator(delivered="lead_time", alpha=SKETCH_ALPHA):
+    return {
+        "version": ACCUMULATOR_VERSION,
+        "delivered": delivered,
+        "n": 0,
+        "measures": {nome: _momentos_vazios() for nome in KPI_MEASURES},
+        "sketches": {nome: ddsketch(alpha) for nome in SKETCH_MEASURES},
+    }
+
+
+def _combinar(a, b):
+    # Chan et al.: junta (n, média, M2) de dois conjuntos disjuntos
+    n = a["n"] + b["n"]
+    if n == 0:
+        return _momentos_vazios()
+    delta = b["mean"] - a["mean"]
+    return {
+        "n": n,
+        "sum": a["sum"] + b["sum"],
+        "mean": a["mean"] + delta * b["n"] / n,
+        "m2": a["m2"] + b["m2"] + delta * delta * a["n"] * b["n"] / n,
+    }
+
+
+# ================================
+# ATUALIZAÇÃO E MERGE
+# ================================
+
+def update(acc, df):
+    # df: micro-lote de pedidos no formato da ABT
+    mascaras = masks(df, acc["delivered"])
+    lote = {}
+    for nome, (coluna, mask) in KPI_MEASURES.items():
+        valores = df[coluna].to_numpy(dtype="float64", na_value=np.nan)
+        valores = valores[mascaras[mask] & ~np.isnan(valores)]
+        lote[nome] = valores
+        if not len(valores):
+            continue
+        media = valores.mean()
+        desvios = valores - media
+        acc["measures"][nome] = _combinar(acc["measures"][nome], {
+            "n": len(valores),
+            "sum": float(valores.sum()),
+            "mean": float(media),
+            "m2": float(np.dot(desvios, desvios)),
+        })
+
+    for nome in SKETCH_MEASURES:
+        sketch_update(acc["sketches"][nome], lote[nome])
+    acc["n"] += len(df)
+    return acc
+
+
+def merge(a, b):
+    if a["delivered"] != b["delivered"]:
+        raise ValueError("acumuladores com definições de 'entregue' diferentes")
+    return {
+        "version": ACCUMULATOR_VERSION,
+        "delivered": a["delivered"],
+        "n": a["n"] + b["n"],
+        "measures": {
+            nome: _combinar(a["measures"][nome], b["measures"][nome]) for nome in KPI_MEASURES
+        },
+        "sketches": {
+            nome: sketch_merge(a["sketches"][nome], b["sketches"][nome])
+            for nome in SKETCH_MEASURES
+        },
+    }
+
+
+# ================================
+# CONSULTA
+# ================================
+
+def to_stats(acc):
+    # mesmo formato de metrics.kpi_stats
+    stats = {"n": acc["n"]}
+    for nome, m in acc["measures"].items():
+        stats[f"{nome}_n"] = m["n"]
+        stats[f"{nome}_sum"] = m["sum"]
+        stats[f"{nome}_m2"] = m["m2"]
+    return stats
+
+
+def kpis(acc):
+    return kpis_from_stats(to_stats(acc))
+
+
+def _ic_welford(m, confidence):
+    variancia = m["m2"] / (m["n"] - 1) if m["n"] > 1 else np.nan
+    return escalar(ic_media_moments(m["n"], m["mean"], variancia, confidence))
+
+
+def intervals(acc, confidence=0.95):
+    # mesmas chaves de metrics.kpi_intervals; médias usam a variância de Welford
+    medidas = acc["measures"]
+    return {
+        "ticket_medio": _ic_welford(medidas["ticket"], confidence),
+        "prazo_medio_entrega": _ic_welford(medidas["prazo"], confidence),
+        "taxa_atraso": ic_proporcao_stats(
+            medidas["atraso"]["sum"], medidas["atraso"]["n"], confidence
+        ),
+        "taxa_cancelamento": ic_proporcao_stats(
+            medidas["cancelamento"]["sum"], medidas["cancelamento"]["n"], confidence
+        ),
+    }
+
+
+def quantiles(acc, nome, qs):
+    return sketch_quantiles(acc["sketches"][nome], qs)
+
+
+# ================================
+# CHECKPOINT
+# ================================
+
+def to_dict(acc):
+    return {**acc, "sketches": {k: sketch_to_dict(v) for k, v in acc["sketches"].items()}}
+
+
+def from_dict(dados):
+    if dados.get("version") != ACCUMULATOR_VERSION:
+        raise ValueError(f"checkpoint de versão {dados.get('version')} não suportado")
+    return {**dados, "sketches": {k: sketch_from_dict(v) for k, v in dados["sketches"].items()}}
+
+
+def save(acc, path):
+    # grava num temporário e troca: um checkpoint interrompido não corrompe o anterior
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(to_dict(acc), f)
+    os.replace(tmp, path)
+
+
+def load(path):
+    with open(path) as f:
+        return from_dict(json.load(f))
+
+
+if __name__ == "__main__":
+    # debug: ABT em micro-lotes, dois "workers", checkpoint e comparação
+    from abt import load_data
+    from metrics import compute_kpis, kpi_intervals, kpi_stats
+
+    df, _ = load_data()
+    metade = len(df) // 2
+    workers = [accumulator(), accumulator()]
+    for inicio in range(0, len(df), 100):
+        update(workers[inicio >= metade], df.iloc[inicio:inicio + 100])
+
+    acc = merge(*workers)
+    save(acc, "online_checkpoint.json")
+    acc = load("online_checkpoint.json")
+    os.remove("online_checkpoint.json")
+
+    print("online :", kpis(acc))
+    print("ABT    :", compute_kpis(df))
+    print("IC online:", intervals(acc))
+    print("IC ABT   :", kpi_intervals(kpi_stats(df)))
+    print("quantis do ticket (25/50/75/90%):", quantiles(acc, "ticket", [0.25, 0.5, 0.75, 0.9]))
@@ -0,0 +1,136 @@
+import contextvars
+import functools
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+'''
+Instrumentação opcional por etapa (abt.py e metrics.py):
+- Tempo de parede, pico de memória acima do início da etapa (tracemalloc)
+  e linhas de entrada/saída de cada etapa numerada da ABT (1 a 8) e das
+  funções de métricas
+- Desligada por padrão: fora de um bloco `with profiling()` as etapas só
+  consultam uma ContextVar e seguem
+- O relatório é uma lista de dicionários (report_frame() vira DataFrame),
+  e cada etapa também sai como linha de log no logger "profiling"
+
+Uso:
+    with profiling() as perfil:
+        df, items = load_data(use_cache=False)
+    print(report_frame(perfil))
+'''
+
+logger = logging.getLogger("profiling")
+
+_ATIVO = contextvars.ContextVar("profiling", default=None)
+
+
+# ================================
+# COLETA
+# ================================
+
+@contextmanager
+def profiling(log=True):
+    # liga o tracemalloc só se ninguém ligou antes (e desliga no final)
+    iniciou = not tracemalloc.is_tracing()
+    if iniciou:
+        tracemalloc.start()
+    estado = {"registros": [], "pilha": [], "log": log}
+    token = _ATIVO.set(estado)
+    try:
+        yield estado["registros"]
+    finally:
+        _ATIVO.reset(token)
+        if iniciou:
+            tracemalloc.stop()
+
+
+def _linhas(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    if isinstance(obj, dict):
+        # ex.: dicionário de tabelas lidas
+        tamanhos = [len(v) for v in obj.values() if isinstance(v, (pd.DataFrame, pd.Series))]
+        return sum(tamanhos) if tamanhos else None
+    if isinstance(obj, tuple) and obj:
+        return _linhas(obj[0])
+    return None
+
+
+@contextmanager
+def stage(nome, rows_in=None):
+    estado = _ATIVO.get()
+    if estado is None:
+        yield {}
+        return
+
+    pilha = estado["pilha"]
+    atual, pico = tracemalloc.get_traced_memory()
+    if pilha:
+        # o pico até aqui pertence à etapa de fora
+        pilha[-1]["pico"] = max(pilha[-1]["pico"], pico)
+    tracemalloc.reset_peak()
+
+    # registrado já no início: a lista fica na ordem de execução
+    registro = {"stage": nome, "level": len(pilha), "rows_in": rows_in, "rows_out": None}
+    estado["registros"].append(registro)
+    quadro = {"inicio_mem": atual, "pico": atual}
+    pilha.append(quadro)
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        segundos = time.perf_counter() - inicio
+        pilha.pop()
+        pico = max(quadro["pico"], tracemalloc.get_traced_memory()[1])
+        if pilha:
+            pilha[-1]["pico"] = max(pilha[-1]["pico"], pico)
+        registro["seconds"] = segundos
+        registro["peak_mb"] = (pico - quadro["inicio_mem"]) / 2**20
+        if estado["log"]:
+            logger.info(format_stage(registro))
+
+
+def profiled(nome):
+    # decorador: a chamada inteira vira uma etapa (linhas = 1º DataFrame)
+    def decorador(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _ATIVO.get() is None:
+                return func(*args, **kwargs)
+            with stage(nome, rows_in=_linhas(args[0]) if args else None) as registro:
+                resultado = func(*args, **kwargs)
+                registro["rows_out"] = _linhas(resultado)
+            return resultado
+        return wrapper
+    return decorador
+
+
+# ================================
+# RELATÓRIO
+# ================================
+
+def format_stage(registro):
+    linhas = [
+        f"{rotulo}={registro[chave]}"
+        for chave, rotulo in (("rows_in", "linhas_in"), ("rows_out", "linhas_out"))
+        if registro.get(chave) is not None
+    ]
+    return (
+        f"[perfil] {'  ' * registro['level']}{registro['stage']}: "
+        f"{registro['seconds']:.4f}s, pico +{registro['peak_mb']:.1f} MB"
+        + (", " + ", ".join(linhas) if linhas else "")
+    )
+
+
+def report_frame(registros):
+    colunas = ["stage", "level", "seconds", "peak_mb", "rows_in", "rows_out"]
+    frame = pd.DataFrame(registros, columns=colunas)
+    return frame.astype({"rows_in": "Int64", "rows_out": "Int64"})
+
+
+def total_seconds(registros):
+    return sum(r["seconds"] for r in registros if r["level"] == 0)
@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+
+from joins import key_index, positions
+
+'''
+Consultas sobre a ABT para o dashboard:
+- Índices por valor (posições das linhas de cada UF, serviço, categoria...)
+- Filtros combinados por interseção de índices, sem máscara sobre todas as linhas
+- Filtros simples (período, UF, Service, Purchase_Status) resolvidos no servidor
+- Projeção de colunas
+- Paginação: só a janela visível é enviada ao navegador
+'''
+
+PAGE_SIZES = [50, 100, 500, 1000]
+
+# filtros da barra lateral do dashboard
+ORDER_FILTERS = ["Region", "UF", "Service", "Payment_Method"]
+ITEM_FILTERS = ["Category"]
+
+
+# ================================
+# ÍNDICE DE DATAS
+# ================================
+# Ordenação das linhas por data calculada uma vez; um período vira duas
+# buscas binárias em vez de uma comparação por linha.
+
+def date_index(datas):
+    valores = pd.Series(datas).to_numpy(dtype="datetime64[ns]")
+    ordem = np.argsort(valores, kind="stable")
+    return {"ordem": ordem, "valores": valores[ordem]}
+
+
+def positions_in_range(indice, inicio=None, fim=None):
+    valores = indice["valores"]
+    lo = 0 if inicio is None else np.searchsorted(valores, np.datetime64(inicio, "ns"), side="left")
+    hi = len(valores) if fim is None else np.searchsorted(valores, np.datetime64(fim, "ns"), side="right")
+    # devolve as posições na ordem original das linhas
+    return np.sort(indice["ordem"][lo:hi])
+
+
+# ================================
+# ÍNDICES POR VALOR
+# ================================
+# Para cada valor de uma coluna, as posições (ordenadas) das linhas que o
+# têm: as linhas são ordenadas uma vez pelo código do valor e `limites`
+# marca onde cada valor começa.
+
+def value_index(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = serie.cat.codes.to_numpy()
+        valores = serie.cat.categories
+    else:
+        codigos, valores = pd.factorize(serie)
+    ordem = np.argsort(codigos, kind="stable")
+    limites = np.searchsorted(codigos[ordem], np.arange(len(valores) + 1))
+    return {"valores": pd.Index(valores), "ordem": ordem, "limites": limites}
+
+
+def positions_for(indice, valores):
+    codigos = indice["valores"].get_indexer(list(valores))
+    limites, ordem = indice["limites"], indice["ordem"]
+    partes = [ordem[limites[c]:limites[c + 1]] for c in codigos if c >= 0]
+    if not partes:
+        return np.empty(0, dtype=np.int64)
+    if len(partes) == 1:
+        return partes[0]
+    return np.sort(np.concatenate(partes))
+
+
+def intersect_positions(listas):
+    # começa pela menor lista; None significa "todas as linhas"
+    listas = sorted((l for l in listas if l is not None), key=len)
+    if not listas:
+        return None
+    resultado = listas[0]
+    for outra in listas[1:]:
+        resultado = np.intersect1d(resultado, outra, assume_unique=True)
+    return resultado
+
+
+def build_filter_indexes(df, items, order_filters=ORDER_FILTERS, item_filters=ITEM_FILTERS):
+    pedidos = key_index(df["order_id"])
+    return {
+        "pedidos": {col: value_index(df[col]) for col in order_filters},
+        "itens": {col: value_index(items[col]) for col in item_filters},
+        "datas": date_index(df["Order_Date"]),
+        "datas_itens": date_index(items["Order_Date"]),
+        # order_id -> posição em df, e a posição do pedido de cada item
+        # (-1 se o pedido não está em df)
+        "pedido": pedidos,
+        "item_pedido": positions(pedidos, items["order_id"]),
+        "n_pedidos": len(df),
+        "n_itens": len(items),
+    }
+
+
+def apply_filters(indices, periodo=None, **filtros):
+    # devolve (posições em df, posições em items); None = sem filtro
+    listas_pedidos = []
+    listas_itens = []
+
+    if periodo is not None:
+        listas_pedidos.append(positions_in_range(indices["datas"], *periodo))
+        listas_itens.append(positions_in_range(indices["datas_itens"], *periodo))
+
+    for coluna, valores in filtros.items():
+        if not valores:
+            continue
+        if coluna in indices["pedidos"]:
+            listas_pedidos.append(positions_for(indices["pedidos"][coluna], valores))
+        else:
+            pos_itens = positions_for(indices["itens"][coluna], valores)
+            listas_itens.append(pos_itens)
+            # pedidos que têm ao menos um item dos valores escolhidos
+            pedidos = indices["item_pedido"][pos_itens]
+            listas_pedidos.append(np.unique(pedidos[pedidos >= 0]))
+
+    pos_pedidos = intersect_positions(listas_pedidos)
+    if pos_pedidos is not None:
+        # itens só dos pedidos selecionados
+        selecionado = np.zeros(indices["n_pedidos"] + 1, dtype=bool)
+        selecionado[pos_pedidos] = True
+        listas_itens.append(np.flatnonzero(selecionado[indices["item_pedido"]]))
+    pos_itens = intersect_positions(listas_itens)
+    return pos_pedidos, pos_itens
+
+
+def sum_by_order(coluna, item_pedido, valores):
+    # soma valores dos itens por uma coluna do pedido (ex.: receita por UF),
+    # usando a posição do pedido de cada item em vez de um merge
+    if isinstance(coluna.dtype, pd.CategoricalDtype):
+        codigos, grupos = coluna.cat.codes.to_numpy(), coluna.cat.categories
+    else:
+        codigos, grupos = pd.factorize(coluna, sort=True)
+    codigo_item = np.where(item_pedido >= 0, codigos[np.maximum(item_pedido, 0)], -1)
+    ok = codigo_item >= 0
+    soma = np.bincount(
+        codigo_item[ok], weights=np.nan_to_num(np.asarray(valores, dtype="float64")[ok]),
+        minlength=len(grupos)
+    )
+    # mesmos grupos de um groupby(observed=True) sobre os pedidos
+    presentes = np.unique(codigos[codigos >= 0])
+    return pd.DataFrame({coluna.name: grupos[presentes], valores.name: soma[presentes]})
+
+
+# ================================
+# FILTROS
+# ================================
+
+def _isin(serie, valores):
+    # em colunas category compara só os códigos
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = serie.cat.categories.get_indexer(list(valores))
+        return np.isin(serie.cat.codes.to_numpy(), codigos[codigos >= 0])
+    return serie.isin(list(valores)).to_numpy()
+
+
+def filter_positions(frame, indice_datas=None, periodo=None, **filtros):
+    # filtros: coluna=[valores]; listas vazias/None são ignoradas
+    if periodo is not None and indice_datas is not None:
+        posicoes = positions_in_range(indice_datas, *periodo)
+    else:
+        posicoes = None
+
+    mask = None
+    for coluna, valores in filtros.items():
+        if not valores:
+            continue
+        m = _isin(frame[coluna], valores)
+        mask = m if mask is None else mask & m
+
+    if mask is None:
+        return np.arange(len(frame)) if posicoes is None else posicoes
+    if posicoes is None:
+        return np.flatnonzero(mask)
+    return posicoes[mask[posicoes]]
+
+
+# ================================
+# PAGINAÇÃO
+# ================================
+
+def n_pages(total, tamanho):
+    return max(1, -(-total // tamanho))
+
+
+def page(frame, posicoes, pagina, tamanho, colunas=None):
+    # pagina começa em 1; só a janela pedida é materializada
+    inicio = (pagina - 1) * tamanho
+    janela = posicoes[inicio:inicio + tamanho]
+    if colunas:
+        return frame.iloc[janela, frame.columns.get_indexer(list(colunas))]
+    return frame.iloc[janela]
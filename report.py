@@ -0,0 +1,267 @@
+import json
+import os
+
+import pandas as pd
+
+'''
+Bundle do relatório (primeira renderização do dashboard):
+- KPIs, tabela de ICs, ICs por recorte, opções dos filtros e as tabelas
+  agregadas de cada gráfico do app, calculados uma vez sobre a ABT
+  completa e gravados num JSON pelo pipeline (eda.py ou `python report.py`)
+- load_report() só usa json, os e pandas: confere tamanho e data de
+  modificação dos CSVs contra os gravados no bundle e devolve None quando
+  algo mudou
+- Sem filtros, app.py desenha a página a partir do bundle, sem carregar a
+  ABT nem importar abt/metrics (pyarrow, scipy); com filtros, as mesmas
+  funções de tabela rodam sobre a ABT filtrada
+- abt, metrics, query e rollups são importados dentro das funções que os
+  usam, para que ler o bundle continue barato
+'''
+
+# mesmo valor de abt.DATA_DIR (sem importar abt)
+DATA_DIR = "ecommerce_data"
+REPORT_PATH = os.path.join("output", "report_bundle.json")
+
+# incrementar quando o conteúdo do bundle mudar
+REPORT_VERSION = 1
+
+# ICs por grupo do dashboard: rótulo -> dimensão do cubo
+RECORTES = {
+    "Região": "Region",
+    "Serviço": "Service",
+    "UF": "UF",
+    "Pagamento": "Payment_Method",
+    "Mês": "month",
+}
+
+# filtros da barra lateral: coluna -> tabela de onde saem as opções
+FILTER_SOURCES = {
+    "Region": "pedidos",
+    "UF": "pedidos",
+    "Service": "pedidos",
+    "Payment_Method": "pedidos",
+    "Category": "itens",
+}
+
+# filtros que o rollup diário de sazonalidade responde sozinho
+FILTROS_ROLLUP = ("UF", "Region")
+
+
+# ================================
+# TABELAS (ABT -> dados dos gráficos)
+# ================================
+
+def kpi_table(df):
+    # KPIs gerais e tabela de ICs de 95%
+    from metrics import kpi_stats, kpis_from_stats, kpi_intervals
+
+    stats = kpi_stats(df)
+    ics = kpi_intervals(stats)
+    ic1 = ics["ticket_medio"]
+    ic2 = ics["prazo_medio_entrega"]
+    ic3 = ics["taxa_atraso"]
+    ic4 = ics["taxa_cancelamento"]
+
+    ic_df = pd.DataFrame({
+        "KPI": ["Ticket Médio", "Prazo de Entrega", "Taxa de Atraso", "Taxa de Cancelamento"],
+        "IC Inferior": [ic1[0], ic2[0], ic3[0], ic4[0]],
+        "IC Superior": [ic1[1], ic2[1], ic3[1], ic4[1]]
+    })
+    return kpis_from_stats(stats), ic_df
+
+
+def group_intervals(df, cube, dimensao):
+    # ICs por grupo: t e Wilson do cubo numa chamada vetorizada; o ticket
+    # (assimétrico) também tem IC por bootstrap, todos os grupos de uma vez
+    from metrics import cube_kpis, month_key, month_label, bootstrap_ic
+
+    grupos = cube_kpis(cube, by=[dimensao], confidence=0.95)
+
+    confirmados = df["is_confirmed"].to_numpy() == 1
+    if dimensao == "month":
+        valores_grupo = month_key(df["Order_Date"])[confirmados]
+    else:
+        valores_grupo = df[dimensao].to_numpy()[confirmados]
+    codigos = grupos.index.get_indexer(valores_grupo)
+    boot_inf, boot_sup = bootstrap_ic(
+        df["Total"].to_numpy()[confirmados], codigos, len(grupos), n_boot=1000, seed=0
+    )
+
+    rotulos = month_label(grupos.index) if dimensao == "month" else grupos.index.astype(str)
+    return pd.DataFrame({
+        "Grupo": rotulos,
+        "Pedidos": grupos["qtd_pedidos"].to_numpy(),
+        "Ticket Médio": grupos["ticket_medio"].to_numpy(),
+        "Ticket IC t": list(zip(grupos["ticket_medio_ic_inf"], grupos["ticket_medio_ic_sup"])),
+        "Ticket IC bootstrap": list(zip(boot_inf, boot_sup)),
+        "Taxa de Atraso": grupos["taxa_atraso"].to_numpy(),
+        "Atraso IC Wilson": list(zip(grupos["taxa_atraso_ic_inf"], grupos["taxa_atraso_ic_sup"])),
+    })
+
+
+def chart_tables(df, items, cube, dist=None, rollups=None, periodo=None, filtros=()):
+    # dados agregados de todos os gráficos do app (poucas linhas cada)
+    from distributions import DISTRIBUTIONS, build_distributions, box_stats
+    from joins import key_index, positions
+    from metrics import cube_kpis
+    from query import sum_by_order
+    from rollups import build_rollups, series
+
+    tabelas = {}
+
+    conv = cube_kpis(cube, by=["Payment_Method"])["taxa_confirmacao"].rename("is_confirmed").reset_index()
+    conv["is_confirmed"] = conv["is_confirmed"] * 100
+    tabelas["confirmacao"] = conv
+
+    tabelas["prazo_servico"] = (
+        cube_kpis(cube, by=["Service"])["prazo_medio_entrega"].rename("delivery_lead_time").reset_index()
+    )
+
+    # quartis, bigodes e outliers pré-calculados; com filtros o sketch é
+    # refeito sobre a ABT filtrada
+    if dist is None:
+        dist = build_distributions(df, {"prazo_por_servico": DISTRIBUTIONS["prazo_por_servico"]})
+    tabelas["caixas_prazo"] = box_stats(dist, "prazo_por_servico")
+
+    tabelas["receita_categoria"] = (
+        items.groupby("Category", observed=True)["Total_Item"].sum().reset_index()
+    )
+    tabelas["receita_subcategoria"] = (
+        items.groupby("Subcategory", observed=True)["Total_Item"].sum().reset_index()
+    )
+
+    item_pedido = positions(key_index(df["order_id"]), items["order_id"])
+    tabelas["receita_uf"] = sum_by_order(df["UF"], item_pedido, items["Total_Item"])
+    tabelas["receita_regiao"] = sum_by_order(df["Region"], item_pedido, items["Total_Item"])
+
+    # período, UF e Região saem do rollup diário; outros filtros refazem o
+    # rollup mensal sobre a ABT filtrada
+    if rollups is None:
+        rollups = build_rollups(df, niveis=("mes",))
+        recorte = {}
+    else:
+        inicio, fim = periodo or (None, None)
+        recorte = {"inicio": inicio, "fim": fim}
+        recorte.update({dim: list(valores) for dim, valores in filtros if dim in FILTROS_ROLLUP})
+    colunas = {"rotulo": "month", "receita": "Total"}
+    for dim, nome in (("UF", "sazonalidade_uf"), ("Region", "sazonalidade_regiao")):
+        tabelas[nome] = series(rollups, "mes", "receita", by=dim, **recorte).rename(columns=colunas)
+    return tabelas
+
+
+def filter_options(df, items):
+    opcoes = {"inicio": str(df["Order_Date"].min().date()), "fim": str(df["Order_Date"].max().date())}
+    for coluna, tabela in FILTER_SOURCES.items():
+        serie = (df if tabela == "pedidos" else items)[coluna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            opcoes[coluna] = [str(c) for c in serie.cat.categories]
+        else:
+            opcoes[coluna] = sorted(str(v) for v in serie.dropna().unique())
+    return opcoes
+
+
+# ================================
+# BUNDLE
+# ================================
+
+def source_stats(data_dir=DATA_DIR):
+    # tamanho e mtime de cada CSV (só stat, sem ler os arquivos)
+    estado = {}
+    for nome in sorted(os.listdir(data_dir)) if os.path.isdir(data_dir) else []:
+        if nome.endswith(".csv"):
+            stat = os.stat(os.path.join(data_dir, nome))
+            estado[nome] = [stat.st_size, stat.st_mtime_ns]
+    return estado
+
+
+def signature(path=REPORT_PATH, data_dir=DATA_DIR):
+    # muda quando o bundle ou algum CSV muda (chave de cache do app)
+    mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    return mtime, json.dumps(source_stats(data_dir), sort_keys=True)
+
+
+def build_report(df, items, versao, dist=None, rollups=None, data_dir=DATA_DIR):
+    from metrics import build_cube
+
+    # stat dos CSVs antes das contas: se mudarem no meio, o bundle já nasce vencido
+    fontes = source_stats(data_dir)
+    cube = build_cube(df)
+    kpis, ic_df = kpi_table(df)
+    return {
+        "version": REPORT_VERSION,
+        "data_version": versao,
+        "sources": fontes,
+        "kpis": kpis,
+        "ics": ic_df,
+        "ics_recorte": {dim: group_intervals(df, cube, dim) for dim in RECORTES.values()},
+        "tabelas": chart_tables(df, items, cube, dist, rollups),
+        "filtros": filter_options(df, items),
+    }
+
+
+def _registros(frame):
+    return json.loads(frame.to_json(orient="records", date_format="iso", double_precision=15))
+
+
+def _para_json(valor):
+    if isinstance(valor, pd.DataFrame):
+        return {"__frame__": _registros(valor), "colunas": list(valor.columns)}
+    if isinstance(valor, dict):
+        return {k: _para_json(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_para_json(v) for v in valor]
+    if hasattr(valor, "item"):
+        # escalares numpy
+        return valor.item()
+    return valor
+
+
+def _de_json(valor):
+    if isinstance(valor, dict):
+        if "__frame__" in valor:
+            return pd.DataFrame(valor["__frame__"], columns=valor["colunas"])
+        return {k: _de_json(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_de_json(v) for v in valor]
+    return valor
+
+
+def write_report(bundle, path=REPORT_PATH):
+    # grava num temporário e troca: o app nunca lê um bundle pela metade
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(_para_json(bundle), f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def load_report(path=REPORT_PATH, data_dir=DATA_DIR):
+    # bundle gravado, ou None se não existe, é de outra versão ou os CSVs mudaram
+    try:
+        with open(path) as f:
+            bundle = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if bundle.get("version") != REPORT_VERSION or bundle.get("sources") != source_stats(data_dir):
+        return None
+    return _de_json(bundle)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from abt import CACHE_DIR, data_version, load_data, load_distributions, load_rollups
+
+    parser = argparse.ArgumentParser(description="Gera o bundle do relatório do dashboard")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--out", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    df, items = load_data(args.data_dir, args.cache_dir)
+    bundle = build_report(
+        df, items, data_version(args.data_dir, args.cache_dir),
+        load_distributions(args.cache_dir), load_rollups(args.cache_dir), args.data_dir,
+    )
+    write_report(bundle, args.out)
+    print(f"Bundle do relatório salvo em {args.out}")
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+from metrics import masks, month_key
+
+'''
+Rollups de séries temporais (sazonalidade):
+- Agregados por dia, semana e mês × UF × Region de receita, pedidos,
+  confirmações e entregas atrasadas
+- Períodos são chaves inteiras (dias, semanas e meses desde 1970), sem
+  conversão de datas para texto por linha; só o resultado vira rótulo
+- Construídos junto com a ABT (abt.py grava um arquivo por partição do
+  cache) e somados na leitura: dias novos entram como partições novas
+- Os gráficos de sazonalidade (eda.py e app.py) saem daqui: filtros de
+  período (dias inteiros), UF e Region são respondidos pelo rollup diário
+'''
+
+PERIODOS = ("dia", "semana", "mes")
+DIMENSOES = ["UF", "Region"]
+MEDIDAS = ["pedidos", "receita", "confirmados", "receita_confirmada", "entregues", "atrasados"]
+
+# 1970-01-01 foi quinta-feira: (dia + 3) // 7 conta semanas de segunda a domingo
+_DESLOCAMENTO_SEMANA = 3
+
+
+# ================================
+# CHAVES DE PERÍODO
+# ================================
+
+def day_key(datas):
+    # dias desde 1970-01-01 (NaT -> -1)
+    valores = pd.Series(datas).to_numpy(dtype="datetime64[ns]")
+    chave = valores.astype("datetime64[D]").astype("int64")
+    return np.where(np.isnat(valores), -1, chave).astype("int32")
+
+
+def convert_key(dias, nivel):
+    # chave diária -> chave do nível pedido (-1 continua -1)
+    dias = np.asarray(dias, dtype="int64")
+    if nivel == "dia":
+        chave = dias
+    elif nivel == "semana":
+        chave = (dias + _DESLOCAMENTO_SEMANA) // 7
+    elif nivel == "mes":
+        chave = month_key(dias.astype("datetime64[D]"))
+    else:
+        raise ValueError(f"nível de período desconhecido: {nivel!r}")
+    return np.where(dias < 0, -1, chave).astype("int32")
+
+
+def period_label(chaves, nivel):
+    # texto só para as chaves do resultado (semana = data da segunda-feira)
+    chaves = np.asarray(chaves, dtype="int64")
+    if nivel == "mes":
+        rotulos = chaves.astype("datetime64[M]").astype(str)
+    elif nivel == "semana":
+        rotulos = (chaves * 7 - _DESLOCAMENTO_SEMANA).astype("datetime64[D]").astype(str)
+    else:
+        rotulos = chaves.astype("datetime64[D]").astype(str)
+    return np.where(chaves < 0, "", rotulos)
+
+
+# ================================
+# CONSTRUÇÃO
+# ================================
+
+def _medidas(df):
+    mascaras = masks(df)
+    total = df["Total"].to_numpy(dtype="float64", na_value=np.nan)
+    total = np.where(np.isnan(total), 0.0, total)
+    confirmado = mascaras["confirmed"]
+    atrasado = mascaras["delivered"] & (df["is_late"].to_numpy() == 1)
+    return pd.DataFrame({
+        "pedidos": np.ones(len(df), dtype="int64"),
+        "receita": total,
+        "confirmados": confirmado.astype("int64"),
+        "receita_confirmada": np.where(confirmado, total, 0.0),
+        "entregues": mascaras["delivered"].astype("int64"),
+        "atrasados": atrasado.astype("int64"),
+    }, index=df.index)
+
+
+def build_rollups(df, niveis=PERIODOS):
+    # uma tabela longa: nivel, periodo, UF, Region, medidas
+    medidas = _medidas(df)
+    dias = day_key(df["Order_Date"])
+    partes = []
+    for nivel in niveis:
+        chaves = [pd.Series(convert_key(dias, nivel), index=df.index, name="periodo")]
+        chaves += [df[dim] for dim in DIMENSOES]
+        parte = medidas.groupby(chaves, observed=True, dropna=False).sum().reset_index()
+        parte.insert(0, "nivel", nivel)
+        partes.append(parte)
+    return _tipos(pd.concat(partes, ignore_index=True))
+
+
+def _tipos(rollups):
+    rollups["nivel"] = pd.Categorical(rollups["nivel"], categories=PERIODOS)
+    rollups["periodo"] = rollups["periodo"].astype("int32")
+    return rollups
+
+
+def merge_rollups(frames):
+    # partições somadas célula a célula (chaves iguais = mesma célula)
+    frames = [f for f in frames if f is not None]
+    for dim in DIMENSOES:
+        # mesma ordem de categorias da ABT (a da primeira partição vem antes)
+        colunas = [f[dim].astype("category") for f in frames]
+        categorias = pd.api.types.union_categoricals(
+            [pd.Categorical([], categories=c.cat.categories) for c in colunas]
+        ).categories
+        frames = [
+            f.assign(**{dim: c.cat.set_categories(categorias)}) for f, c in zip(frames, colunas)
+        ]
+    todos = pd.concat(frames, ignore_index=True)
+    chaves = ["nivel", "periodo"] + DIMENSOES
+    somado = todos.groupby(chaves, observed=True, dropna=False)[MEDIDAS].sum().reset_index()
+    return _tipos(somado)
+
+
+# ================================
+# CONSULTA
+# ================================
+
+def series(rollups, nivel, medida, by=None, inicio=None, fim=None, **filtros):
+    # série de `medida` por período (e por `by`); inicio/fim (datas) e
+    # filtros de UF/Region usam o rollup diário, reagrupado no nível pedido
+    com_periodo = inicio is not None or fim is not None
+    base = rollups[rollups["nivel"] == ("dia" if com_periodo else nivel)]
+    mask = np.ones(len(base), dtype=bool)
+    if inicio is not None:
+        mask &= base["periodo"].to_numpy() >= day_key([inicio])[0]
+    if fim is not None:
+        mask &= base["periodo"].to_numpy() <= day_key([fim])[0]
+    for dim, valores in filtros.items():
+        if valores:
+            mask &= base[dim].isin(valores).to_numpy()
+    base = base[mask & (base["periodo"].to_numpy() >= 0)]
+
+    periodo = base["periodo"].to_numpy()
+    if com_periodo and nivel != "dia":
+        periodo = convert_key(periodo, nivel)
+    chaves = ([base[by]] if by else []) + [pd.Series(periodo, index=base.index, name="periodo")]
+    saida = base.groupby(chaves, observed=True)[MEDIDAS].sum().reset_index()
+    saida = saida[saida["pedidos"] > 0]
+    saida["rotulo"] = period_label(saida["periodo"], nivel)
+    return saida[([by] if by else []) + ["periodo", "rotulo", medida]].reset_index(drop=True)
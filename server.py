@@ -0,0 +1,338 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pyarrow as pa
+
+from abt import DATA_DIR, CACHE_DIR, SHARED_DIR, shared_abt, data_version
+from joins import key_index, positions
+from metrics import (
+    CUBE_DIMS, ELASTICITY_DIMS, kpi_stats, kpis_from_stats, kpi_intervals, build_cube, cube_kpis,
+    elasticidade, elasticity, month_label
+)
+from query import ORDER_FILTERS, ITEM_FILTERS, build_filter_indexes, apply_filters, sum_by_order
+
+'''
+Serviço local de consultas sobre a ABT (para outras ferramentas internas):
+- Processo de longa duração com a ABT residente (abt.shared_abt: a mesma
+  cópia mapeada que o dashboard usa) e os índices de filtro calculados uma
+  vez por versão dos dados
+- Endpoints GET, com resposta JSON ou Arrow IPC (?format=arrow ou
+  Accept: application/vnd.apache.arrow.stream):
+    /version                  versão dos dados
+    /kpis                     KPIs gerais (mesmos de compute_kpis)
+    /intervals                ICs de 95% dos KPIs
+    /groups?by=Service,UF     KPIs e ICs por grupo (cubo de KPIs)
+    /revenue?by=Category      receita dos itens por Category, Subcategory,
+                              UF ou Region
+    /elasticity               quantidade média por faixa de desconto
+                              (global ou ?by=Category,Region,...)
+    /elasticity_fit?by=...    elasticidade log-log por recorte (coeficiente,
+                              erro padrão, IC e R²)
+- Filtros em qualquer consulta (como na barra lateral do dashboard):
+  inicio e fim (AAAA-MM-DD, fim inclusivo) e Region, UF, Service,
+  Payment_Method e Category (valores separados por vírgula)
+- Consultas iguais simultâneas são calculadas uma vez só: as outras
+  esperam o mesmo resultado
+- Resultados ficam em cache por (versão dos dados, consulta); quando os
+  CSVs mudam a ABT é recarregada e o cache antigo descartado
+
+Uso:
+    python server.py --port 8765
+    curl 'http://127.0.0.1:8765/groups?by=Service&UF=SP,RJ'
+'''
+
+logger = logging.getLogger("server")
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+
+# intervalo mínimo entre duas verificações da versão dos CSVs
+VERSION_CHECK_SECONDS = 5
+
+RESULT_CACHE_ENTRIES = 256
+
+FILTERS = ORDER_FILTERS + ITEM_FILTERS
+REVENUE_BY = ("Category", "Subcategory", "UF", "Region")
+
+
+# ================================
+# ESTADO DO SERVIÇO
+# ================================
+
+def service(data_dir=DATA_DIR, cache_dir=CACHE_DIR, shared_dir=SHARED_DIR):
+    return {
+        "data_dir": data_dir,
+        "cache_dir": cache_dir,
+        "shared_dir": shared_dir,
+        "trava": threading.Lock(),
+        "recarga": threading.Lock(),
+        "abt": None,
+        "checado": 0.0,
+        "resultados": OrderedDict(),
+        "em_andamento": {},
+    }
+
+
+def current_abt(servico):
+    # ABT da versão atual e índices de filtro; a versão é conferida no
+    # máximo a cada VERSION_CHECK_SECONDS (só stat dos CSVs quando nada mudou)
+    with servico["trava"]:
+        abt = servico["abt"]
+        if abt is not None and time.monotonic() - servico["checado"] < VERSION_CHECK_SECONDS:
+            return abt
+
+    # conferência e recarga fora da trava: uma thread por vez (trava de
+    # recarga); as outras seguem com a ABT atual enquanto a nova é montada,
+    # e só esperam quando ainda não há ABT nenhuma
+    if not servico["recarga"].acquire(blocking=abt is None):
+        return abt
+    try:
+        with servico["trava"]:
+            abt = servico["abt"]
+            if abt is not None and time.monotonic() - servico["checado"] < VERSION_CHECK_SECONDS:
+                # outra thread acabou de conferir
+                return abt
+        versao = data_version(servico["data_dir"], servico["cache_dir"])
+        novo = abt
+        if abt is None or abt["versao"] != versao:
+            df, items = shared_abt(servico["data_dir"], servico["cache_dir"], servico["shared_dir"])
+            novo = {
+                "versao": versao,
+                "df": df,
+                "items": items,
+                "indices": build_filter_indexes(df, items),
+            }
+            logger.info(f"[server] ABT versão {versao}: {len(df)} pedidos, {len(items)} itens")
+
+        # só a troca acontece sob a trava
+        with servico["trava"]:
+            servico["checado"] = time.monotonic()
+            if novo is not abt:
+                servico["abt"] = novo
+                servico["resultados"].clear()
+        return novo
+    finally:
+        servico["recarga"].release()
+
+
+# ================================
+# CONSULTAS
+# ================================
+# Cada consulta recebe a ABT filtrada e devolve um DataFrame.
+
+def _kpis(df, items, by):
+    return pd.DataFrame([kpis_from_stats(kpi_stats(df))])
+
+
+def _intervals(df, items, by):
+    ics = kpi_intervals(kpi_stats(df))
+    return pd.DataFrame({
+        "kpi": list(ics),
+        "ic_inf": [ic[0] for ic in ics.values()],
+        "ic_sup": [ic[1] for ic in ics.values()],
+    })
+
+
+def _groups(df, items, by):
+    if not by or any(dim not in CUBE_DIMS for dim in by):
+        raise ValueError(f"by deve ser uma ou mais dimensões de {', '.join(CUBE_DIMS)}")
+    grupos = cube_kpis(build_cube(df), by=by, confidence=0.95).reset_index()
+    if "month" in by:
+        grupos["month"] = month_label(grupos["month"])
+    return grupos
+
+
+def _revenue(df, items, by):
+    if len(by) != 1 or by[0] not in REVENUE_BY:
+        raise ValueError(f"by deve ser uma de {', '.join(REVENUE_BY)}")
+    coluna = by[0]
+    if coluna in items.columns:
+        return items.groupby(coluna, observed=True)["Total_Item"].sum().reset_index()
+    item_pedido = positions(key_index(df["order_id"]), items["order_id"])
+    return sum_by_order(df[coluna], item_pedido, items["Total_Item"])
+
+
+def _recortes_elasticidade(by):
+    if any(dim not in ELASTICITY_DIMS for dim in by):
+        raise ValueError(f"by deve ser dimensões de {', '.join(ELASTICITY_DIMS)}")
+    return list(by)
+
+
+def _elasticity(df, items, by):
+    confirmados = df[df["is_confirmed"].to_numpy() == 1]
+    if not by:
+        return elasticidade(items, confirmados)
+    return elasticity(items, confirmados, by=_recortes_elasticidade(by))["faixas"]
+
+
+def _elasticity_fit(df, items, by):
+    confirmados = df[df["is_confirmed"].to_numpy() == 1]
+    return elasticity(items, confirmados, by=_recortes_elasticidade(by))["coeficientes"]
+
+
+QUERIES = {
+    "/kpis": _kpis,
+    "/intervals": _intervals,
+    "/groups": _groups,
+    "/revenue": _revenue,
+    "/elasticity": _elasticity,
+    "/elasticity_fit": _elasticity_fit,
+}
+
+
+def _lista(params, nome):
+    return tuple(v for texto in params.get(nome, []) for v in texto.split(",") if v)
+
+
+def parse_query(params):
+    # parâmetros da URL -> (periodo, filtros, by), já normalizados para a chave do cache
+    desconhecidos = set(params) - {"inicio", "fim", "by", "format", *FILTERS}
+    if desconhecidos:
+        raise ValueError(f"parâmetros desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    inicio, fim = _lista(params, "inicio"), _lista(params, "fim")
+    periodo = None
+    if inicio or fim:
+        periodo = (
+            pd.Timestamp(inicio[0]) if inicio else None,
+            pd.Timestamp(fim[0]) + pd.Timedelta(days=1) - pd.Timedelta(1) if fim else None,
+        )
+    filtros = tuple((nome, tuple(sorted(_lista(params, nome)))) for nome in FILTERS)
+    return periodo, filtros, _lista(params, "by")
+
+
+def run_query(servico, caminho, params):
+    # (versão, DataFrame); consultas iguais em andamento são compartilhadas
+    periodo, filtros, by = parse_query(params)
+    abt = current_abt(servico)
+    chave = (abt["versao"], caminho, periodo, filtros, by)
+
+    with servico["trava"]:
+        resultados = servico["resultados"]
+        if chave in resultados:
+            resultados.move_to_end(chave)
+            return abt["versao"], resultados[chave]
+        futuro = servico["em_andamento"].get(chave)
+        dono = futuro is None
+        if dono:
+            futuro = servico["em_andamento"][chave] = Future()
+
+    if not dono:
+        return abt["versao"], futuro.result()
+
+    try:
+        pos_pedidos, pos_itens = apply_filters(abt["indices"], periodo, **dict(filtros))
+        df = abt["df"] if pos_pedidos is None else abt["df"].iloc[pos_pedidos]
+        items = abt["items"] if pos_itens is None else abt["items"].iloc[pos_itens]
+        resultado = QUERIES[caminho](df, items, by)
+    except BaseException as erro:
+        with servico["trava"]:
+            del servico["em_andamento"][chave]
+        futuro.set_exception(erro)
+        raise
+
+    with servico["trava"]:
+        del servico["em_andamento"][chave]
+        if chave[0] == servico["abt"]["versao"]:
+            resultados[chave] = resultado
+            while len(resultados) > RESULT_CACHE_ENTRIES:
+                resultados.popitem(last=False)
+    futuro.set_result(resultado)
+    return abt["versao"], resultado
+
+
+# ================================
+# RESPOSTAS
+# ================================
+
+def to_json(versao, resultado):
+    linhas = json.loads(resultado.to_json(orient="records", date_format="iso"))
+    return json.dumps({"version": versao, "rows": linhas}).encode()
+
+
+def to_arrow(versao, resultado):
+    tabela = pa.Table.from_pandas(resultado, preserve_index=False)
+    tabela = tabela.replace_schema_metadata({**(tabela.schema.metadata or {}), b"version": versao.encode()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, tabela.schema) as writer:
+        writer.write_table(tabela)
+    return sink.getvalue().to_pybytes()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        servico = self.server.servico
+        try:
+            if url.path == "/version":
+                versao = current_abt(servico)["versao"]
+                return self._responder(200, "application/json", json.dumps({"version": versao}).encode())
+            if url.path not in QUERIES:
+                return self._erro(404, f"consulta desconhecida: {url.path}")
+            versao, resultado = run_query(servico, url.path, params)
+        except ValueError as erro:
+            return self._erro(400, str(erro))
+        except Exception as erro:
+            logger.exception(f"[server] erro em {self.path}")
+            return self._erro(500, str(erro))
+
+        formato = params.get("format", [""])[0]
+        if formato == "arrow" or (not formato and ARROW_MIME in self.headers.get("Accept", "")):
+            self._responder(200, ARROW_MIME, to_arrow(versao, resultado), versao)
+        else:
+            self._responder(200, "application/json", to_json(versao, resultado), versao)
+
+    def _erro(self, status, mensagem):
+        self._responder(status, "application/json", json.dumps({"error": mensagem}).encode())
+
+    def _responder(self, status, tipo, corpo, versao=None):
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        if versao is not None:
+            self.send_header("X-Data-Version", versao)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        logger.debug(f"[server] {self.address_string()} {formato % args}")
+
+
+def make_server(servico, host=HOST, port=PORT):
+    servidor = ThreadingHTTPServer((host, port), _Handler)
+    servidor.daemon_threads = True
+    servidor.servico = servico
+    return servidor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serviço local de consultas sobre a ABT")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    servico = service(args.data_dir, args.cache_dir)
+    # carrega a ABT antes de aceitar conexões
+    current_abt(servico)
+    servidor = make_server(servico, args.host, args.port)
+    print(f"Servindo em http://{args.host}:{args.port} (Ctrl+C para parar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
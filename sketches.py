@@ -0,0 +1,189 @@
+import numpy as np
+
+'''
+Sketch de quantis com erro relativo garantido (estilo DDSketch):
+- Cada valor cai num bucket logarítmico: bucket i cobre (γ^(i-1), γ^i],
+  com γ = (1 + α) / (1 − α). Qualquer quantil sai com erro relativo ≤ α
+- Atualização vetorizada por lote (np.unique nos índices dos buckets)
+- Mesclável: somar as contagens dos buckets de dois sketches dá o sketch
+  da união (ordem e particionamento dos lotes não importam)
+- Serializável em JSON (checkpoint em disco)
+- Tamanho ~ log(max/min) / log(γ) buckets, independente do número de valores
+- Boxplot (quartis, bigodes, outliers) e histograma de bins fixos saem do
+  próprio sketch, com tamanho constante (gráficos sem a coluna inteira)
+
+O sketch é um dicionário simples, como as estatísticas de metrics.kpi_stats.
+'''
+
+SKETCH_ALPHA = 0.01
+
+# pontos de outlier por boxplot (no máximo um por bucket do sketch)
+MAX_OUTLIERS = 200
+
+
+# ================================
+# CONSTRUÇÃO E ATUALIZAÇÃO
+# ================================
+
+def ddsketch(alpha=SKETCH_ALPHA):
+    return {
+        "alpha": alpha,
+        "count": 0,
+        "zero": 0,
+        "pos": {},
+        "neg": {},
+        "min": np.inf,
+        "max": -np.inf,
+    }
+
+
+def _gamma(sketch):
+    alpha = sketch["alpha"]
+    return (1 + alpha) / (1 - alpha)
+
+
+def _somar(buckets, indices):
+    chaves, contagens = np.unique(indices, return_counts=True)
+    for chave, contagem in zip(chaves.tolist(), contagens.tolist()):
+        buckets[chave] = buckets.get(chave, 0) + contagem
+
+
+def sketch_update(sketch, valores):
+    valores = np.asarray(valores, dtype="float64")
+    valores = valores[~np.isnan(valores)]
+    if not len(valores):
+        return sketch
+
+    log_gamma = np.log(_gamma(sketch))
+    positivos = valores[valores > 0]
+    negativos = -valores[valores < 0]
+    _somar(sketch["pos"], np.ceil(np.log(positivos) / log_gamma).astype("int64"))
+    _somar(sketch["neg"], np.ceil(np.log(negativos) / log_gamma).astype("int64"))
+
+    sketch["zero"] += int((valores == 0).sum())
+    sketch["count"] += len(valores)
+    sketch["min"] = min(sketch["min"], float(valores.min()))
+    sketch["max"] = max(sketch["max"], float(valores.max()))
+    return sketch
+
+
+def sketch_merge(a, b):
+    if a["alpha"] != b["alpha"]:
+        raise ValueError("sketches com precisão (alpha) diferente não podem ser mesclados")
+    saida = ddsketch(a["alpha"])
+    for lado in ("pos", "neg"):
+        saida[lado] = dict(a[lado])
+        for chave, contagem in b[lado].items():
+            saida[lado][chave] = saida[lado].get(chave, 0) + contagem
+    saida["zero"] = a["zero"] + b["zero"]
+    saida["count"] = a["count"] + b["count"]
+    saida["min"] = min(a["min"], b["min"])
+    saida["max"] = max(a["max"], b["max"])
+    return saida
+
+
+# ================================
+# CONSULTA
+# ================================
+
+def sketch_buckets(sketch):
+    # (valor representativo, contagem) de todos os buckets, em ordem crescente
+    gamma = _gamma(sketch)
+    partes_valor, partes_contagem = [], []
+
+    if sketch["neg"]:
+        idx = np.array(sorted(sketch["neg"], reverse=True))
+        partes_valor.append(-2 * gamma ** idx / (gamma + 1))
+        partes_contagem.append(np.array([sketch["neg"][i] for i in idx.tolist()]))
+    if sketch["zero"]:
+        partes_valor.append(np.zeros(1))
+        partes_contagem.append(np.array([sketch["zero"]]))
+    if sketch["pos"]:
+        idx = np.array(sorted(sketch["pos"]))
+        partes_valor.append(2 * gamma ** idx / (gamma + 1))
+        partes_contagem.append(np.array([sketch["pos"][i] for i in idx.tolist()]))
+
+    if not partes_valor:
+        return np.empty(0), np.empty(0, dtype="int64")
+    return np.concatenate(partes_valor), np.concatenate(partes_contagem).astype("int64")
+
+
+def sketch_quantiles(sketch, qs):
+    # quantis (mesma convenção "menor valor com rank >= q·(n−1)"); vazio -> NaN
+    qs = np.asarray(qs, dtype="float64")
+    if sketch["count"] == 0:
+        return np.full(qs.shape, np.nan)
+    valores, contagens = sketch_buckets(sketch)
+    acumulado = np.cumsum(contagens)
+    rank = qs * (sketch["count"] - 1)
+    pos = np.minimum(np.searchsorted(acumulado, rank, side="right"), len(valores) - 1)
+    # o valor representativo nunca sai do intervalo observado
+    return np.clip(valores[pos], sketch["min"], sketch["max"])
+
+
+def _valores_buckets(sketch):
+    valores, contagens = sketch_buckets(sketch)
+    return np.clip(valores, sketch["min"], sketch["max"]), contagens
+
+
+def sketch_box(sketch, whis=1.5, max_outliers=MAX_OUTLIERS):
+    # estatísticas do boxplot no formato de matplotlib.axes.Axes.bxp;
+    # bigodes no bucket mais extremo dentro de Q1/Q3 ∓ whis·IQR
+    if sketch["count"] == 0:
+        return None
+    q1, med, q3 = sketch_quantiles(sketch, [0.25, 0.5, 0.75]).tolist()
+    iqr = q3 - q1
+    valores, _ = _valores_buckets(sketch)
+    dentro = (valores >= q1 - whis * iqr) & (valores <= q3 + whis * iqr)
+    whislo = float(valores[dentro].min()) if dentro.any() else q1
+    whishi = float(valores[dentro].max()) if dentro.any() else q3
+
+    fliers = valores[(valores < whislo) | (valores > whishi)]
+    if len(fliers) > max_outliers:
+        # amostra espaçada, mantendo os dois extremos
+        fliers = fliers[np.linspace(0, len(fliers) - 1, max_outliers).round().astype(int)]
+    return {
+        "q1": q1, "med": med, "q3": q3,
+        "whislo": min(whislo, q1), "whishi": max(whishi, q3),
+        "fliers": fliers.tolist(),
+        "n": sketch["count"],
+    }
+
+
+def sketch_histogram(sketch, bins=50):
+    # histograma de bins fixos entre mínimo e máximo (contagens dos buckets
+    # no valor representativo de cada um)
+    if sketch["count"] == 0:
+        return np.empty(0), np.empty(0, dtype="int64")
+    inicio, fim = sketch["min"], sketch["max"]
+    if inicio == fim:
+        inicio, fim = inicio - 0.5, fim + 0.5
+    bordas = np.linspace(inicio, fim, bins + 1)
+    valores, contagens = _valores_buckets(sketch)
+    contagem, _ = np.histogram(valores, bordas, weights=contagens)
+    return bordas, contagem.astype("int64")
+
+
+# ================================
+# SERIALIZAÇÃO
+# ================================
+
+def sketch_to_dict(sketch):
+    # chaves de dicionário JSON são texto: buckets viram listas [índice, contagem]
+    return {
+        **sketch,
+        "pos": sorted(sketch["pos"].items()),
+        "neg": sorted(sketch["neg"].items()),
+        "min": None if np.isinf(sketch["min"]) else sketch["min"],
+        "max": None if np.isinf(sketch["max"]) else sketch["max"],
+    }
+
+
+def sketch_from_dict(dados):
+    return {
+        **dados,
+        "pos": {int(i): int(c) for i, c in dados["pos"]},
+        "neg": {int(i): int(c) for i, c in dados["neg"]},
+        "min": np.inf if dados["min"] is None else dados["min"],
+        "max": -np.inf if dados["max"] is None else dados["max"],
+    }
@@ -0,0 +1,216 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from abt import DATA_DIR, DATE_FORMAT, SOURCES
+
+'''
+Gerador de dados sintéticos no formato de ecommerce_data:
+- Mesmos cinco CSVs e mesmas colunas (FACT_Orders, DIM_Delivery,
+  DIM_Customer, DIM_Shopping, DIM_Products)
+- Distribuições copiadas da base original: catálogo e preços de produtos,
+  cidades/UF/região, formas de pagamento, status, serviços e fretes, desconto
+  até 15%, quantidade de 1 a 4, Total = Subtotal·(1 − Discount) + frete
+- Escala configurável (n_orders, n_products) e semente fixa
+- Escrita em blocos, para gerar 10 milhões de pedidos sem estourar a memória
+'''
+
+SEED = 42
+CHUNK_ROWS = 500_000
+
+# janela de datas dos pedidos (a mesma da base original)
+DATA_INICIO = pd.Timestamp("2025-02-16")
+DIAS_PEDIDOS = 91
+
+# previsão de entrega: dias a partir do pedido (inclui previsões anteriores
+# ao pedido, como na base original, que a ABT descarta)
+PREVISAO_DIAS = (-34, 88)
+ATRASO_MAX_DIAS = 5
+
+DESCONTO_MAX = 0.15
+QUANTIDADES = (1, 4)
+
+PAGAMENTOS = ["Credito", "Debito", "Boleto", "PIX"]
+STATUS_COMPRA = ["Processando", "Cancelado", "Confirmado", "Em Analise"]
+STATUS_ENTREGA = ["Entregue", "Trânsito", "Atrasado", "A Caminho"]
+SERVICOS = {"Same-Day": 42.9, "Scheduled": 32.99, "Standard": 22.9}
+
+META_FILE = "synthetic.json"
+
+
+# ================================
+# MODELOS (a partir da base original)
+# ================================
+
+def _catalogo(template_dir, n_products):
+    base = pd.read_csv(os.path.join(template_dir, SOURCES["prod"]))
+    n_products = n_products or len(base)
+    modelo = base.iloc[np.arange(n_products) % len(base)].reset_index(drop=True)
+
+    # acima do tamanho do catálogo: variações dos produtos originais
+    rng = np.random.default_rng([SEED, n_products])
+    variacao = np.arange(n_products) // len(base)
+    fator = np.where(variacao > 0, rng.uniform(0.8, 1.2, n_products), 1.0)
+    sufixo = np.where(variacao > 0, " #" + variacao.astype(str).astype(object), "")
+
+    largura = max(4, len(str(n_products)))
+    ids = np.arange(1, n_products + 1)
+    return pd.DataFrame({
+        "Id": ids,
+        "Product_Id": _codigos("P", ids, largura),
+        "Product_Name": modelo["Product_Name"].to_numpy(dtype=object) + sufixo,
+        "Category": modelo["Category"],
+        "Subcategory": modelo["Subcategory"],
+        "Price": np.round(modelo["Price"].to_numpy() * fator, 2),
+    })
+
+
+def _clientes_modelo(template_dir):
+    base = pd.read_csv(os.path.join(template_dir, SOURCES["cust"]))
+    nomes = base["Customer_Name"].str.split(" ", n=1, expand=True)
+    return {
+        "locais": base[["City", "State", "Region"]].drop_duplicates().reset_index(drop=True),
+        "primeiros": nomes[0].unique().astype(object),
+        "sobrenomes": nomes[1].dropna().unique().astype(object),
+    }
+
+
+def _codigos(prefixo, ids, largura):
+    return prefixo + pd.Series(ids).astype(str).str.zfill(largura).to_numpy(dtype=object)
+
+
+# ================================
+# UM BLOCO DE PEDIDOS
+# ================================
+
+def _bloco(rng, ids, produtos, clientes, largura):
+    n = len(ids)
+
+    # itens (um por pedido, como na base original)
+    produto = rng.integers(0, len(produtos), n)
+    quantidade = rng.integers(QUANTIDADES[0], QUANTIDADES[1] + 1, n)
+    preco = produtos["Price"].to_numpy()[produto]
+    shop = pd.DataFrame({
+        "Id": ids,
+        "Item_ID": _codigos("I", ids, largura),
+        "Product": produtos["Product_Name"].to_numpy()[produto],
+        "Quantity": quantidade,
+        "Price": preco,
+    })
+
+    # entrega
+    servicos = np.array(list(SERVICOS))
+    servico = rng.integers(0, len(servicos), n)
+    frete = np.array(list(SERVICOS.values()))[servico]
+    segundos = rng.integers(0, DIAS_PEDIDOS * 86400, n)
+    order_date = DATA_INICIO + pd.to_timedelta(segundos, unit="s")
+    previsao = order_date + pd.to_timedelta(
+        rng.integers(PREVISAO_DIAS[0], PREVISAO_DIAS[1] + 1, n) * 86400
+        + rng.integers(0, 86400, n), unit="s"
+    )
+    entrega = previsao + pd.to_timedelta(rng.integers(0, ATRASO_MAX_DIAS + 1, n), unit="D")
+    deli = pd.DataFrame({
+        "Id": ids,
+        "Delivery_Id": _codigos("D", ids, largura),
+        "Services": servicos[servico],
+        "P_Sevice": frete,
+        "D_Forecast": previsao,
+        "D_Date": entrega,
+        "Status": rng.choice(STATUS_ENTREGA, n),
+    })
+
+    # pedido
+    desconto = np.round(rng.uniform(0.0001, DESCONTO_MAX, n), 4)
+    subtotal = np.round(quantidade * preco, 2)
+    fact = pd.DataFrame({
+        "Id": ids,
+        "Order_Date": order_date,
+        "Discount": desconto,
+        "Subtotal": subtotal,
+        "Total": np.round(subtotal * (1 - desconto) + frete, 2),
+        "payment": rng.choice(PAGAMENTOS, n),
+        "Purchase_Status": rng.choice(STATUS_COMPRA, n),
+    })
+
+    # cliente
+    local = clientes["locais"].iloc[rng.integers(0, len(clientes["locais"]), n)]
+    nome = (
+        rng.choice(clientes["primeiros"], n) + " " + rng.choice(clientes["sobrenomes"], n)
+    )
+    cust = pd.DataFrame({
+        "Id": ids,
+        "Customer_Id": _codigos("C", ids, largura),
+        "Customer_Name": nome,
+        "City": local["City"].to_numpy(),
+        "State": local["State"].to_numpy(),
+        "Region": local["Region"].to_numpy(),
+    })
+
+    return {"fact": fact, "deli": deli, "cust": cust, "shop": shop}
+
+
+# ================================
+# GERAÇÃO
+# ================================
+
+def generate(out_dir, n_orders, seed=SEED, n_products=None, chunk_rows=CHUNK_ROWS,
+             template_dir=DATA_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    produtos = _catalogo(template_dir, n_products)
+    clientes = _clientes_modelo(template_dir)
+    largura = max(5, len(str(n_orders)))
+
+    produtos.to_csv(os.path.join(out_dir, SOURCES["prod"]), index=False)
+
+    caminhos = {nome: os.path.join(out_dir, SOURCES[nome]) for nome in ("fact", "deli", "cust", "shop")}
+    for i, inicio in enumerate(range(0, n_orders, chunk_rows)):
+        # uma semente por bloco: o resultado não depende da ordem de escrita
+        rng = np.random.default_rng([seed, i])
+        ids = np.arange(inicio + 1, min(inicio + chunk_rows, n_orders) + 1)
+        for nome, tabela in _bloco(rng, ids, produtos, clientes, largura).items():
+            tabela.to_csv(
+                caminhos[nome], index=False, header=(i == 0),
+                mode="w" if i == 0 else "a", date_format=DATE_FORMAT
+            )
+
+    meta = {
+        "n_orders": n_orders,
+        "n_products": len(produtos),
+        "seed": seed,
+        "chunk_rows": chunk_rows,
+    }
+    with open(os.path.join(out_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def ensure_dataset(out_dir, n_orders, seed=SEED, n_products=None, chunk_rows=CHUNK_ROWS,
+                   template_dir=DATA_DIR):
+    # reaproveita uma base já gerada com os mesmos parâmetros
+    caminho = os.path.join(out_dir, META_FILE)
+    if os.path.exists(caminho):
+        with open(caminho) as f:
+            meta = json.load(f)
+        esperado = {"n_orders": n_orders, "seed": seed, "chunk_rows": chunk_rows}
+        if all(meta.get(k) == v for k, v in esperado.items()) and (
+            n_products is None or meta.get("n_products") == n_products
+        ):
+            return meta
+    return generate(out_dir, n_orders, seed, n_products, chunk_rows, template_dir)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gera CSVs sintéticos no formato de ecommerce_data")
+    parser.add_argument("out_dir")
+    parser.add_argument("n_orders", type=lambda v: int(float(v)))
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--products", type=int, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    meta = generate(args.out_dir, args.n_orders, args.seed, args.products, args.chunk_rows)
+    print(f"{meta['n_orders']} pedidos e {meta['n_products']} produtos gerados em {args.out_dir}")
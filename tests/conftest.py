@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# módulos do projeto ficam na raiz do repositório
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+@pytest.fixture(autouse=True)
+def _na_raiz(monkeypatch):
+    # DATA_DIR e os demais caminhos padrão são relativos à raiz
+    monkeypatch.chdir(RAIZ)
@@ -0,0 +1,70 @@
+import csv
+import io
+import os
+import shutil
+
+import pandas as pd
+
+import abt
+import synthetic
+
+
+def _anexar(data_dir, maior_dir, nome):
+    # acrescenta ao CSV de data_dir o final que ele não tem em maior_dir
+    path = os.path.join(data_dir, abt.SOURCES[nome])
+    with open(path, "rb") as f:
+        atual = f.read()
+    with open(os.path.join(maior_dir, abt.SOURCES[nome]), "rb") as f:
+        maior = f.read()
+    assert maior.startswith(atual)
+    with open(path, "ab") as f:
+        f.write(maior[len(atual):])
+
+
+def _entrega_tardia(data_dir, order_id, d_date, status):
+    # nova linha de DIM_Delivery para um pedido já carregado (Id repetido)
+    path = os.path.join(data_dir, abt.SOURCES["deli"])
+    with open(path, encoding="utf-8", newline="") as f:
+        linhas = list(csv.reader(f))
+    cabecalho = linhas[0]
+    linha = next(l for l in linhas[1:] if l[0] == str(order_id))
+    linha[cabecalho.index("D_Date")] = d_date
+    linha[cabecalho.index("Status")] = status
+    saida = io.StringIO()
+    csv.writer(saida, lineterminator="\n").writerow(linha)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(saida.getvalue())
+
+
+def _igual(obtido, esperado):
+    # partições diferentes acumulam categorias em outra ordem
+    pd.testing.assert_frame_equal(obtido, esperado, check_categorical=False)
+
+
+def test_refresh_igual_a_reconstrucao(tmp_path):
+    # mesma semente e mesmo bloco: a base menor é prefixo da maior
+    menor, maior = str(tmp_path / "menor"), str(tmp_path / "maior")
+    synthetic.generate(menor, 2000, seed=3, chunk_rows=1000)
+    synthetic.generate(maior, 3000, seed=3, chunk_rows=1000)
+
+    data_dir, cache_dir = str(tmp_path / "dados"), str(tmp_path / "cache")
+    shutil.copytree(menor, data_dir)
+    abt.load_data(data_dir, cache_dir)
+
+    for nome in abt.APPEND_ONLY:
+        _anexar(data_dir, maior, nome)
+    _entrega_tardia(data_dir, 5, "2025-06-30 12:00:00", "Entregue")
+
+    df, items = abt.load_data(data_dir, cache_dir, incremental=True)
+    # o refresh anexou partições em vez de reconstruir
+    assert len(abt._read_manifest(cache_dir)["parts"]) > 1
+
+    df_ref, items_ref = abt.build_abt(data_dir)
+    _igual(df, df_ref)
+    _igual(items, items_ref)
+    assert df.loc[df["order_id"] == 5, "Delivery_Status"].astype(str).tolist() == ["Entregue"]
+
+    # sem mudanças o cache é lido como está
+    df2, items2 = abt.load_data(data_dir, cache_dir, incremental=True)
+    _igual(df2, df_ref)
+    _igual(items2, items_ref)
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import abt
+import synthetic
+from joins import join, key_index
+
+
+def _por_merge(left, right, left_on, right_on=None, how="left", indice=None):
+    # referência: o hash join do pandas que o join posicional substitui
+    return left.merge(right, left_on=left_on, right_on=right_on or left_on, how=how)
+
+
+def _comparar(left, right, how="left"):
+    esperado = _por_merge(left, right, "k", how=how)
+    pd.testing.assert_frame_equal(join(left, right, "k", how=how).reset_index(drop=True), esperado)
+
+
+DIREITA = pd.DataFrame({"v": [10, 20, 30, 50], "s": ["a", "b", "c", "e"]})
+
+
+@pytest.mark.parametrize("chaves, esquerda, tipo", [
+    ([1, 2, 3, 5], [3, 1, 4, 5, 1], "denso"),
+    ([5, 1, 3, 2], [3, 1, 4, 5, 1], "denso"),
+    ([1000, 2000, 3000, 5000], [3000, 1000, 4000, 5000, 1000], "ordenado"),
+    (["1", "2", "3", "5"], ["3", "1", "4", "5", "1"], "hash"),
+])
+@pytest.mark.parametrize("how", ["left", "inner"])
+def test_join_posicional_igual_ao_merge(chaves, esquerda, tipo, how):
+    right = DIREITA.assign(k=chaves)
+    assert key_index(right["k"])["tipo"] == tipo
+    _comparar(pd.DataFrame({"k": esquerda}), right, how)
+
+
+def test_chave_float_com_nulos_na_esquerda():
+    right = DIREITA.assign(k=[1, 2, 3, 5])
+    _comparar(pd.DataFrame({"k": [3.0, np.nan, 1.0, 7.0]}), right)
+
+
+def test_chave_repetida_cai_no_merge():
+    right = DIREITA.assign(k=[1, 2, 2, 5])
+    assert key_index(right["k"]) is None
+    _comparar(pd.DataFrame({"k": [2, 1, 4]}), right)
+
+
+def test_product_key_nula_casa_como_no_merge():
+    # NaN casa com NaN no merge: chave nula única (índice hash) e repetida
+    # (produto cartesiano das linhas sem chave) dão o mesmo resultado
+    esquerda = pd.DataFrame({"k": [np.nan, "a", np.nan]})
+    _comparar(esquerda, DIREITA.assign(k=[np.nan, "a", "b", "c"]))
+    _comparar(esquerda, DIREITA.assign(k=[np.nan, "a", np.nan, "c"]))
+
+
+def test_abt_igual_a_construida_com_merge(tmp_path, monkeypatch):
+    data_dir = str(tmp_path / "dados")
+    synthetic.generate(data_dir, 3000, seed=1)
+
+    df, items = abt.build_abt(data_dir)
+    monkeypatch.setattr(abt, "join", _por_merge)
+    df_ref, items_ref = abt.build_abt(data_dir)
+
+    pd.testing.assert_frame_equal(df, df_ref)
+    pd.testing.assert_frame_equal(items, items_ref)
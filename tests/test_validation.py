@@ -0,0 +1,85 @@
+import csv
+import os
+import shutil
+
+import pandas as pd
+
+from abt import DATA_DIR, SOURCES, load_data, read_sources
+from validation import validate
+
+
+def _corromper(data_dir, nome, linha, coluna, valor):
+    # troca uma célula do CSV (linha 1 = primeiro registro depois do cabeçalho)
+    path = os.path.join(data_dir, SOURCES[nome])
+    with open(path, encoding="utf-8", newline="") as f:
+        linhas = list(csv.reader(f))
+    linhas[linha][linhas[0].index(coluna)] = valor
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        csv.writer(f, lineterminator="\n").writerows(linhas)
+
+
+def _dados_corrompidos(tmp_path):
+    data_dir = tmp_path / "dados"
+    shutil.copytree(DATA_DIR, data_dir)
+    _corromper(data_dir, "shop", 2, "Quantity", "x")
+    _corromper(data_dir, "fact", 2, "Total", "abc")
+    return str(data_dir)
+
+
+def _falhas(relatorio, tabela, regra):
+    regras = relatorio["regras"]
+    linha = regras[(regras["tabela"] == SOURCES[tabela]) & (regras["regra"] == regra)]
+    return int(linha["falhas"].iloc[0])
+
+
+def test_valor_nao_numerico_vai_para_quarentena(tmp_path):
+    data_dir = _dados_corrompidos(tmp_path)
+    falhas = {}
+    tables = read_sources(data_dir, falhas=falhas)
+
+    assert pd.isna(tables["shop"]["Quantity"].iloc[1])
+    assert pd.isna(tables["fact"]["Total"].iloc[1])
+
+    out_dir = tmp_path / "validation"
+    relatorio = validate(tables, str(out_dir), log=False, falhas=falhas)
+
+    assert _falhas(relatorio, "shop", "valor_nao_numerico") == 1
+    assert _falhas(relatorio, "fact", "valor_nao_numerico") == 1
+    assert _falhas(relatorio, "cust", "valor_nao_numerico") == 0
+
+    quarentena = pd.read_csv(out_dir / "quarantine_shop.csv")
+    ruins = quarentena[quarentena["_regras"].str.contains("valor_nao_numerico")]
+    assert ruins["Id"].tolist() == [2]
+    quarentena = pd.read_csv(out_dir / "quarantine_fact.csv")
+    ruins = quarentena[quarentena["_regras"].str.contains("valor_nao_numerico")]
+    assert ruins["Id"].tolist() == [2]
+
+
+def test_inteiro_fora_da_faixa_vira_nulo(tmp_path):
+    data_dir = tmp_path / "dados"
+    shutil.copytree(DATA_DIR, data_dir)
+    # Quantity é int16: 40000 não cabe e 1.5 não é inteiro
+    _corromper(data_dir, "shop", 3, "Quantity", "40000")
+    _corromper(data_dir, "shop", 4, "Quantity", "1.5")
+    falhas = {}
+    tables = read_sources(str(data_dir), falhas=falhas)
+
+    quantidade = tables["shop"]["Quantity"]
+    assert quantidade.iloc[2:4].isna().all()
+    assert (quantidade.drop([2, 3]) > 0).all()
+
+    relatorio = validate(tables, None, log=False, falhas=falhas)
+    assert _falhas(relatorio, "shop", "valor_nao_numerico") == 2
+
+
+def test_load_data_valida_celula_corrompida(tmp_path):
+    data_dir = _dados_corrompidos(tmp_path)
+    cache_dir = tmp_path / "cache"
+
+    df, items = load_data(data_dir, str(cache_dir))
+
+    assert len(df) > 0 and len(items) > 0
+    regras = pd.read_csv(cache_dir / "validation" / "regras.csv")
+    numericas = regras[regras["regra"] == "valor_nao_numerico"].set_index("tabela")["falhas"]
+    assert numericas[SOURCES["shop"]] == 1
+    assert numericas[SOURCES["fact"]] == 1
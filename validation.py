@@ -0,0 +1,272 @@
+import argparse
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from abt import DATA_DIR, SOURCES, product_key, read_sources
+from joins import key_index, positions
+from profiling import profiled
+
+'''
+Validação dos CSVs de origem (antes das etapas 2-8 da ABT):
+- Regras vetorizadas, uma passada por tabela: chaves vazias e repetidas,
+  valores numéricos não interpretáveis (ex.: "x" em Quantity), integridade
+  referencial entre FACT, Delivery, Customer, Shopping e Products, ordem
+  das datas, valores negativos, Total coerente com Subtotal, desconto e
+  frete, e chave de produto extraível
+- Taxa de acerto de cada join da ABT
+- Linhas que violam alguma regra vão para um arquivo de quarentena por
+  tabela, com a coluna _regras listando as regras violadas
+- Severidade "erro" (dado que a ABT perde ou distorce) ou "aviso" (dado que
+  a ABT trata, ex.: atualização tardia de entrega como Id repetido)
+
+load_data() valida toda construção completa e grava o relatório em
+<cache>/validation/; `python validation.py` valida sob demanda.
+'''
+
+logger = logging.getLogger("validation")
+
+VALIDATION_DIR = os.path.join("output", "validation")
+
+ERRO = "erro"
+AVISO = "aviso"
+
+# Total = Subtotal·(1 − Discount) + frete (P_Service), arredondado em centavos
+TOTAL_TOLERANCE = 0.01
+
+
+# ================================
+# APOIO
+# ================================
+
+def _float(frame, coluna):
+    return frame[coluna].to_numpy(dtype="float64", na_value=np.nan)
+
+
+def _indice(ids, keep="last"):
+    # posição de cada Id (a última linha vale, como nas etapas 3 e 4)
+    valido = ids.notna().to_numpy() & ~ids.duplicated(keep=keep).to_numpy()
+    return key_index(ids[valido]), np.flatnonzero(valido)
+
+
+def _lookup(frame, ids, indice, coluna):
+    # valor de `coluna` na linha de `frame` de cada Id (NaN/NaT se não existe)
+    idx, linhas = indice
+    pos = positions(idx, ids)
+    achou = pos >= 0
+    if frame[coluna].dtype.kind == "M":
+        valores = frame[coluna].to_numpy(dtype="datetime64[ns]")
+        saida = np.full(len(pos), np.datetime64("NaT"), dtype=valores.dtype)
+    else:
+        valores = _float(frame, coluna)
+        saida = np.full(len(pos), np.nan)
+    saida[achou] = valores[linhas[pos[achou]]]
+    return saida, achou
+
+
+# ================================
+# REGRAS
+# ================================
+# Cada regra: nome -> (máscara das linhas que violam, severidade, descrição)
+
+def _regras_chave(ids):
+    return {
+        "id_vazio": (ids.isna().to_numpy(), ERRO, "Id vazio"),
+        "id_repetido": (ids.duplicated(keep=False).to_numpy() & ids.notna().to_numpy(), AVISO,
+                        "Id repetido (a ABT soma/usa a última linha)"),
+    }
+
+
+def _regra_numerica(tabela, falhas):
+    # linhas com algum campo numérico que read_table não conseguiu converter
+    mask = np.zeros(len(tabela), dtype=bool)
+    for ruins in falhas.values():
+        mask |= ruins
+    colunas = ", ".join(falhas) or "colunas numéricas"
+    return {"valor_nao_numerico": (mask, ERRO, f"valor não numérico em {colunas} (vira nulo)")}
+
+
+def _regras(tables, falhas=None):
+    # falhas: tabela -> {coluna: máscara} preenchido por abt.read_sources
+    falhas = falhas or {}
+    fact, deli, cust = tables["fact"], tables["deli"], tables["cust"]
+    shop, prod = tables["shop"], tables["prod"]
+
+    ind_fact = _indice(fact["Id"], keep="first")
+    ind_deli = _indice(deli["Id"])
+    ind_cust = _indice(cust["Id"])
+
+    # FACT_Orders
+    subtotal, total, desconto = _float(fact, "Subtotal"), _float(fact, "Total"), _float(fact, "Discount")
+    frete, tem_entrega = _lookup(deli, fact["Id"], ind_deli, "P_Sevice")
+    _, tem_cliente = _lookup(cust, fact["Id"], ind_cust, "Id")
+    esperado = subtotal * (1 - desconto) + frete
+    regras = {"fact": {
+        **_regras_chave(fact["Id"]),
+        **_regra_numerica(fact, falhas.get("fact", {})),
+        "data_pedido_invalida": (fact["Order_Date"].isna().to_numpy(), ERRO,
+                                 "Order_Date vazia ou fora do formato (vira NaT)"),
+        "valor_negativo": ((subtotal < 0) | (total < 0), ERRO, "Subtotal ou Total negativo"),
+        "desconto_fora_0_1": ((desconto < 0) | (desconto > 1), ERRO, "Discount fora de [0, 1]"),
+        "total_inconsistente": (tem_entrega & (np.abs(total - esperado) > TOTAL_TOLERANCE), ERRO,
+                                "Total diferente de Subtotal·(1 − Discount) + frete"),
+        "sem_entrega": (~tem_entrega, AVISO, "pedido sem linha em DIM_Delivery"),
+        "sem_cliente": (~tem_cliente, AVISO, "pedido sem linha em DIM_Customer"),
+    }}
+
+    # DIM_Delivery
+    data_pedido, tem_pedido = _lookup(fact, deli["Id"], ind_fact, "Order_Date")
+    d_date = deli["D_Date"].to_numpy(dtype="datetime64[ns]")
+    d_forecast = deli["D_Forecast"].to_numpy(dtype="datetime64[ns]")
+    regras["deli"] = {
+        **_regras_chave(deli["Id"]),
+        **_regra_numerica(deli, falhas.get("deli", {})),
+        "pedido_inexistente": (~tem_pedido, AVISO, "Id sem pedido em FACT_Orders (fica pendente)"),
+        "entrega_antes_do_pedido": (d_date < data_pedido, ERRO,
+                                    "D_Date anterior a Order_Date (pedido removido na etapa 7)"),
+        "previsao_antes_do_pedido": (d_forecast < data_pedido, AVISO, "D_Forecast anterior a Order_Date"),
+        "frete_negativo": (_float(deli, "P_Sevice") < 0, ERRO, "P_Sevice negativo"),
+    }
+
+    # DIM_Customer
+    _, tem_pedido = _lookup(fact, cust["Id"], ind_fact, "Id")
+    regras["cust"] = {
+        **_regras_chave(cust["Id"]),
+        **_regra_numerica(cust, falhas.get("cust", {})),
+        "pedido_inexistente": (~tem_pedido, AVISO, "Id sem pedido em FACT_Orders (fica pendente)"),
+        "uf_vazia": (cust["State"].isna().to_numpy(), ERRO, "State vazio"),
+    }
+
+    # DIM_Products
+    chave_prod = product_key(prod["Product_Id"])
+    regras["prod"] = {
+        **_regra_numerica(prod, falhas.get("prod", {})),
+        "id_produto_repetido": (prod["Product_Id"].duplicated(keep=False).to_numpy(), ERRO,
+                                "Product_Id repetido"),
+        "chave_produto_vazia": (chave_prod.isna().to_numpy(), ERRO,
+                                "Product_Key não extraível de Product_Id"),
+        "chave_produto_repetida": (chave_prod.duplicated(keep=False).to_numpy()
+                                   & chave_prod.notna().to_numpy(), ERRO,
+                                   "Product_Key repetida (join com itens vira 1:N)"),
+        "preco_negativo": (_float(prod, "Price") < 0, ERRO, "Price negativo"),
+    }
+
+    # DIM_Shopping
+    chave_item = product_key(shop["Item_ID"])
+    _, tem_pedido = _lookup(fact, shop["Id"], ind_fact, "Id")
+    tem_produto = chave_item.isin(chave_prod.dropna()).to_numpy()
+    regras["shop"] = {
+        **_regra_numerica(shop, falhas.get("shop", {})),
+        "pedido_inexistente": (~tem_pedido, AVISO, "item sem pedido em FACT_Orders"),
+        "chave_produto_vazia": (chave_item.isna().to_numpy(), ERRO,
+                                "Product_Key não extraível de Item_ID (item sem Category/Subcategory)"),
+        "produto_inexistente": (chave_item.notna().to_numpy() & ~tem_produto, ERRO,
+                                "Product_Key sem produto em DIM_Products"),
+        "quantidade_invalida": (~(_float(shop, "Quantity") > 0), ERRO, "Quantity vazia, zero ou negativa"),
+        "preco_negativo": (_float(shop, "Price") < 0, ERRO, "Price negativo"),
+    }
+
+    joins = [
+        ("FACT_Orders -> DIM_Delivery", tem_entrega),
+        ("FACT_Orders -> DIM_Customer", tem_cliente),
+        ("DIM_Shopping -> FACT_Orders", tem_pedido),
+        ("DIM_Shopping -> DIM_Products", tem_produto),
+    ]
+    return regras, joins
+
+
+# ================================
+# RELATÓRIO E QUARENTENA
+# ================================
+
+def _quarentena(frame, regras):
+    # regras violadas como bits; o texto sai uma vez por combinação distinta
+    nomes = list(regras)
+    bits = np.zeros(len(frame), dtype=np.int64)
+    for i, nome in enumerate(nomes):
+        bits |= regras[nome][0].astype(np.int64) << i
+    ruins = bits != 0
+    combinacoes, qual = np.unique(bits[ruins], return_inverse=True)
+    rotulos = np.array(
+        [";".join(n for i, n in enumerate(nomes) if c >> i & 1) for c in combinacoes.tolist()],
+        dtype=object,
+    )
+    return frame[ruins].assign(_regras=rotulos[qual])
+
+
+@profiled("validação dos CSVs")
+def validate_tables(tables, falhas=None):
+    # devolve (relatório, quarentena): relatório = {"regras", "joins"} em DataFrames
+    regras, joins = _regras(tables, falhas)
+    linhas = []
+    quarentena = {}
+    for nome, regras_tabela in regras.items():
+        total = len(tables[nome])
+        for regra, (mask, severidade, descricao) in regras_tabela.items():
+            n_falhas = int(mask.sum())
+            linhas.append({
+                "tabela": SOURCES[nome], "regra": regra, "severidade": severidade,
+                "linhas": total, "falhas": n_falhas, "taxa": n_falhas / total if total else 0.0,
+                "descricao": descricao,
+            })
+        quarentena[nome] = _quarentena(tables[nome], regras_tabela)
+
+    relatorio = {
+        "regras": pd.DataFrame(linhas),
+        "joins": pd.DataFrame([
+            {"join": nome, "linhas": len(achou), "encontradas": int(achou.sum()),
+             "taxa_acerto": achou.mean() if len(achou) else 1.0}
+            for nome, achou in joins
+        ]),
+    }
+    return relatorio, quarentena
+
+
+def log_report(relatorio):
+    for r in relatorio["regras"].itertuples():
+        if r.falhas:
+            nivel = logging.WARNING if r.severidade == ERRO else logging.INFO
+            logger.log(nivel, f"[validação] {r.tabela} {r.regra}: {r.falhas} de {r.linhas} "
+                              f"linhas ({r.taxa:.1%}) - {r.descricao}")
+
+
+def write_report(relatorio, quarentena, out_dir=VALIDATION_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    relatorio["regras"].to_csv(os.path.join(out_dir, "regras.csv"), index=False)
+    relatorio["joins"].to_csv(os.path.join(out_dir, "joins.csv"), index=False)
+    for nome, frame in quarentena.items():
+        path = os.path.join(out_dir, f"quarantine_{nome}.csv")
+        if len(frame):
+            frame.to_csv(path, index=False)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def validate(tables, out_dir=VALIDATION_DIR, log=True, falhas=None):
+    relatorio, quarentena = validate_tables(tables, falhas)
+    if out_dir is not None:
+        write_report(relatorio, quarentena, out_dir)
+    if log:
+        log_report(relatorio)
+    return relatorio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validação dos CSVs de origem da ABT")
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    parser.add_argument("--out", default=VALIDATION_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    falhas = {}
+    tables = read_sources(args.data_dir, falhas=falhas)
+    relatorio = validate(tables, args.out, log=False, falhas=falhas)
+
+    regras = relatorio["regras"]
+    with pd.option_context("display.width", 200, "display.max_colwidth", 80):
+        print(regras[regras["falhas"] > 0].to_string(index=False))
+        print()
+        print(relatorio["joins"].to_string(index=False))
+    print(f"\nRelatório e quarentena em {args.out}")